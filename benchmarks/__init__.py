@@ -0,0 +1,3 @@
+"""
+    Throughput benchmarks on synthetic data, run with `python -m benchmarks.run --help`
+"""
@@ -0,0 +1,121 @@
+"""
+    Deterministic synthetic data for the benchmarks: TB files, library folders and work drives.
+    The same size and seed always give the same files, and generated data is reused between runs
+"""
+
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import xmltodict
+
+from utils.library import ModelEntry
+from utils.tb import TB_COLUMNS
+from utils.process.library.tml import TmlWriter
+
+TEMPLATE = Path(__file__).parents[1] / "utils" / "process" / "library" / "data" / "empty_template.tml"
+DENSITY = 0.05  # Objects per square meter, about a dense forest
+CHUNK = 1000000  # Rows generated and written at once
+MODELS = 200  # Models used in the generated TB files
+
+
+def tb_file(path: Path, rows: int, seed: int, prefix: str = "bench_model"):
+    """TB file of `rows` objects spread over a square at `DENSITY`, models are picked with a skewed distribution"""
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(max(rows, 1) / DENSITY)
+    models = [f'"{prefix}_{i:03d}";' for i in range(MODELS)]
+    weights = 1.0 / np.arange(1, MODELS + 1)
+    weights /= weights.sum()
+    line = "%s" + "%.6f;" * len(TB_COLUMNS) + "\n"
+
+    with path.open(mode="w") as fp:
+        for start in range(0, rows, CHUNK):
+            count = min(CHUNK, rows - start)
+            model = rng.choice(MODELS, count, p=weights).tolist()
+            columns = [
+                rng.uniform(200000, 200000 + side, count),  # x
+                rng.uniform(0, side, count),  # y
+                rng.uniform(0, 360, count),  # dir
+                rng.normal(0, 2, count),  # pitch
+                rng.normal(0, 2, count),  # bank
+                rng.uniform(0.8, 1.2, count),  # scale
+                np.zeros(count),  # z
+            ]
+            columns = [column.tolist() for column in columns]
+            fp.writelines(line % (models[m], *values) for m, *values in zip(model, *columns))
+
+
+def tml_folder(folder: Path, templates: int, seed: int, libraries: int = 50):
+    """Folder of `libraries` .tml files with `templates` templates in total"""
+    rng = np.random.default_rng(seed)
+    with TEMPLATE.open(mode="r") as fp:
+        writer = TmlWriter(xmltodict.parse(fp.read()))
+
+    folder.mkdir(parents=True, exist_ok=True)
+    sizes = np.bincount(rng.integers(0, libraries, templates), minlength=libraries)
+    number = 0
+    for i, size in enumerate(sizes.tolist()):
+        entries = []
+        for _ in range(max(size, 1)):
+            name = f"bench_template_{number:07d}"
+            entries.append(ModelEntry(name, f"bench\\library_{i:03d}\\{name}.p3d", 1000 + i, 2000 + i))
+            number += 1
+        writer.write(folder / f"bench_library_{i:03d}.tml", f"bench_library_{i:03d}", entries)
+
+
+def drive(root: Path, models: int, seed: int, per_folder: int = 25):
+    """Work drive with `models` empty .p3d files in nested folders, a tenth of them in blacklisted folders"""
+    rng = np.random.default_rng(seed)
+    folders = max(models // per_folder, 1)
+    for i in range(folders):
+        if i % 10 == 9:
+            parent = root / "a3" / f"weapons_f_{i % 7}" / f"rifle_{i}"
+        else:
+            parent = root / "a3" / f"plants_f_{i % 13}" / f"group_{i % 37}" / f"folder_{i}"
+        parent.mkdir(parents=True, exist_ok=True)
+        for j in range(int(rng.integers(1, 2 * per_folder))):
+            (parent / f"model_{i}_{j}.p3d").touch()
+        (parent / "texture_co.paa").touch()
+
+
+class Dataset:
+    """All files for one benchmark run, generated into `folder` on first use"""
+
+    VERSION = 1
+
+    def __init__(self, folder: Path, rows: int, templates: int = 20000, models: int = 20000, seed: int = 0):
+        self.rows = rows
+        self.templates = templates
+        self.models = models
+        self.seed = seed
+        self.folder = folder / f"rows{rows}_templates{templates}_models{models}_seed{seed}"
+
+    @property
+    def description(self) -> dict:
+        return {"rows": self.rows, "templates": self.templates, "models": self.models, "seed": self.seed}
+
+    target = property(lambda self: self.folder / "target.txt")
+    source = property(lambda self: self.folder / "source.txt")
+    library = property(lambda self: self.folder / "library")
+    drive = property(lambda self: self.folder / "drive")
+
+    def prepare(self) -> "Dataset":
+        """Generates the files, unless a complete set for the same parameters is there already"""
+        marker = self.folder / "dataset.json"
+        expected = dict(self.description, version=self.VERSION)
+        try:
+            if json.loads(marker.read_text()) == expected:
+                return self
+        except (OSError, ValueError):
+            pass
+
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        self.folder.mkdir(parents=True)
+        tb_file(self.target, self.rows, self.seed)
+        tb_file(self.source, max(self.rows // 10, 1), self.seed + 1, prefix="bench_source")
+        tml_folder(self.library, self.templates, self.seed)
+        drive(self.drive, self.models, self.seed)
+        marker.write_text(json.dumps(expected))
+        return self
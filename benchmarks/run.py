@@ -0,0 +1,242 @@
+"""
+    Runs the benchmark stages on a synthetic dataset and writes wall time, rows per second and peak memory
+    of every stage to json. With a baseline, stages that got slower or use more memory than the tolerance
+    allows are reported and the exit code is 1, so it can gate a release
+
+    python -m benchmarks.run --rows 1M -o results.json
+    python -m benchmarks.run --rows 1M --baseline results.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import threading
+import argparse
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+FOLDER = Path(__file__).parents[1]
+if str(FOLDER) not in sys.path:
+    sys.path.insert(0, str(FOLDER))
+
+from utils import print  # noqa: E402
+from benchmarks.data import Dataset  # noqa: E402
+from benchmarks.stages import STAGES  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+VERSION = 1
+DATA = Path(tempfile.gettempdir()) / "arma_terrain_utils_benchmarks"
+SAMPLE_INTERVAL = 0.01  # Seconds between memory samples
+_SUFFIXES = {"k": 10 ** 3, "m": 10 ** 6}
+
+
+def count(text: str) -> int:
+    """Argument type for sizes like 100000, 100k or 50M"""
+    try:
+        multiplier = _SUFFIXES.get(text[-1:].lower(), 1)
+        return int(float(text[:-1] if multiplier > 1 else text) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is not a number like 100k or 50M")
+
+
+class MemorySampler:
+    """
+        Peak resident memory of this process and its children while in use, sampled in a thread.
+        Without psutil only the peak of this process over its whole lifetime is known (Not on Windows)
+    """
+
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    @staticmethod
+    def current() -> int:
+        if psutil is None:
+            try:
+                import resource
+            except ImportError:
+                return 0
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(SAMPLE_INTERVAL)
+
+    def __enter__(self) -> "MemorySampler":
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def measure(name: str, data: Dataset, jobs: int) -> Dict[str, float]:
+    """Sets up and times a single stage, runs in a fresh process when isolated"""
+    timed = STAGES[name](data, jobs)
+    with MemorySampler() as memory:
+        start = time.perf_counter()
+        rows = timed()
+        seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else float("inf"),
+        "peak_memory_mb": memory.peak / 2 ** 20,
+    }
+
+
+def run_stages(
+    data: Dataset, stages: List[str], jobs: int = 1, repeat: int = 1, isolate: bool = True
+) -> Dict[str, Dict[str, float]]:
+    """
+        Runs every stage `repeat` times and keeps the fastest time and the highest memory use.
+        Isolated stages run in their own process, so the memory of one stage doesn't count for the next
+    """
+    results = {}
+    for name in stages:
+        runs = []
+        for _ in range(repeat):
+            if isolate:
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    runs.append(pool.submit(measure, name, data, jobs).result())
+            else:
+                runs.append(measure(name, data, jobs))
+
+        result = min(runs, key=lambda run: run["seconds"])
+        result["peak_memory_mb"] = max(run["peak_memory_mb"] for run in runs)
+        results[name] = result
+        print(
+            f"<g>{name}</g>: {result['rows']} rows in {result['seconds']:.3f}s, "
+            + f"{result['rows_per_second']:,.0f} rows/s, {result['peak_memory_mb']:.0f} MB"
+        )
+    return results
+
+
+def report(data: Dataset, results: Dict[str, Dict[str, float]], jobs: int) -> dict:
+    return {
+        "version": VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "jobs": jobs,
+        },
+        "dataset": data.description,
+        "stages": results,
+    }
+
+
+def compare(
+    current: dict, baseline: dict, tolerance: float = 0.2, memory_tolerance: float = 0.25
+) -> List[str]:
+    """
+        Regressions of `current` against `baseline`: a stage is slower when its rows per second dropped by more
+        than `tolerance` (a fraction), and uses too much memory when its peak grew by more than `memory_tolerance`.
+        The baseline can override both per stage, with `{"tolerances": {"stage": {"throughput": 0.1, "memory": 0.5}}}`
+    """
+    if current["dataset"] != baseline.get("dataset"):
+        return [f"Dataset {current['dataset']} differs from the baseline dataset {baseline.get('dataset')}"]
+
+    problems = []
+    overrides = baseline.get("tolerances", {})
+    for name, result in current["stages"].items():
+        base: Optional[dict] = baseline["stages"].get(name)
+        if base is None:
+            continue
+
+        allowed = overrides.get(name, {})
+        minimum = base["rows_per_second"] * (1 - allowed.get("throughput", tolerance))
+        if result["rows_per_second"] < minimum:
+            change = result["rows_per_second"] / base["rows_per_second"] - 1
+            problems.append(
+                f"{name}: {result['rows_per_second']:,.0f} rows/s is {change:.0%} against "
+                + f"{base['rows_per_second']:,.0f} rows/s in the baseline"
+            )
+
+        maximum = base["peak_memory_mb"] * (1 + allowed.get("memory", memory_tolerance))
+        if result["peak_memory_mb"] > maximum:
+            problems.append(
+                f"{name}: peak memory {result['peak_memory_mb']:.0f} MB against "
+                + f"{base['peak_memory_mb']:.0f} MB in the baseline"
+            )
+    return problems
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", help="Objects in the TB file (100k up to 50M)", type=count, default=count("100k"))
+    parser.add_argument("--templates", help="Templates in the library folder", type=count, default=count("20k"))
+    parser.add_argument("--models", help="Models on the work drive", type=count, default=count("20k"))
+    parser.add_argument("--seed", help="Seed for the synthetic data", type=int, default=0)
+    parser.add_argument("--data", help="Folder to keep the synthetic data in", type=Path, default=DATA)
+    parser.add_argument("--stages", help="Stages to run (All by default)", nargs="+", choices=list(STAGES))
+    parser.add_argument("--repeat", help="Runs per stage, the fastest counts", type=int, default=3)
+    parser.add_argument("-j", "--jobs", help="Processes/threads for stages that use them", type=int, default=1)
+    parser.add_argument("-o", "--output", help="Json file to write the results to", type=Path)
+    parser.add_argument("--baseline", help="Json results to compare with", type=Path)
+    parser.add_argument(
+        "--tolerance", help="Allowed drop in rows per second (fraction)", type=float, default=0.2
+    )
+    parser.add_argument(
+        "--memory-tolerance", help="Allowed growth of peak memory (fraction)", type=float, default=0.25
+    )
+    parser.add_argument(
+        "--no-isolate", help="Run all stages in this process", action="store_false", dest="isolate"
+    )
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = parser().parse_args(argv)
+    data = Dataset(args.data, args.rows, args.templates, args.models, args.seed)
+    print(f"Preparing data in {data.folder}")
+    data.prepare()
+
+    results = run_stages(data, args.stages or list(STAGES), args.jobs, args.repeat, args.isolate)
+    current = report(data, results, args.jobs)
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with args.output.open(mode="w") as fp:
+            json.dump(current, fp, indent=4)
+        print(f"Wrote results to {args.output}")
+
+    if args.baseline is None:
+        return 0
+    with args.baseline.open(mode="r") as fp:
+        problems = compare(current, json.load(fp), args.tolerance, args.memory_tolerance)
+    for problem in problems:
+        print(f"<error>{problem}</error>")
+    if not problems:
+        print(f"<g>No regressions against {args.baseline}</g>")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
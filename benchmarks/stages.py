@@ -0,0 +1,97 @@
+"""
+    Benchmark stages. Each stage does its setup when called and returns the timed part,
+    which returns the number of rows (objects, templates or models) it handled
+"""
+
+from argparse import Namespace
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from benchmarks.data import Dataset
+from utils.library import TbLibraryCollection
+from utils.spatial import SpatialIndex
+from utils.tb import load_tb, load_tb_parallel, write_tb, write_tb_parallel
+from utils.process import random_offset
+from utils.process.filter_nearby import NearbyFiltering
+from utils.process.library.folders import folderWalk
+
+Stage = Callable[[Dataset, int], Callable[[], int]]
+RADIUS = 4.0
+
+
+def stage_load_tb(data: Dataset, jobs: int):
+    return lambda: len(load_tb(data.target))
+
+
+def stage_load_tb_parallel(data: Dataset, jobs: int):
+    return lambda: len(load_tb_parallel(data.target, workers=jobs))
+
+
+def stage_write_tb(data: Dataset, jobs: int):
+    frame = load_tb(data.target)
+    path = data.folder / "write_tb.txt"
+
+    def run():
+        write_tb(path, frame)
+        return len(frame)
+
+    return run
+
+
+def stage_write_tb_parallel(data: Dataset, jobs: int):
+    frame = load_tb(data.target)
+    path = data.folder / "write_tb_parallel.txt"
+
+    def run():
+        write_tb_parallel(path, frame, workers=jobs)
+        return len(frame)
+
+    return run
+
+
+def stage_random_offset(data: Dataset, jobs: int):
+    frame = load_tb(data.target)
+    args = Namespace(seed=1, dir_random=10.0, pitch_random=1.0, height_random=0.5, scale_random=0.1, x_offset=1.0)
+    return lambda: len(random_offset.action(frame, args))
+
+
+def stage_nearby_filtering(data: Dataset, jobs: int):
+    source, target = load_tb(data.source), load_tb(data.target)
+
+    def run():
+        NearbyFiltering(RADIUS, source=source, target=target, workers=jobs).filter_new()
+        return len(target)
+
+    return run
+
+
+def stage_nearby_index(data: Dataset, jobs: int):
+    """Filtering against a source with a saved spatial index, the source isn't parsed"""
+    target = load_tb(data.target)
+    SpatialIndex.for_file(data.source)
+
+    def run():
+        index = SpatialIndex.for_file(data.source)
+        NearbyFiltering(RADIUS, source=None, target=target, workers=jobs, index=index).filter_new()
+        return len(target)
+
+    return run
+
+
+def stage_library_collection(data: Dataset, jobs: int):
+    return lambda: sum(len(library) for library in TbLibraryCollection(data.library, snapshot=False, jobs=jobs))
+
+
+def stage_library_snapshot(data: Dataset, jobs: int):
+    """Loading a library folder that didn't change since the last load"""
+    TbLibraryCollection(data.library, jobs=jobs)
+    return lambda: sum(len(library) for library in TbLibraryCollection(data.library, jobs=jobs))
+
+
+def stage_folder_walk(data: Dataset, jobs: int):
+    return lambda: len(list(folderWalk(data.drive / "a3", root=data.drive, threads=jobs).walk_folders()))
+
+
+STAGES: Dict[str, Stage] = OrderedDict(
+    (name[len("stage_") :], stage) for name, stage in list(globals().items()) if name.startswith("stage_")
+)
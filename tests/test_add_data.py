@@ -0,0 +1,62 @@
+import unittest
+import shutil
+from pathlib import Path
+from argparse import Namespace
+
+from utils.library import TbLibrary
+from utils.process.library.add_data import AddData
+
+file = Path(__file__)
+folder = file.parent / "testdata"
+
+
+class TestAddData(unittest.TestCase):
+    def setUp(self):
+        self.folder = file.parent / "testresults" / "add_data"
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        (self.folder / "library").mkdir(parents=True)
+        for path in folder.glob("*.tml"):
+            shutil.copy(path, self.folder / "library")
+        bush = (folder / "a3_plants_bush.tml").read_text()
+        copy = bush.replace('name="a3_plants_bush"', 'name="a3_plants_bush_copy"')
+        (self.folder / "library" / "a3_plants_bush_copy.tml").write_text(copy)
+
+        # Source library with all templates, each with its own hash
+        source = TbLibrary.from_file(folder / "a3_plants_bush.tml")
+        for i, name in enumerate(list(source.entries)):
+            source[name]["Hash"] = str(1000 + i)
+        self.hashes = {entry.name: entry.hash for entry in source}
+        self.source = self.folder / "source.tml"
+        source.save(self.source)
+
+    def sync(self, jobs: int = 1) -> AddData:
+        args = Namespace(library=str(self.folder / "library"), source=str(self.source), jobs=jobs)
+        add_data = AddData(args)
+        add_data.action()
+        add_data.final()
+        return add_data
+
+    def test_sync(self):
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                self.setUp()
+                add_data = self.sync(jobs)
+
+                self.assertEqual(add_data.missing, {"a3_plants_plant": ["p_Reeds_F"]})
+                self.assertEqual(sorted(add_data.saved), ["a3_plants_bush", "a3_plants_bush_copy"])
+                for name in add_data.saved:
+                    synced = TbLibrary.from_file(self.folder / "library" / f"{name}.tml")
+                    self.assertEqual({entry.name: entry.hash for entry in synced}, self.hashes)
+
+    def test_synced(self):
+        self.sync()
+        files = {path: path.stat().st_mtime_ns for path in (self.folder / "library").glob("*.tml")}
+
+        add_data = self.sync()
+        self.assertEqual(add_data.saved, {})
+        self.assertEqual({path: path.stat().st_mtime_ns for path in files}, files)
+
+
+if __name__ == "__main__":
+    unittest.main()
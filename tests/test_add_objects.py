@@ -1,9 +1,87 @@
 import unittest
+import sys
+import subprocess
+from pathlib import Path
+
+import numpy as np
+from scipy import spatial
+
+from utils.process import add_objects
+from utils.process.add_objects import scatter, space_out
+from utils.spatial import SpatialIndex
+from utils.tb import TbFrame, TbRow, load_tb, write_tb, TB_COLUMNS
+
+file = Path(__file__)
+
+
+def forest(count: int = 200) -> TbFrame:
+    rng = np.random.default_rng(5)
+    points = rng.uniform(0, 300, (count, 2))
+    rows = [TbRow("t_Inocarpus_F" if i % 4 else "T_INOCARPUS_F", x, y) for i, (x, y) in enumerate(points)]
+    return TbFrame.from_rows(rows + [TbRow("house", 150.0, 150.0)])
 
 
 class TestAddObjects(unittest.TestCase):
+    def test_scatter(self):
+        frame = forest()
+        new = scatter(frame, "t_inocarpus_f", "b_Leucaena_F", 5, 3.0, seed=42)
+        self.assertEqual(len(new), 5 * 200)
+        self.assertEqual(new.models, ["b_Leucaena_F"])
+
+        parents = np.repeat(frame[["x", "y"]][:200], 5, axis=0)
+        self.assertTrue(np.all(np.hypot(*(new[["x", "y"]] - parents).T) <= 3.0))
+        self.assertTrue(np.all((new["scale"] >= 0.5) & (new["scale"] <= 2.0)))
+        self.assertTrue(np.all((new["dir"] >= 0) & (new["dir"] <= 360)))
+
+        again = scatter(frame, "t_inocarpus_f", "b_Leucaena_F", 5, 3.0, seed=42)
+        other = scatter(frame, "t_inocarpus_f", "b_Leucaena_F", 5, 3.0, seed=43)
+        self.assertTrue(np.array_equal(new[list(TB_COLUMNS)], again[list(TB_COLUMNS)]))
+        self.assertFalse(np.array_equal(new["x"], other["x"]))
+
+        self.assertEqual(len(scatter(frame, "missing", "b_Leucaena_F", 5, 3.0, seed=42)), 0)
+
+    def test_spacing(self):
+        frame = forest()
+        new = scatter(frame, "t_inocarpus_f", "b_Leucaena_F", 5, 3.0, seed=42)
+        existing = SpatialIndex.build(frame[["x", "y"]])
+        spaced = space_out(new, 1.5, existing)
+        self.assertLess(len(spaced), len(new))
+
+        xy = spaced[["x", "y"]]
+        self.assertEqual(len(spatial.cKDTree(xy).query_pairs(np.nextafter(1.5, 0))), 0)
+        distance, _ = spatial.cKDTree(frame[["x", "y"]]).query(xy)
+        self.assertTrue(np.all(distance >= 1.5))
+
+        # First come first served, a kept object stays kept when more are added after it
+        more = space_out(TbFrame.concat([new, new[:50]]), 1.5, existing)
+        self.assertTrue(np.array_equal(more["x"], spaced["x"]))
+
     def test_call(self):
-        pass
+        path = file.parent / "testresults" / "test_add_objects.txt"
+        path.parent.mkdir(exist_ok=True)
+        write_tb(path, forest())
+        try:
+            # fmt: off
+            args = [
+                sys.executable,
+                add_objects.__file__,
+                "--ignore-gooey",
+                "--input", str(path),
+                "--target", "t_Inocarpus_F",
+                "--model", "b_Leucaena_F",
+                "--amount", "3",
+                "--spacing", "1",
+                "--seed", "7",
+            ]
+            # fmt: on
+            subprocess.check_output(args)
+        except subprocess.CalledProcessError as e:
+            self.fail(e.output.decode("utf-8"))
+
+        out = load_tb(path.with_name(path.stem + "_out.txt"))
+        self.assertGreater(len(out), 0)
+        self.assertLessEqual(len(out), 3 * 200)
+        self.assertEqual(out.models, ["b_Leucaena_F"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+import json
+import unittest
+from pathlib import Path
+
+from benchmarks import run
+from benchmarks.data import tb_file
+from utils.tb import load_tb
+
+file = Path(__file__)
+results = file.parent / "testresults" / "benchmarks"
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_data(self):
+        results.mkdir(parents=True, exist_ok=True)
+        first, second = results / "first.txt", results / "second.txt"
+        tb_file(first, 1000, seed=3)
+        tb_file(second, 1000, seed=3)
+        self.assertEqual(first.read_bytes(), second.read_bytes())
+        self.assertEqual(len(load_tb(first)), 1000)
+
+        self.assertEqual(run.count("100k"), 100000)
+        self.assertEqual(run.count("50M"), 50000000)
+        self.assertEqual(run.count("1.5k"), 1500)
+
+    def test_run(self):
+        output = results / "results.json"
+        argv = ["--rows", "2k", "--templates", "200", "--models", "200", "--data", str(results), "--repeat", "1"]
+        self.assertEqual(run.main(argv + ["--no-isolate", "-o", str(output)]), 0)
+
+        with output.open() as fp:
+            current = json.load(fp)
+        self.assertEqual(list(current["stages"]), list(run.STAGES))
+        self.assertEqual(current["dataset"], {"rows": 2000, "templates": 200, "models": 200, "seed": 0})
+        self.assertEqual(current["stages"]["load_tb"]["rows"], 2000)
+        for stage in current["stages"].values():
+            self.assertGreater(stage["rows_per_second"], 0)
+            self.assertGreater(stage["peak_memory_mb"], 0)
+
+        # Each stage in its own process, against the results above with a generous tolerance
+        isolated = argv + ["--stages", "load_tb", "--baseline", str(output), "--tolerance", "0.99"]
+        self.assertEqual(run.main(isolated + ["--memory-tolerance", "10"]), 0)
+
+    def test_compare(self):
+        stage = {"rows": 100, "seconds": 1.0, "rows_per_second": 100.0, "peak_memory_mb": 100.0}
+        dataset = {"rows": 100, "templates": 10, "models": 10, "seed": 0}
+        baseline = {"dataset": dataset, "stages": {"load_tb": stage, "write_tb": stage}}
+
+        def current(**changes):
+            return {"dataset": dataset, "stages": {"load_tb": dict(stage, **changes), "new_stage": stage}}
+
+        self.assertEqual(run.compare(current(rows_per_second=85.0), baseline), [])
+        self.assertEqual(len(run.compare(current(rows_per_second=70.0), baseline)), 1)
+        self.assertEqual(len(run.compare(current(peak_memory_mb=130.0), baseline)), 1)
+        self.assertEqual(run.compare(current(peak_memory_mb=130.0), baseline, memory_tolerance=0.5), [])
+
+        baseline["tolerances"] = {"load_tb": {"throughput": 0.05}}
+        self.assertEqual(len(run.compare(current(rows_per_second=90.0), baseline)), 1)
+
+        other = dict(current(), dataset=dict(dataset, rows=200))
+        self.assertEqual(len(run.compare(other, baseline)), 1)
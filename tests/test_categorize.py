@@ -0,0 +1,72 @@
+import unittest
+import json
+from pathlib import Path
+
+from utils.process.library.categorize import PathRules, Category, RULES_FILE, get_category_custom
+from utils.process.library.folders import BLACKLIST
+
+file = Path(__file__)
+
+PATHS = [
+    "a3\\plants_f\\tree\\t_ficus_big_f.p3d",
+    "a3\\plants_f\\bush\\b_small_f.p3d",
+    "a3\\structures_f\\ind\\shed\\shed_ind_f.p3d",
+    "a3\\structures_f\\wall\\wall_indcnc_4_f.p3d",
+    "a3\\structures_f\\mil\\bunker\\bunker_f.p3d",
+    "a3\\rocks_f\\sharp\\sharprock_wallh.p3d",
+    "a3\\structures_f\\households\\house_small_01\\i_house_small_01_v1_f.p3d",
+    "a3\\structures_f\\civ\\misc\\chair_f.p3d",
+    "a3\\weapons_f\\rifle\\mx_f.p3d",
+    "ca\\buildings\\stuff\\industrial.p3d",
+    "ca\\buildings\\stuff\\ind_shed.p3d",  # "\\ind" spans the folder and file name
+    "ca\\buildings\\stuff\\house.p3d",
+    "cup\\terrains\\nothing\\model.p3d",
+]
+
+
+def reference(rules: dict, blacklist: list, path: str):
+    """Straightforward version of the rules, checking every keyword with str.find"""
+    path = path.lower()
+    if any(path.find(f) >= 0 for f in blacklist):
+        return None
+    for rule in rules["categories"]:
+        if any(path.find(f) >= 0 for f in rule["keywords"]):
+            return Category(rule["category"], rule["fill"], rule["outline"])
+    return Category(**rules["default"])
+
+
+class TestPathRules(unittest.TestCase):
+    def test_matches_reference(self):
+        with RULES_FILE.open() as fp:
+            data = json.load(fp)
+
+        rules = PathRules.from_file(blacklist=BLACKLIST)
+        for _ in range(2):  # Second pass comes from the folder cache
+            for path in PATHS:
+                self.assertEqual(rules.match(path, sep="\\"), reference(data, BLACKLIST, path), path)
+
+    def test_category_custom(self):
+        self.assertEqual(get_category_custom(Path("a3/plants_f/tree/t_ficus_big_f.p3d")).category, "tree")
+        self.assertEqual(get_category_custom(Path("a3/something/model.p3d")).category, "")
+
+    def test_custom_file(self):
+        path = file.parent / "testresults" / "rules.json"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(
+            json.dumps(
+                {
+                    "blacklist": ["ruins"],
+                    "categories": [{"category": "ifa", "fill": 1, "outline": 2, "keywords": ["ww2\\objects"]}],
+                }
+            )
+        )
+        rules = PathRules.from_file(path, blacklist=["proxy"])
+        self.assertEqual(rules.match("ww2\\objects\\tree.p3d", sep="\\"), Category("ifa", 1, 2))
+        self.assertIsNone(rules.match("ww2\\objects\\ruins\\tree.p3d", sep="\\"))
+        self.assertIsNone(rules.match("ww2\\proxy\\tree.p3d", sep="\\"))
+        self.assertEqual(rules.match("ww2\\tree.p3d", sep="\\").category, "")
+        self.assertTrue(rules.blacklisted("WW2\\Proxy"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import time
+import unittest
+import sys
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+from utils.library import TbLibraryCollection
+from utils.process import clash_detection
+from utils.process.clash_detection import ClashDetection, candidate_pairs, overlapping
+from utils.tb import TbFrame, TbRow, load_tb, write_tb
+
+file = Path(__file__)
+folder = file.parent / "testdata"
+
+
+class TestClashDetection(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.libraries = TbLibraryCollection(folder, snapshot=False)
+
+    def test_candidates(self):
+        rng = np.random.default_rng(11)
+        xy = rng.uniform(0, 100, (600, 2))
+        radius = np.concatenate([rng.uniform(0.2, 1.0, 550), rng.uniform(5, 12, 40), np.zeros(10)])
+
+        first, second = candidate_pairs(xy, radius)
+        found = {tuple(sorted(pair)) for pair in zip(first.tolist(), second.tolist())}
+        distance = np.hypot(*(xy[:, None] - xy[None]).transpose(2, 0, 1))
+        near = (distance < radius[:, None] + radius[None]) & (radius[:, None] > 0) & (radius[None] > 0)
+        expected = {(a, b) for a, b in zip(*np.nonzero(np.triu(near, 1)))}
+        self.assertEqual(len(found), len(first))
+        self.assertEqual(found, expected)
+
+    def test_overlapping(self):
+        # Long thin box turned 45 degrees clockwise, its length points to the south east
+        xy = np.array([[0.0, 0.0], [3.0, -3.0], [3.0, 3.0], [5.6, 0.0], [0.0, 1.0]])
+        yaw = np.array([45.0, 0.0, 0.0, 0.0, 90.0])
+        half = np.array([[5.0, 0.5], [0.5, 0.5], [0.5, 0.5], [0.5, 0.5], [0.5, 0.1]])
+        first, second = np.zeros(4, dtype=np.int64), np.arange(1, 5)
+        self.assertEqual(overlapping(xy, yaw, half, first, second).tolist(), [True, False, False, True])
+
+        # Touching edges don't clash
+        touching = overlapping(np.array([[0.0, 0.0], [2.0, 0.0]]), np.zeros(2), np.ones((2, 2)), [0], [1])
+        self.assertEqual(touching.tolist(), [False])
+
+    def test_detect(self):
+        # bw_SetBig_Brains_F is 4.76 by 4.71
+        first = TbFrame.from_rows(
+            [
+                TbRow("bw_SetBig_Brains_F", 0.0, 0.0),
+                TbRow("bw_SetBig_Brains_F", 3.0, 0.0, scale=0.5),  # Overlaps the first
+                TbRow("bw_SetBig_Brains_F", 100.0, 0.0, dir=45.0),
+                TbRow("unknown_model_F", 0.0, 0.0),
+            ]
+        )
+        second = TbFrame.from_rows(
+            [
+                TbRow("bw_SetBig_Brains_F", 105.5, 0.0, dir=45.0),  # Only overlaps because both are rotated
+                TbRow("p_Reeds_F", 50.0, 0.0),
+                TbRow("BW_SETBIG_BRAINS_F", 53.0, 0.0, scale=0.9),
+            ]
+        )
+        obj = ClashDetection([first, second], self.libraries)
+        obj.detect()
+        self.assertEqual(obj.missing, ["unknown_model_F"])
+        self.assertEqual(list(zip(obj.first.tolist(), obj.second.tolist())), [(0, 1), (2, 4), (5, 6)])
+
+        report = obj.report(["first.txt", "second.txt"])
+        self.assertEqual(report[1], "first.txt:3 bw_SetBig_Brains_F overlaps second.txt:1 bw_SetBig_Brains_F")
+
+        # The smaller object goes, ties go to file order
+        kept_first, kept_second = obj.resolve()
+        self.assertEqual(kept_first["x"].tolist(), [0.0, 100.0, 0.0])
+        self.assertEqual(kept_second["model"].tolist(), ["p_Reeds_F"])
+
+    def test_sorted_scale(self):
+        # Dense placements in row order overlap their neighbours in long chains
+        def resolve(side: int, shuffle: bool = False) -> float:
+            step = 3.0  # bw_SetBig_corals_F is 4.26 by 4.12, so diagonal neighbours overlap too
+            xy = np.stack(np.meshgrid(np.arange(side) * step, np.arange(side) * step), axis=-1).reshape(-1, 2)
+            if shuffle:
+                xy = xy[np.random.default_rng(0).permutation(len(xy))]
+            frame = TbFrame(["bw_SetBig_corals_F"], np.zeros(len(xy)), {"x": xy[:, 0], "y": xy[:, 1]})
+            obj = ClashDetection([frame], self.libraries)
+            obj.detect()
+            start = time.perf_counter()
+            keep = obj.keep_mask()
+            seconds = time.perf_counter() - start
+            if side <= 100:
+                kept = ClashDetection([frame[keep]], self.libraries)
+                kept.detect()
+                self.assertEqual(len(kept.first), 0)
+            return seconds
+
+        resolve(100)
+        small, large = min(resolve(200) for _ in range(3)), resolve(800)
+        self.assertLess(large / small, 40)  # 16 times the objects
+        self.assertLess(large / resolve(800, shuffle=True), 3)
+
+    def test_run(self):
+        path = file.parent / "testresults" / "test_clash_detection.txt"
+        path.parent.mkdir(exist_ok=True)
+        rng = np.random.default_rng(3)
+        rows = [TbRow("bw_SetBig_corals_F", x, y, dir=d) for x, y, d in rng.uniform(0, 200, (2000, 3))]
+        write_tb(path, TbFrame.from_rows(rows))
+        report = path.with_name("test_clash_detection_report.txt")
+        try:
+            # fmt: off
+            args = [
+                sys.executable,
+                clash_detection.__file__,
+                "--ignore-gooey",
+                str(folder),
+                str(path),
+                "--remove",
+                "-o", str(report),
+            ]
+            # fmt: on
+            subprocess.check_output(args)
+        except subprocess.CalledProcessError as e:
+            self.fail(e.output.decode("utf-8"))
+
+        out = load_tb(path.with_name(path.stem + "_OUT.txt"))
+        self.assertLess(len(out), 2000)
+        self.assertGreater(len(report.read_text().splitlines()), 2000 - len(out) - 1)
+
+        obj = ClashDetection([out], self.libraries)
+        obj.detect()
+        self.assertEqual(len(obj.first), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
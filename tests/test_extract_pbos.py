@@ -0,0 +1,128 @@
+import unittest
+import sys
+import time
+import shutil
+from argparse import Namespace
+from pathlib import Path
+
+from utils.process.extract_pbos import ExtractPBOs, PboManifest
+from test_pbo import build_pbo
+
+file = Path(__file__)
+STUB = [sys.executable, str(file.parent / "testdata" / "extractpbo_stub.py")]
+
+
+class TestExtractPBOs(unittest.TestCase):
+    def setUp(self):
+        self.folder = file.parent / "testresults" / "extract_pbos"
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        self.source = self.folder / "addons"
+        self.target = self.folder / "P"
+        self.source.mkdir(parents=True)
+        self.target.mkdir(parents=True)
+
+        for i in range(6):
+            files = {f"tree_{i}.p3d": b"model", f"data\\tree_{i}_co.paa": b"texture"}
+            build_pbo(self.source / f"plants_{i}.pbo", files, prefix=f"a3\\plants_{i}")
+        (self.source / "broken.pbo").write_text("broken")
+
+        self._command = ExtractPBOs.EXTRACTPBO
+        ExtractPBOs.EXTRACTPBO = STUB
+
+    def tearDown(self):
+        ExtractPBOs.EXTRACTPBO = self._command
+
+    def args(self, **kwargs):
+        values = dict(
+            source=self.source,
+            target=self.target,
+            models=False,
+            purge=False,
+            terrain=True,
+            whitelist=False,
+            force=False,
+            jobs=4,
+        )
+        values.update(kwargs)
+        return Namespace(**values)
+
+    def test_parallel(self):
+        extract = ExtractPBOs(self.args())
+        extract.mod_unpack()
+        extract.final()
+
+        for i in range(6):
+            self.assertTrue((self.target / "a3" / f"plants_{i}" / f"tree_{i}.p3d").is_file())
+            self.assertTrue((self.target / "a3" / f"plants_{i}" / "data" / f"tree_{i}_co.paa").is_file())
+
+        failed = [f.name for f in extract.results if f.error]
+        self.assertEqual(failed, ["broken"])
+        self.assertEqual(len(extract.results), 7)
+        self.assertEqual([f for f in self.source.iterdir() if f.is_dir()], [])  # Temporary folders are cleaned
+
+    def test_timing(self):
+        class SlowExtract(ExtractPBOs):
+            def pbo_unpack(self, file, filename):
+                time.sleep(0.2)
+                return []
+
+        extract = SlowExtract(self.args())
+        result = extract.pbo_unpack_timed(self.source / "plants_0.pbo")
+        self.assertIsNone(result.error)
+        self.assertGreaterEqual(result.seconds, 0.2)
+
+    def test_models(self):
+        extract = ExtractPBOs(self.args(models=True))
+        extract.mod_unpack()
+
+        self.assertTrue((self.target / "a3" / "plants_0" / "tree_0.p3d").is_file())
+        self.assertFalse((self.target / "a3" / "plants_0" / "data" / "tree_0_co.paa").exists())
+
+    def test_models_binarized_config(self):
+        files = {"rock.p3d": b"model", "config.bin": b"\0raP", "data\\rock_co.paa": b"texture"}
+        build_pbo(self.source / "rocks.pbo", files, prefix="a3\\rocks")
+        extract = ExtractPBOs(self.args(models=True))
+        extract.mod_unpack()
+
+        rocks = self.target / "a3" / "rocks"
+        self.assertTrue((rocks / "rock.p3d").is_file())
+        self.assertTrue((rocks / "config.cpp").is_file())  # Debinarized by extractPBO
+        self.assertFalse((rocks / "data" / "rock_co.paa").exists())
+
+    def test_incremental(self):
+        ExtractPBOs(self.args()).mod_unpack()
+
+        extract = ExtractPBOs(self.args())
+        extract.mod_unpack()
+        self.assertEqual([f.name for f in extract.results], ["broken"])  # Failed PBOs are retried
+        self.assertEqual(extract.skipped, 6)
+
+        # Update a single PBO, the file it no longer contains should be removed
+        build_pbo(self.source / "plants_2.pbo", {"tree_new.p3d": b"model"}, prefix="a3\\plants_2")
+        extract = ExtractPBOs(self.args())
+        extract.mod_unpack()
+        self.assertEqual(sorted(f.name for f in extract.results), ["broken", "plants_2"])
+        self.assertTrue((self.target / "a3" / "plants_2" / "tree_new.p3d").is_file())
+        self.assertFalse((self.target / "a3" / "plants_2" / "tree_2.p3d").exists())
+        self.assertTrue((self.target / "a3" / "plants_3" / "tree_3.p3d").is_file())
+
+        # Different settings, or forcing it, unpacks everything again
+        extract = ExtractPBOs(self.args(models=True))
+        extract.mod_unpack()
+        self.assertEqual(len(extract.results), 7)
+        self.assertFalse((self.target / "a3" / "plants_0" / "data" / "tree_0_co.paa").exists())
+
+        extract = ExtractPBOs(self.args(models=True, force=True))
+        extract.mod_unpack()
+        self.assertEqual(len(extract.results), 7)
+
+    def test_corrupt_manifest(self):
+        (self.target / PboManifest.FILENAME).write_text("{not json")
+        extract = ExtractPBOs(self.args())
+        extract.mod_unpack()
+        self.assertEqual(len(extract.results), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import sys
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+from utils.process import filter_nearby
+from utils.process.filter_nearby import NearbyFiltering
+from utils.tb import TbFrame, TbRow, load_tb, write_tb
+from utils.spatial import SpatialIndex, sidecar
+
+file = Path(__file__)
+
+
+class TestNearbyFiltering(unittest.TestCase):
+    def test_filter(self):
+        source = TbFrame.from_rows([TbRow("tree", 0.0, 0.0), TbRow("tree", 100.0, 100.0)])
+        target = TbFrame.from_rows(
+            [
+                TbRow("bush", 1.0, 1.0),
+                TbRow("bush", 3.0, 0.0),  # Exactly on the radius
+                TbRow("bush", 3.1, 0.0),
+                TbRow("bush", 50.0, 50.0),
+                TbRow("bush", 99.0, 100.0),
+            ]
+        )
+        out = NearbyFiltering(3.0, source=source, target=target).filter_new()
+        self.assertEqual(out["x"].tolist(), [3.1, 50.0])
+
+    def test_matches_ball_query(self):
+        source = load_tb(file.parent / "testdata" / "frl_saaremaa_airfield.txt")
+        target = source[::2].copy()
+        target["x"] += 3.0
+
+        obj = NearbyFiltering(5.0, source=source, target=target)
+        expected = [not obj.filter_nearby_points(point, 5.0) for point in target[["x", "y"]]]
+        self.assertEqual(obj.keep_mask(target[["x", "y"]], 5.0).tolist(), expected)
+
+    def test_index(self):
+        source = load_tb(file.parent / "testdata" / "frl_saaremaa_airfield.txt")
+        target = source[::2].copy()
+        target["x"] += 3.0
+
+        tree = NearbyFiltering(5.0, source=source, target=target).filter_new()
+        index = SpatialIndex.build(source[["x", "y"]])
+        out = NearbyFiltering(5.0, source=None, target=target, index=index).filter_new()
+        self.assertEqual(out["x"].tolist(), tree["x"].tolist())
+
+    def test_sources(self):
+        rng = np.random.default_rng(2)
+        frames = [
+            TbFrame.from_rows(TbRow("src", x, y) for x, y in rng.uniform(0, 500, (count, 2))) for count in (40, 400, 5)
+        ]
+        radii = [12.0, 3.0, 60.0]
+        target = TbFrame.from_rows(TbRow("bush", x, y) for x, y in rng.uniform(0, 500, (3000, 2)))
+
+        sources = [SpatialIndex.build(frame[["x", "y"]]) for frame in frames]
+        obj = NearbyFiltering.from_sources(sources, radii, target)
+        out = obj.filter_new()
+
+        # Same as filtering with each source after another, removals go to the first source
+        keep = np.ones(len(target), dtype=bool)
+        removed, near = [], []
+        for frame, radius in zip(frames, radii):
+            mask = NearbyFiltering(radius, source=frame, target=target).keep_mask(target[["x", "y"]], radius)
+            removed.append(np.count_nonzero(keep & ~mask))
+            near.append(np.count_nonzero(~mask))
+            keep &= mask
+        self.assertEqual(out["x"].tolist(), target["x"][keep].tolist())
+        self.assertEqual(obj.removed_counts().tolist(), removed)
+        self.assertEqual(obj.near.tolist(), near)
+
+        single = NearbyFiltering.from_sources(sources[:1], radii[:1], target)
+        self.assertEqual(len(single.filter_new()), len(target) - removed[0])
+        self.assertEqual(single.removed_counts().tolist(), removed[:1])
+
+    def test_empty(self):
+        source = TbFrame.from_rows([TbRow("tree", 0.0, 0.0)])
+        out = NearbyFiltering(3.0, source=source, target=TbFrame.empty()).filter_new()
+        self.assertEqual(len(out), 0)
+
+    def test_run(self):
+        target = file.parent / "testresults" / "test_filter_nearby.txt"
+        source = target.with_name("test_filter_nearby_source.txt")
+        target.parent.mkdir(exist_ok=True)
+        target.write_bytes((file.parent / "testdata" / "test_tb_file.txt").read_bytes())
+        source.write_bytes((file.parent / "testdata" / "frl_saaremaa_airfield.txt").read_bytes())
+        if sidecar(source).exists():
+            sidecar(source).unlink()
+        try:
+            # fmt: off
+            args = [
+                sys.executable,
+                filter_nearby.__file__,
+                "--ignore-gooey",
+                str(source),
+                str(target),
+                "-r", "10",
+            ]
+            # fmt: on
+            subprocess.check_output(args)
+        except subprocess.CalledProcessError as e:
+            self.fail(e.output.decode("utf-8"))
+        self.assertEqual(len(load_tb(target.with_name(target.stem + "_OUT.txt"))), 17)
+        self.assertTrue(sidecar(source).exists())
+
+    def test_run_sources(self):
+        target = file.parent / "testresults" / "test_filter_nearby_sources.txt"
+        target.parent.mkdir(exist_ok=True)
+        target.write_bytes((file.parent / "testdata" / "test_tb_file.txt").read_bytes())
+        sources = [target.with_name(f"test_filter_nearby_source_{i}.txt") for i in range(2)]
+        frame = load_tb(file.parent / "testdata" / "frl_saaremaa_airfield.txt")
+        write_tb(sources[0], frame[: len(frame) // 2])
+        write_tb(sources[1], frame[len(frame) // 2 :])
+
+        def run(*extra):
+            args = [sys.executable, filter_nearby.__file__, "--ignore-gooey", *map(str, sources), str(target), *extra]
+            try:
+                return subprocess.check_output(args).decode("utf-8")
+            except subprocess.CalledProcessError as e:
+                self.fail(e.output.decode("utf-8"))
+
+        output = run("-r", "10", "10")
+        self.assertIn("test_filter_nearby_source_1.txt (radius 10.0): removed", output)
+        self.assertEqual(len(load_tb(target.with_name(target.stem + "_OUT.txt"))), 17)
+        self.assertEqual(run("-r", "10", "--no-index"), output)
+        self.assertIn("Got 3 radii for 2 source files", run("-r", "1", "2", "3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
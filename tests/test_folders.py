@@ -0,0 +1,83 @@
+import unittest
+import shutil
+from pathlib import Path
+
+from utils.process.library.folders import folderWalk, BLACKLIST
+
+file = Path(__file__)
+
+
+def create_drive(root: Path):
+    """Fake work drive with a mix of allowed, blacklisted and underscore folders"""
+    models = [
+        "a3/plants_f/tree/t_ficus_big_f.p3d",
+        "a3/plants_f/tree/t_pinus_f.p3d",
+        "a3/plants_f/bush/b_small_f.p3d",
+        "a3/plants_f/bush/nested/deeper/b_deep_f.p3d",
+        "a3/plants_f/b_root_f.p3d",
+        "a3/structures_f/ind/shed_ind_f.p3d",
+        "a3/structures_f/ind/chair_f.p3d",  # Blacklisted by file name ("air")
+        "a3/weapons_f/rifle/mx_f.p3d",
+        "a3/characters_f/man/man.p3d",
+        "a3/_unused/model.p3d",
+        "a3/structures_f/_wip/model.p3d",  # Underscore too deep to count
+        "a3/structures_f/wall/wall/_deeper/wall_f.p3d",
+        "a3/rocks_f/horizont.p3d",
+        "a3/rocks_f/texture.paa",
+    ]
+    for model in models:
+        path = root / model
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("model")
+
+
+class TestFolderWalk(unittest.TestCase):
+    def setUp(self):
+        self.root = file.parent / "testresults" / "drive"
+        if self.root.exists():
+            shutil.rmtree(self.root)
+        create_drive(self.root)
+
+    def reference(self):
+        """Output of the original walk, which globbed everything before checking folders"""
+        walk = folderWalk(self.root / "a3", root=self.root)
+        walk.find_models = lambda: walk.target.glob("**/*.p3d")
+        return list(walk.walk_folders())
+
+    def test_identical(self):
+        expected = self.reference()
+        self.assertTrue(expected)
+        for threads in (1, 4):
+            walk = folderWalk(self.root / "a3", root=self.root, threads=threads)
+            self.assertEqual(list(walk.walk_folders()), expected)
+
+    def test_listings(self):
+        serial = folderWalk(self.root / "a3", root=self.root)
+        list(serial.walk_folders())
+        self.assertEqual(serial.rescanned, len(serial.listings))
+
+        threaded = folderWalk(self.root / "a3", root=self.root, threads=4)
+        list(threaded.walk_folders())
+        self.assertEqual(threaded.listings, serial.listings)
+        self.assertEqual(threaded.rescanned, serial.rescanned)
+
+        cached = folderWalk(self.root / "a3", root=self.root, threads=4, cache=dict(serial.listings))
+        list(cached.walk_folders())
+        self.assertEqual(cached.rescanned, 0)
+        self.assertEqual(cached.listings, serial.listings)
+
+    def test_pruned(self):
+        walk = folderWalk(self.root / "a3", root=self.root)
+        models = [f.name for f in walk.find_models()]
+        self.assertNotIn("mx_f.p3d", models)
+        self.assertNotIn("man.p3d", models)
+        self.assertIn("chair_f.p3d", models)  # Rejected afterwards by `check_folder`
+        self.assertIn("b_deep_f.p3d", models)
+
+    def test_blacklist_string(self):
+        walk = folderWalk(self.root / "a3", " ".join(BLACKLIST), root=self.root)
+        self.assertEqual(walk.blacklist, BLACKLIST)
+
+
+if __name__ == "__main__":
+    unittest.main()
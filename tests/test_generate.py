@@ -0,0 +1,125 @@
+import os
+import re
+import unittest
+import shutil
+from pathlib import Path
+from argparse import Namespace
+
+from utils.process.library.generate import folderToLibrary, LibraryIndex
+from utils.process.library.folders import BLACKLIST
+
+from test_folders import create_drive
+
+file = Path(__file__)
+
+
+class TestGenerate(unittest.TestCase):
+    def setUp(self):
+        self.folder = file.parent / "testresults" / "generate"
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        self.root = self.folder / "drive"
+        create_drive(self.root)
+
+    def generate(self, **kwargs) -> folderToLibrary:
+        args = Namespace(
+            path=self.root / "a3", root=self.root, blacklist=BLACKLIST, output=self.folder / "Library", jobs=1
+        )
+        vars(args).update(kwargs)
+        return folderToLibrary(args)
+
+    def libraries(self) -> dict:
+        return {f.name: f.read_bytes() for f in (self.folder / "Library").glob("*.tml")}
+
+    def add_model(self, model: str):
+        path = self.root / model
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("model")
+
+    def test_unchanged(self):
+        first = self.generate()
+        libraries = self.libraries()
+        self.assertTrue(libraries)
+        self.assertTrue(all(mtime is not None for mtime, _, _ in first.index.models.values()))
+
+        second = self.generate()
+        self.assertEqual(second.unchanged, list(first.categories))
+        self.assertEqual(self.libraries(), libraries)
+
+    def test_changed_folder(self):
+        first = self.generate()
+        libraries = self.libraries()
+
+        self.add_model("a3/structures_f/ind/factory_f.p3d")
+        second = self.generate()
+
+        # Only the folder that got a model is listed again
+        self.assertEqual(second.index.folders.keys(), first.index.folders.keys())
+        self.assertEqual(second.categories.keys(), first.categories.keys())
+        self.assertEqual(second.rescanned, 1)
+        changed = {name for name, content in self.libraries().items() if libraries[name] != content}
+        self.assertEqual(changed, {"a3_struc_ind.tml"})
+
+    def test_stable_names(self):
+        self.generate()
+        self.add_model("a3/plants_f/bush/t_pinus_f.p3d")  # Same name as the existing one in tree
+        second = self.generate()
+
+        names = {entry.file: entry.name for entries in second.categories.values() for entry in entries}
+        self.assertEqual(names[os.path.join("a3", "plants_f", "tree", "t_pinus_f.p3d")], "t_pinus_f")
+        self.assertEqual(names[os.path.join("a3", "plants_f", "bush", "t_pinus_f.p3d")], "t_pinus_f_1")
+
+        # A full rebuild resolves duplicates in walk order again
+        rebuilt = self.generate(rebuild=True)
+        self.assertEqual(len(rebuilt.unchanged), 0)
+
+    def test_removed_category(self):
+        self.generate()
+        shutil.rmtree(self.root / "a3" / "structures_f")
+        second = self.generate()
+        self.assertNotIn("a3_struc_ind.tml", self.libraries())
+        self.assertNotIn("a3_struc_ind", second.index.categories)
+
+    def test_several_paths(self):
+        self.add_model("cup/terrains/tree/t_cup_f.p3d")
+        self.add_model("cup/terrains/tree/t_pinus_f.p3d")  # Same name as the one in a3
+        first = self.generate()
+        libraries = self.libraries()
+        a3_models = dict(first.index.models)
+
+        second = self.generate(path=self.root / "cup")
+        self.assertEqual(second.unchanged, [])
+        self.assertEqual({name: self.libraries()[name] for name in libraries}, libraries)
+        self.assertIn("cup_terrains_tree.tml", self.libraries())
+
+        names = {entry.file: entry.name for entries in second.categories.values() for entry in entries}
+        self.assertEqual(names[os.path.join("cup", "terrains", "tree", "t_pinus_f.p3d")], "t_pinus_f_1")
+        self.assertEqual({f: m for f, m in second.index.models.items() if f in a3_models}, a3_models)
+        self.assertTrue(set(first.index.folders) <= set(second.index.folders))
+
+        # Running the first path again changes nothing, removing a model only affects its own path
+        third = self.generate()
+        self.assertEqual(sorted(third.unchanged), sorted(first.categories))
+        shutil.rmtree(self.root / "cup")
+        self.generate(path=self.root / "cup")
+        self.assertNotIn("cup_terrains_tree.tml", self.libraries())
+        self.assertEqual(self.libraries(), libraries)
+
+    def test_parallel(self):
+        def strip_dates(libraries: dict) -> dict:
+            return {name: re.sub(rb"<Date>.*</Date>", b"", content) for name, content in libraries.items()}
+
+        self.generate()
+        libraries = strip_dates(self.libraries())
+        self.generate(rebuild=True, jobs=2)
+        self.assertEqual(strip_dates(self.libraries()), libraries)
+
+    def test_corrupt_index(self):
+        self.generate()
+        (self.folder / "Library" / LibraryIndex.FILENAME).write_text("{")
+        second = self.generate()
+        self.assertEqual(second.unchanged, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import shutil
+from pathlib import Path
+from argparse import Namespace
+
+import xmltodict
+
+from utils.library import ModelEntry, TbLibrary, get_v4_hash, get_v4_hashes
+from utils.process.library.tml import TmlWriter
+from utils.process.library.hash_audit import HashAudit
+
+file = Path(__file__)
+TEMPLATE = file.parents[1] / "utils" / "process" / "library" / "data" / "empty_template.tml"
+
+
+class TestHashes(unittest.TestCase):
+    def test_bulk(self):
+        names = ["", "WW2_BigHBarrier", "a", "p_Reeds_F", "Überlänge_" * 20, "x" * 3]
+        self.assertEqual(get_v4_hashes(names).tolist(), [get_v4_hash(name) for name in names])
+        self.assertEqual(get_v4_hash("WW2_BigHBarrier"), -221257886)
+        self.assertEqual(len(get_v4_hashes([])), 0)
+
+
+class TestHashAudit(unittest.TestCase):
+    def setUp(self):
+        self.folder = file.parent / "testresults" / "hash_audit"
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        self.folder.mkdir(parents=True)
+
+        writer = TmlWriter(xmltodict.parse(TEMPLATE.read_text()))
+        libraries = {
+            "a3_plants": ["cupj568z", "t_tree_f", "b_bush_f"],
+            "a3_rocks": ["pv80lwqw", "t_tree_f"],  # Colliding name, and the same template in both
+        }
+        for category, names in libraries.items():
+            entries = [ModelEntry(name, f"{category}\\{name}.p3d", -1, -1) for name in names]
+            writer.write(self.folder / f"{category}.tml", category, entries)
+
+        library = TbLibrary.from_file(self.folder / "a3_plants.tml")
+        library["b_bush_f"]["Hash"] = "12345"
+        library.save()
+
+    def test_audit(self):
+        args = Namespace(library=self.folder, output=self.folder / "report.txt", jobs=1)
+        audit = HashAudit(args)
+        audit.audit()
+        audit.final()
+
+        tb_hash = get_v4_hash("cupj568z")
+        self.assertEqual(list(audit.collisions), [tb_hash])
+        self.assertEqual(sorted(audit.collisions[tb_hash]), [("a3_plants", "cupj568z"), ("a3_rocks", "pv80lwqw")])
+        mismatches = [(lib, entry.name, tb_hash) for lib, entry, tb_hash in audit.mismatches]
+        self.assertEqual(mismatches, [("a3_plants", "b_bush_f", get_v4_hash("b_bush_f"))])
+        self.assertEqual(audit.missing, [])
+        self.assertEqual(len((self.folder / "report.txt").read_text().splitlines()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,13 @@
+import os
+import re
+import json
 import unittest
+import shutil
 from pathlib import Path
+from unittest import mock
 
+import sys
+import xmltodict
 from utils.library import ModelEntry, TbLibrary, TbLibraryCollection
 from datetime import datetime
 
@@ -33,6 +40,66 @@ class TestLibrary(unittest.TestCase):
         library["p_reeds_f"]["Date"] = str(datetime.now())
         library.save(path=(folder.parent / "testresults" / "a3_plants_plants.tml"))
 
+    def test_same_as_xmltodict(self):
+        # Hand edited libraries can have whitespace around the text of each element
+        formatted = folder.parent / "testresults" / "formatted.tml"
+        formatted.parent.mkdir(exist_ok=True)
+        text = (folder / "a3_plants_bush.tml").read_text()
+        formatted.write_text(re.sub(r"<(\w+)>([^<]+)</\1>", "<\\1>\n    \\2\n  </\\1>", text))
+        self.assertEqual(TbLibrary.from_file(formatted).get_entry("bw_setbig_brains_f").name, "bw_SetBig_Brains_F")
+
+        for path in [*folder.glob("*.tml"), formatted]:
+            library = TbLibrary.from_file(path)
+            with path.open(mode="r") as fp:
+                parsed = TbLibrary(xmltodict.parse(fp.read()), path=path)
+
+            self.assertEqual(library.name, parsed.name)
+            self.assertEqual(library.shape, parsed.shape)
+            self.assertEqual(list(library), list(parsed))
+            self.assertEqual(library._dict, parsed._dict)
+
+    def test_lazy_dict(self):
+        library = TbLibrary.from_file(folder / "a3_plants_bush.tml")
+        self.assertIsNone(library._TbLibrary__dict)
+        self.assertEqual(library["bw_setbig_brains_f"]["Name"], "bw_SetBig_Brains_F")
+        self.assertIsNotNone(library._TbLibrary__dict)
+
+    def test_single_template(self):
+        path = folder.parent / "testresults" / "single.tml"
+        library = TbLibrary.from_file(folder / "a3_plants_plant.tml")
+        library.save(path)
+        single = TbLibrary.from_file(path)
+        self.assertEqual(len(single), 1)
+        self.assertEqual(single["P_REEDS_F"]["File"], "a3\\plants_f\\plant\\p_reeds_f.p3d")
+
+    def test_index(self):
+        library = TbLibrary.from_file(folder / "a3_plants_bush.tml")
+        entry = library.get_entry("BW_SETBIG_BRAINS_F")
+        self.assertIn("bw_setbig_brains_f", library)
+        self.assertIs(library.get_by_file(entry.file.upper().replace("\\", "/")), entry)
+
+        # Edits through the template dict update the entry and every index
+        template = library["bw_setbig_brains_f"]
+        template["Hash"] = "12345"
+        template["Name"] = "bw_Renamed_F"
+        template["File"] = "a3\\renamed.p3d"
+        self.assertEqual(entry.hash, 12345)
+        self.assertIs(library.get_by_hash(12345), entry)
+        self.assertIs(library.get_by_file("A3/RENAMED.P3D"), entry)
+        self.assertIs(library["BW_RENAMED_F"], template)
+        self.assertIs(library.entries["bw_Renamed_F"], entry)
+        self.assertNotIn("bw_setbig_brains_f", library)
+        self.assertIsNone(library.get_entry("bw_setbig_brains_f"))
+
+    def test_entry(self):
+        entry = ModelEntry("".join(["p_", "reeds"]), "a3\\p_reeds.p3d", -1, -1)
+        self.assertIs(entry.name, sys.intern("p_reeds"))
+        self.assertFalse(hasattr(entry, "__dict__"))
+        renamed = entry.replace(name="p_reeds_1")
+        self.assertEqual(renamed, ModelEntry("p_reeds_1", "a3\\p_reeds.p3d", -1, -1))
+        self.assertNotEqual(renamed, entry)
+        self.assertIn("name='p_reeds_1'", repr(renamed))
+
 class TestLibraryCollection(unittest.TestCase):
     def test_collection(self):
         library = TbLibraryCollection(folder)
@@ -45,6 +112,68 @@ class TestLibraryCollection(unittest.TestCase):
         entry: ModelEntry = library.get_entry("P_Reeds_F")
         self.assertEqual(entry.size, (4.7428550000000005, 3.439329, 4.717775))
 
+    def test_collection_index(self):
+        library = TbLibraryCollection(folder, snapshot=False)
+        entry = library.get_entry("P_Reeds_F")
+        self.assertIs(library.get_by_file("A3/PLANTS_F/PLANT/P_REEDS_F.P3D"), entry)
+        self.assertIs(library.get_by_hash(-221257886), entry)
+
+        plants = next(lib for lib in library if lib.name == "a3_plants_plant")
+        plants["p_reeds_f"]["Hash"] = "42"
+        self.assertIsNone(library.get_by_hash(-221257886))
+        self.assertIs(library.get_by_hash(42), entry)
+
+    def test_snapshot(self):
+        copy = folder.parent / "testresults" / "snapshot"
+        if copy.exists():
+            shutil.rmtree(copy)
+        copy.mkdir(parents=True)
+        for path in folder.glob("*.tml"):
+            shutil.copy(path, copy)
+
+        cache = folder.parent / "testresults" / "cache"
+        patch = mock.patch("utils.library.cache_folder", return_value=cache)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        cold = TbLibraryCollection(copy)
+        self.assertEqual(len(cold.parsed), 2)
+        snapshot = TbLibraryCollection.snapshot_path(copy)
+        self.assertEqual(snapshot.parent.parent, cache)
+        self.assertTrue(snapshot.exists())
+        self.assertEqual(sorted(f.name for f in copy.iterdir()), ["a3_plants_bush.tml", "a3_plants_plant.tml"])
+
+        warm = TbLibraryCollection(copy)
+        self.assertEqual(warm.parsed, [])
+        self.assertEqual(warm._entries, cold._entries)
+        self.assertEqual(warm._lib, cold._lib)
+        plants = next(library for library in warm if library.name == "a3_plants_plant")
+        self.assertIs(warm.get_entry("P_Reeds_F"), plants.entries["p_Reeds_F"])
+        self.assertEqual(plants["p_reeds_f"]["Name"], "p_Reeds_F")  # Template data read when needed
+
+        # Changing a file parses just that one again
+        path = copy / "a3_plants_plant.tml"
+        path.write_text(path.read_text().replace("p_Reeds_F", "p_Reeds_New_F"))
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        changed = TbLibraryCollection(copy)
+        self.assertEqual(changed.parsed, [path])
+        self.assertIsNone(changed.get_entry("P_Reeds_F"))
+        self.assertEqual(changed.get_category("p_reeds_new_f"), "a3_plants_plant")
+        self.assertEqual(changed.get_category("bw_SetBig_Brains_F"), "a3_plants_bush")
+
+        # Unreadable snapshot parses everything
+        snapshot.write_bytes(b"corrupt")
+        self.assertEqual(len(TbLibraryCollection(copy).parsed), 2)
+        stat = TbLibraryCollection.stat_files(copy)["a3_plants_bush.tml"]
+        malformed = {"stat": list(stat), "attributes": {}, "entries": [["too short"]]}
+        snapshot.write_text(
+            json.dumps({"version": TbLibraryCollection.VERSION, "libraries": {"a3_plants_bush.tml": malformed}})
+        )
+        self.assertEqual(len(TbLibraryCollection(copy).parsed), 2)
+        (path).unlink()
+        self.assertIsNone(TbLibraryCollection(copy).get_entry("p_reeds_new_f"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import shutil
+import unittest
+from pathlib import Path
+
+from utils.process.library import p3d
+from utils.process.library.p3d import P3dCache, P3dInfo, read_models
+
+file = Path(__file__)
+STUB = [sys.executable, str(file.parent / "testdata" / "dep3d_stub.py")]
+
+
+class TestP3d(unittest.TestCase):
+    def setUp(self):
+        self.folder = file.parent / "testresults" / "p3d"
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        self.folder.mkdir(parents=True)
+
+        self.log = self.folder / "dep3d.log"
+        os.environ["DEP3D_STUB_LOG"] = str(self.log)
+
+        self.models = []
+        for i, placement in enumerate(["slopelandcontact", "", "slopelandcontact"]):
+            path = self.folder / f"model_{i}.p3d"
+            model = {"properties": {"placement": placement, "class": "house"}, "min": [-i, 0, -1], "max": [i, 2.5, 1]}
+            path.write_text(json.dumps(model))
+            self.models.append(path)
+
+    def tearDown(self):
+        del os.environ["DEP3D_STUB_LOG"]
+
+    def calls(self) -> int:
+        return len(self.log.read_text().splitlines()) if self.log.exists() else 0
+
+    def test_single(self):
+        self.assertTrue(p3d.slopelandcontact(self.models[0], command=STUB))
+        self.assertFalse(p3d.slopelandcontact(self.models[1], command=STUB))
+        self.assertEqual(p3d.boundingbox(self.models[2], command=STUB), ((-2.0, 0.0, -1.0), (2.0, 2.5, 1.0)))
+
+    def test_batch(self):
+        broken = self.folder / "broken.p3d"
+        broken.write_text("not a model")
+        results = read_models(self.models + [broken], jobs=4, command=STUB)
+
+        self.assertIsNone(results[broken])
+        self.assertEqual(results[self.models[1]], P3dInfo(False, (-1.0, 0.0, -1.0), (1.0, 2.5, 1.0)))
+        self.assertEqual(results[self.models[2]].size, (4.0, 2.5, 2.0))
+        self.assertEqual([results[path].landslope for path in self.models], [True, False, True])
+
+    def test_cache(self):
+        cache = P3dCache.load(self.folder / "cache.json")
+        first = read_models(self.models, jobs=2, cache=cache, command=STUB)
+        cache.save()
+        self.assertEqual(self.calls(), 6)
+
+        # Unchanged models and copies of them aren't read again
+        shutil.copy(self.models[0], self.folder / "copy.p3d")
+        cache = P3dCache.load(self.folder / "cache.json")
+        second = read_models(self.models + [self.folder / "copy.p3d"], cache=cache, command=STUB)
+        self.assertEqual(self.calls(), 6)
+        self.assertEqual(second[self.folder / "copy.p3d"], first[self.models[0]])
+
+        # Changed content is read again
+        self.models[1].write_text(self.models[1].read_text().replace("2.5", "3.5"))
+        third = read_models(self.models, cache=cache, command=STUB)
+        self.assertEqual(self.calls(), 8)
+        self.assertEqual(third[self.models[1]].bbox_max, (1.0, 3.5, 1.0))
+
+    def test_corrupt_cache(self):
+        (self.folder / "cache.json").write_text("{")
+        cache = P3dCache.load(self.folder / "cache.json")
+        self.assertEqual(cache.models, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import struct
+import shutil
+import unittest
+from pathlib import Path
+
+from utils.process.library import p3d
+from utils.process.library.p3d import P3dInfo, read_models
+from utils.process.library.p3d_reader import P3dReader, P3dError, GEOMETRY
+
+file = Path(__file__)
+
+
+def build_lod(resolution: float, points: list, properties: dict = None, faces: int = 0) -> bytes:
+    """Single MLOD LOD (P3DM) with triangles over the first 3 points, and a #Property# tag per property"""
+    data = struct.pack("<4s6I", b"P3DM", 0x1C, 0x100, len(points), 1, faces, 0)
+    data += b"".join(struct.pack("<3fI", *point, 0) for point in points)
+    data += struct.pack("<3f", 0, 1, 0)
+    for _ in range(faces):
+        data += struct.pack("<I", 3) + b"".join(struct.pack("<IIff", i % 3, 0, 0, 0) for i in range(4))
+        data += struct.pack("<I", 0) + b"data\\texture_co.paa\0" + b"data\\default.rvmat\0"
+
+    data += b"TAGG"
+    data += b"\1#Mass#\0" + struct.pack("<I", 4) + struct.pack("<f", 100)
+    for key, value in (properties or {}).items():
+        data += b"\1#Property#\0" + struct.pack("<I", 128)
+        data += key.encode().ljust(64, b"\0") + value.encode().ljust(64, b"\0")
+    data += b"\1#EndOfFile#\0" + struct.pack("<I", 0)
+    return data + struct.pack("<f", resolution)
+
+
+def build_mlod(lods: list) -> bytes:
+    return b"MLOD" + struct.pack("<II", 257, len(lods)) + b"".join(lods)
+
+
+def build_odol(bbox_min: tuple, bbox_max: tuple, version: int = 73, placement: str = None) -> bytes:
+    """Start of a binarized model: header, LOD resolutions and the model info up to the bounding box"""
+    data = b"ODOL" + struct.pack("<I", version)
+    if version >= 59:
+        data += struct.pack("<I", 0)
+    if version >= 58:
+        data += b"a3\\structures_f\0"
+    data += struct.pack("<I", 2) + struct.pack("<2f", 1, GEOMETRY)
+    data += struct.pack("<I2f3I3f2If", 0, 10, 10, 0, 0, 0, 0, 0, 0, 0, 0, 1)
+    data += struct.pack("<6f", *bbox_min, *bbox_max)
+    data += b"\0" * 64  # Rest of the model info and the LODs
+    if placement:
+        data += b"class\0house\0placement\0" + placement.encode() + b"\0"
+    return data + b"\0" * 16
+
+
+class TestP3dReader(unittest.TestCase):
+    def setUp(self):
+        self.folder = file.parent / "testresults" / "p3d_reader"
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        self.folder.mkdir(parents=True)
+
+    def write(self, name: str, data: bytes) -> Path:
+        path = self.folder / name
+        path.write_bytes(data)
+        return path
+
+    def test_mlod(self):
+        visual = build_lod(1.0, [(-5, 0, -5), (5, 10, 5), (0, 1, 0)], faces=2)
+        geometry = build_lod(GEOMETRY, [(-2, 0, -1), (2, 3, 1), (0, 1, 0)], {"placement": "SlopeLandContact"}, 1)
+        path = self.write("house.p3d", build_mlod([visual, geometry]))
+
+        with P3dReader(path) as model:
+            self.assertEqual(model.signature, b"MLOD")
+            self.assertTrue(model.landslope)
+            self.assertEqual(model.bbox_min, (-2.0, 0.0, -1.0))
+            self.assertEqual(model.bbox_max, (2.0, 3.0, 1.0))
+
+        # Without geometry LOD, the first one is used
+        path = self.write("tree.p3d", build_mlod([visual]))
+        self.assertFalse(p3d.slopelandcontact(path))
+        self.assertEqual(p3d.boundingbox(path), ((-5.0, 0.0, -5.0), (5.0, 10.0, 5.0)))
+
+    def test_odol(self):
+        for version in (54, 58, 73):
+            path = self.write("odol.p3d", build_odol((-1, -2, -3), (1, 2, 3), version, "slopelandcontact"))
+            self.assertEqual(p3d.read_model(path), P3dInfo(True, (-1.0, -2.0, -3.0), (1.0, 2.0, 3.0)))
+
+        path = self.write("odol.p3d", build_odol((-1, -2, -3), (1, 2, 3), placement="vertical"))
+        self.assertFalse(p3d.slopelandcontact(path))
+
+    def test_invalid(self):
+        visual = build_lod(1.0, [(-5, 0, -5), (5, 10, 5), (0, 1, 0)], faces=2)
+        for name, data in [
+            ("empty.p3d", b""),
+            ("text.p3d", b"not a model"),
+            ("truncated.p3d", build_mlod([visual])[:-40]),
+            ("old.p3d", build_odol((0, 0, 0), (1, 1, 1), version=7)),
+        ]:
+            with self.subTest(name), self.assertRaises(P3dError):
+                P3dReader(self.write(name, data))
+
+    def test_batch(self):
+        paths = []
+        for i in range(6):
+            lod = build_lod(GEOMETRY, [(-i, 0, 0), (i, 1, 1)], {"placement": "slopelandcontact"} if i % 2 else {})
+            paths.append(self.write(f"model_{i}.p3d", build_mlod([lod])))
+        paths.append(self.write("broken.p3d", b"MLOD"))
+
+        results = read_models(paths, jobs=2)
+        self.assertIsNone(results[paths[-1]])
+        self.assertEqual([results[path].landslope for path in paths[:-1]], [False, True] * 3)
+        self.assertEqual(results[paths[3]].size, (6.0, 1.0, 1.0))
+        self.assertEqual(read_models(paths, jobs=1), results)
+
+
+if __name__ == "__main__":
+    unittest.main()
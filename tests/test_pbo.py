@@ -0,0 +1,119 @@
+import unittest
+import struct
+import hashlib
+import shutil
+from pathlib import Path
+from typing import Dict
+
+from utils.process.pbo import PboReader, PboError, lzss_decompress, COMPRESSED, VERSION
+
+file = Path(__file__)
+
+
+def build_pbo(path: Path, files: Dict[str, bytes], prefix: str = None, compressed: Dict[str, bytes] = None):
+    """Writes a PBO, `compressed` maps names to (uncompressed content, LZSS data)"""
+    header = b"\0" + struct.pack("<5I", VERSION, 0, 0, 0, 0)
+    if prefix is not None:
+        header += b"prefix\0" + prefix.encode() + b"\0"
+    header += b"\0"
+
+    data = b""
+    for name, content in files.items():
+        header += name.encode() + b"\0" + struct.pack("<5I", 0, len(content), 0, 0, len(content))
+        data += content
+    for name, (content, packed) in (compressed or {}).items():
+        header += name.encode() + b"\0" + struct.pack("<5I", COMPRESSED, len(content), 0, 0, len(packed))
+        data += packed
+    header += b"\0" + struct.pack("<5I", 0, 0, 0, 0, 0)
+
+    body = header + data
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(body + b"\0" + hashlib.sha1(body).digest())
+
+
+def lzss_literal(content: bytes) -> bytes:
+    """Compresses without back references, every block is a literal"""
+    out = b""
+    for i in range(0, len(content), 8):
+        out += b"\xff" + content[i : i + 8]
+    return out + struct.pack("<I", sum(content))
+
+
+class TestPbo(unittest.TestCase):
+    def setUp(self):
+        self.folder = file.parent / "testresults" / "pbo"
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+
+    def test_read(self):
+        path = self.folder / "plants_f.pbo"
+        files = {
+            "bush\\b_small.p3d": b"MLOD" * 10,
+            "bush\\data\\b_small_co.paa": b"texture",
+            "config.cpp": b"class X {};",
+        }
+        build_pbo(path, files, prefix="a3\\plants_f")
+
+        with PboReader(path) as pbo:
+            self.assertEqual(pbo.prefix, "a3\\plants_f")
+            self.assertEqual([f.name for f in pbo], list(files))
+            for entry in pbo:
+                self.assertEqual(pbo.read(entry), files[entry.name])
+
+    def test_extract(self):
+        path = self.folder / "plants_f.pbo"
+        build_pbo(path, {"bush\\b_small.p3d": b"model", "bush\\data\\b_small_co.paa": b"texture", "..\\evil.p3d": b"x"})
+
+        target = self.folder / "P"
+        with PboReader(path) as pbo:
+            written = pbo.extract(target, include=lambda entry: entry.suffix == ".p3d")
+
+        model = target / "plants_f" / "bush" / "b_small.p3d"  # No prefix, uses the file name
+        self.assertEqual(written, [model])
+        self.assertEqual(model.read_bytes(), b"model")
+        self.assertFalse((target / "plants_f" / "bush" / "data").exists())
+        self.assertFalse((self.folder / "evil.p3d").exists())
+
+    def test_extract_prefix(self):
+        target = self.folder / "P"
+        path = self.folder / "prefix.pbo"
+        for prefix in ("C:\\x", "C:x", "..\\..\\evil", "a3\\..\\..\\evil"):
+            with self.subTest(prefix=prefix):
+                build_pbo(path, {"b_small.p3d": b"model"}, prefix=prefix)
+                with PboReader(path) as pbo:
+                    self.assertIsNone(pbo.target_path(pbo.entries[0], target))
+                    self.assertEqual(pbo.extract(target), [])
+
+        # Leading backslashes are stripped from the prefix, a UNC path ends up within the target
+        build_pbo(path, {"b_small.p3d": b"model"}, prefix="\\\\server\\share")
+        with PboReader(path) as pbo:
+            self.assertEqual(pbo.extract(target), [target / "server" / "share" / "b_small.p3d"])
+        self.assertEqual(list(self.folder.rglob("*.p3d")), [target / "server" / "share" / "b_small.p3d"])
+
+    def test_compressed(self):
+        content = b"class CfgPatches { class Test {}; };"
+        path = self.folder / "config.pbo"
+        build_pbo(path, {}, prefix="test", compressed={"config.cpp": (content, lzss_literal(content))})
+
+        with PboReader(path) as pbo:
+            self.assertTrue(pbo.entries[0].compressed)
+            self.assertEqual(pbo.read(pbo.entries[0]), content)
+
+    def test_lzss_reference(self):
+        # "abc", then a reference 3 back with length 6 repeats it twice
+        packed = bytes([0b0000_0111]) + b"abc" + bytes([3, 0x03]) + struct.pack("<I", sum(b"abcabcabc"))
+        self.assertEqual(lzss_decompress(packed, 9), b"abcabcabc")
+
+        with self.assertRaises(PboError):
+            lzss_decompress(packed[:-4] + b"\0\0\0\0", 9)
+
+    def test_invalid(self):
+        path = self.folder / "broken.pbo"
+        path.parent.mkdir(parents=True)
+        path.write_bytes(b"\0" * 10)
+        with self.assertRaises(PboError):
+            PboReader(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,13 @@
 import unittest
 import sys
 import subprocess
+from argparse import Namespace
 from pathlib import Path
 
+import numpy as np
+
 from utils.process import random_offset
+from utils.tb import load_tb, TbFrame, TB_COLUMNS
 
 file = Path(__file__)
 
@@ -31,6 +35,38 @@ class TestRandomOffset(unittest.TestCase):
             print(e.output)
             self.fail(e.output.decode("utf-8"))
 
+    def args(self, seed):
+        return Namespace(
+            seed=seed,
+            dir_random=10.0,
+            pitch_random=1.0,
+            height_random=1.0,
+            scale_random=0.2,
+            x_offset=1000.0,
+            z_offset=2.0,
+        )
+
+    def test_seeded(self):
+        source = load_tb(file.parent / "testdata" / "test_tb_file.txt")
+        first = random_offset.action(source.copy(), self.args(1234))
+        second = random_offset.action(source.copy(), self.args(1234))
+        other = random_offset.action(source.copy(), self.args(4321))
+
+        self.assertTrue(np.array_equal(first[list(TB_COLUMNS)], second[list(TB_COLUMNS)]))
+        self.assertFalse(np.array_equal(first["dir"], other["dir"]))
+        self.assertTrue(np.array_equal(first["x"], source["x"] + 1000.0))
+        self.assertTrue(np.all(np.abs(first["scale"] - source["scale"]) <= 0.2))
+
+    def test_chunks(self):
+        source = load_tb(file.parent / "testdata" / "test_tb_file.txt")
+        whole = random_offset.action(source.copy(), self.args(99))
+        chunks = [
+            random_offset.action(source[i : i + 5].copy(), self.args(99), start=i) for i in range(0, len(source), 5)
+        ]
+        chunked = TbFrame.concat(chunks)
+
+        self.assertTrue(np.array_equal(whole[list(TB_COLUMNS)], chunked[list(TB_COLUMNS)]))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,94 @@
+import os
+import unittest
+from pathlib import Path
+
+import numpy as np
+from scipy import spatial
+
+from utils.tb import TbFrame, TbRow, write_tb, load_tb
+from utils.spatial import SpatialIndex, sidecar, greedy_thinning
+
+file = Path(__file__)
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        self.folder = file.parent / "testresults" / "spatial"
+        self.folder.mkdir(parents=True, exist_ok=True)
+        rng = np.random.default_rng(7)
+        self.xy = np.concatenate([rng.uniform(200000, 201000, (3000, 2)), rng.normal(200500, 5, (500, 2))])
+
+    def test_radius(self):
+        index = SpatialIndex.build(self.xy)
+        tree = spatial.cKDTree(self.xy)
+        points = np.concatenate([self.xy[::50] + 1.5, [[0.0, 0.0], [200500.0, 199000.0]]])
+        for radius in (0.5, 4.0, 60.0):
+            with self.subTest(radius=radius):
+                query, rows = index.pairs_within(points, radius)
+                expected = tree.query_ball_point(points, radius)
+                for i, near in enumerate(expected):
+                    self.assertEqual(sorted(rows[query == i].tolist()), sorted(near))
+                self.assertEqual(index.any_within(points, radius).tolist(), [bool(f) for f in expected])
+                self.assertEqual(index.query_radius(points[3], radius).tolist(), sorted(expected[3]))
+
+    def test_bbox(self):
+        index = SpatialIndex.build(self.xy)
+        for low, high in [((200100, 200200), (200300, 200250)), ((0, 0), (1, 1)), ((199000, 199000), (210000, 210000))]:
+            inside = np.all((self.xy >= low) & (self.xy <= high), axis=1)
+            self.assertEqual(index.query_bbox(low, high).tolist(), np.flatnonzero(inside).tolist())
+
+        point = self.xy[10]
+        self.assertIn(10, index.query_bbox(point, point).tolist())
+
+    def test_empty(self):
+        index = SpatialIndex.build(np.empty((0, 2)))
+        self.assertEqual(index.any_within([[1.0, 2.0]], 5.0).tolist(), [False])
+        self.assertEqual(len(index.query_bbox((0, 0), (10, 10))), 0)
+
+        single = SpatialIndex.build([[5.0, 5.0]])
+        self.assertEqual(single.query_radius((6.0, 5.0), 1.0).tolist(), [0])
+
+    def test_sidecar(self):
+        path = self.folder / "forest.txt"
+        write_tb(path, TbFrame.from_rows(TbRow("tree", x, y) for x, y in self.xy))
+        if sidecar(path).exists():
+            sidecar(path).unlink()
+        self.assertIsNone(SpatialIndex.load(path))
+
+        built = SpatialIndex.for_file(path)
+        self.assertTrue(sidecar(path).exists())
+        loaded = SpatialIndex.load(path)
+        self.assertIsInstance(loaded.xy, np.memmap)
+        points = load_tb(path)[["x", "y"]][::40] + 2.0
+        self.assertEqual(loaded.pairs_within(points, 10.0)[1].tolist(), built.pairs_within(points, 10.0)[1].tolist())
+        del loaded
+
+        # Touched files keep their index, changed files don't
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNotNone(SpatialIndex.load(path))
+        self.assertIsNotNone(SpatialIndex.load(path))
+
+        write_tb(path, TbFrame.from_rows([TbRow("tree", 1.0, 2.0)]))
+        self.assertIsNone(SpatialIndex.load(path))
+        self.assertEqual(len(SpatialIndex.for_file(path)), 1)
+        self.assertEqual(SpatialIndex.load(path).query_radius((1.0, 2.0), 0.1).tolist(), [0])
+
+        sidecar(path).write_bytes(b"TBSX")
+        self.assertIsNone(SpatialIndex.load(path))
+
+    def test_greedy_thinning(self):
+        xy = self.xy[:600]
+        for spacing in (2.0, 25.0):
+            kept = []
+            for i, point in enumerate(xy):
+                if all(np.sum((xy[k] - point) ** 2) >= spacing ** 2 for k in kept):
+                    kept.append(i)
+            self.assertEqual(np.flatnonzero(greedy_thinning(xy, spacing)).tolist(), kept)
+
+        self.assertEqual(greedy_thinning([[0.0, 0.0], [1.0, 0.0]], 1.0).tolist(), [True, True])
+        self.assertEqual(greedy_thinning(np.empty((0, 2)), 1.0).tolist(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,14 @@
+import os
 import unittest
 from pathlib import Path
 from typing import List
 
-from utils.tb import tb_iterator, TbRow
+import numpy as np
+
+from utils.tb import tb_iterator, TbRow, TbFrame, load_tb, load_tb_parallel, write_tb, write_tb_parallel, TB_COLUMNS
 
 folder: Path = Path(__file__).parent / "testdata"
+results: Path = Path(__file__).parent / "testresults"
 
 class TestTB(unittest.TestCase):
     def test_iterator(self):
@@ -20,5 +24,148 @@ class TestTB(unittest.TestCase):
     #     with self.assertRaises(FileNotFoundError):
     #         tb_iterator(folder / "test_INVALID.txt")
 
+
+class TestTbFrame(unittest.TestCase):
+    def test_load(self):
+        frame = load_tb(folder / "test_tb_file.txt")
+        entries: List[TbRow] = list(tb_iterator(folder / "test_tb_file.txt"))
+
+        self.assertEqual(len(frame), len(entries))
+        self.assertEqual(list(frame["model"]), [f.model for f in entries])
+        for name in TB_COLUMNS:
+            self.assertEqual(frame[name].tolist(), [getattr(f, name) for f in entries])
+
+    def test_load_without_end(self):
+        frame = load_tb(folder / "frl_saaremaa_airfield.txt")
+        self.assertEqual(len(frame), 90)
+        self.assertEqual(frame["model"][0], "airport_02_hangar_right_f")
+        self.assertEqual(frame["z"][0], 144.224)
+
+    def test_load_invalid(self):
+        with self.assertRaises(FileNotFoundError):
+            load_tb(folder / "test_INVALID.txt")
+
+    def test_load_blank_lines(self):
+        path = results / "test_tb_blank.txt"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'"a";1;2;3;4;5;6;7;\r\n\r\n"b";1.5;2;3;4;5;6;7\n"a";0;0;0;0;0;1;0;')
+        frame = load_tb(path)
+        self.assertEqual(list(frame["model"]), ["a", "b", "a"])
+        self.assertEqual(frame.models, ["a", "b"])
+        self.assertEqual(frame["x"].tolist(), [1.0, 1.5, 0.0])
+
+    def test_load_irregular(self):
+        # Saved with a BOM, an empty and missing fields are nan like they were with pandas
+        path = results / "test_tb_irregular.txt"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'\xef\xbb\xbf"a";1;;3;4;5;6;7;\n"b";1.5;2;3\n"a";0;0;0;0;0;1;0;')
+        for frame in (load_tb(path), load_tb_parallel(path, workers=2, min_size=1)):
+            self.assertEqual(frame.models, ["a", "b"])
+            self.assertTrue(np.array_equal(frame["y"], [np.nan, 2.0, 0.0], equal_nan=True))
+            self.assertTrue(np.array_equal(frame["z"], [7.0, np.nan, 0.0], equal_nan=True))
+
+        path.write_bytes(b'"a";1;2;3;4;5;6;7;\n\n"b";1;2;x;4;5;6;7;\n')
+        with self.assertRaisesRegex(ValueError, f"{path.name}: line 3 has an unreadable field 'x'"):
+            load_tb(path)
+
+    def test_load_chunks(self):
+        from utils import tb
+
+        frame = load_tb(folder / "test_tb_file.txt")
+        chunk_size, tb.CHUNK_SIZE = tb.CHUNK_SIZE, 100
+        try:
+            chunked = load_tb(folder / "test_tb_file.txt")
+        finally:
+            tb.CHUNK_SIZE = chunk_size
+        self.assertEqual(list(chunked["model"]), list(frame["model"]))
+        self.assertTrue(np.array_equal(chunked[list(TB_COLUMNS)], frame[list(TB_COLUMNS)]))
+
+    def test_load_parallel(self):
+        frame = load_tb(folder / "frl_saaremaa_airfield.txt")
+        parallel = load_tb_parallel(folder / "frl_saaremaa_airfield.txt", workers=3, min_size=1)
+
+        self.assertEqual(len(parallel), len(frame))
+        self.assertEqual(parallel.models, frame.models)
+        self.assertEqual(list(parallel["model"]), list(frame["model"]))
+        self.assertTrue(np.array_equal(parallel[list(TB_COLUMNS)], frame[list(TB_COLUMNS)]))
+
+    def test_write(self):
+        frame = load_tb(folder / "test_tb_file.txt")
+        before = frame.copy()
+        path = results / "test_tb_write.txt"
+        path.parent.mkdir(exist_ok=True)
+        write_tb(path, frame)
+
+        self.assertEqual(frame.models, before.models)
+        with path.open() as fp:
+            self.assertEqual(
+                fp.readline(),
+                '"bw_SetBig_Brains_F";200003.000000;6.000000;0.000000;0.000000;0.000000;1.000000;0.000000;\n',
+            )
+        again = load_tb(path)
+        self.assertTrue(np.array_equal(again[list(TB_COLUMNS)], frame[list(TB_COLUMNS)]))
+
+    def test_write_identical(self):
+        """Output is the same as formatting every row with "%.6f", also for ties, -0.0, nan and huge values"""
+        rng = np.random.default_rng(0)
+        values = np.concatenate(
+            [
+                rng.uniform(-1e6, 1e6, 20000),
+                rng.uniform(-1e-6, 1e-6, 5000),
+                (rng.integers(-(10 ** 12), 10 ** 12, 20000) + 0.5) / 1e6,
+                10 ** rng.uniform(-8, 10, 20000) * rng.choice([-1, 1], 20000),
+                [0.0, -0.0, 5e-7, -5e-7, 2.5e-6, 0.1, 2.675, 1.0000005, 9007199254.740991, 1e20, -1e300],
+                [np.inf, -np.inf, np.nan],
+            ]
+        )
+        rng.shuffle(values)
+        rows = len(values) // len(TB_COLUMNS)
+        columns = {name: values[i * rows : (i + 1) * rows] for i, name in enumerate(TB_COLUMNS)}
+        models = ["a", "Ünïcødé_F", 'q"uote', "x" * 80]
+        frame = TbFrame(models, rng.integers(0, len(models), rows), columns)
+        before = frame.copy()
+
+        def line(row: TbRow) -> str:
+            """Like the pandas writer did, "%.6f" with an empty field for nan"""
+            values = (getattr(row, name) for name in TB_COLUMNS)
+            return '"%s";' % row.model + "".join(("" if np.isnan(v) else "%.6f" % v) + ";" for v in values) + "\n"
+
+        expected = results / "test_tb_write_expected.txt"
+        with expected.open(mode="w") as fp:
+            fp.writelines(line(row) for row in frame.rows())
+
+        from utils import tb
+
+        chunk, tb.WRITE_CHUNK = tb.WRITE_CHUNK, 1000
+        try:
+            write_tb(results / "test_tb_write_bulk.txt", frame)
+            write_tb_parallel(results / "test_tb_write_parallel.txt", frame, workers=3, min_rows=1)
+        finally:
+            tb.WRITE_CHUNK = chunk
+
+        self.assertEqual((results / "test_tb_write_bulk.txt").read_bytes(), expected.read_bytes())
+        self.assertEqual((results / "test_tb_write_parallel.txt").read_bytes(), expected.read_bytes())
+        self.assertEqual(frame.models, before.models)
+        for name in TB_COLUMNS:
+            self.assertTrue(np.array_equal(frame[name], before[name], equal_nan=True))
+
+        nan = TbFrame.from_rows([TbRow("a", x=1.0, y=np.nan, z=np.inf)])
+        write_tb(results / "test_tb_write_nan.txt", nan)
+        written = (results / "test_tb_write_nan.txt").read_bytes()
+        self.assertEqual(written, b'"a";1.000000;;0.000000;0.000000;0.000000;1.000000;inf;' + os.linesep.encode())
+
+        write_tb(results / "test_tb_write_empty.txt", TbFrame.empty())
+        self.assertEqual((results / "test_tb_write_empty.txt").read_bytes(), b"")
+
+    def test_indexing(self):
+        frame = load_tb(folder / "test_tb_file.txt")
+        subset = frame[frame["y"] > 40]
+        self.assertEqual(len(subset), sum(1 for f in frame.rows() if f.y > 40))
+        self.assertEqual(frame[["x", "y"]].shape, (len(frame), 2))
+
+        joined = TbFrame.concat([frame[:5], frame[5:]])
+        self.assertEqual(list(joined["model"]), list(frame["model"]))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,106 @@
+import time
+import argparse
+import unittest
+import sys
+import subprocess
+from pathlib import Path
+
+import numpy as np
+from scipy import spatial
+
+from utils.library import TbLibraryCollection
+from utils.process import thinning
+from utils.process.thinning import row_spacing, spacing_value, thinning_order
+from utils.spatial import greedy_thinning
+from utils.tb import TbFrame, TbRow, load_tb, write_tb
+
+file = Path(__file__)
+folder = file.parent / "testdata"
+
+
+class TestSelfThinning(unittest.TestCase):
+    def test_row_spacing(self):
+        frame = TbFrame.from_rows(
+            [TbRow("bw_SetBig_Brains_F"), TbRow("p_Reeds_F"), TbRow("Rock_F"), TbRow("bw_SetBig_corals_F")]
+        )
+        libraries = TbLibraryCollection(folder, snapshot=False)
+        spacing = row_spacing(
+            frame, 1.0, {"bw_setbig_brains_f": 5.0}, {"a3_plants_bush": 3.0, "a3_plants_plant": 0.0}, libraries
+        )
+        self.assertEqual(spacing.tolist(), [5.0, 0.0, 1.0, 3.0])
+        self.assertEqual(thinning_order(frame, spacing, "largest").tolist(), [0, 3, 2, 1])
+
+        self.assertEqual(spacing_value("t_Fagus_F=2.5"), ("t_fagus_f", 2.5))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            spacing_value("t_Fagus_F")
+
+    def test_thinning(self):
+        rng = np.random.default_rng(1)
+        xy = rng.uniform(0, 200, (3000, 2))
+        spacing = rng.choice([0.0, 2.0, 5.0], len(xy))
+        order = np.lexsort((np.arange(len(xy)), -spacing))
+        keep = greedy_thinning(xy, spacing, order)
+
+        # No kept pair is closer than its larger spacing, unless one of them has none
+        kept = np.flatnonzero(keep)
+        pairs = spatial.cKDTree(xy[kept]).query_pairs(5.0, output_type="ndarray")
+        a, b = kept[pairs[:, 0]], kept[pairs[:, 1]]
+        distance = np.hypot(*(xy[a] - xy[b]).T)
+        limit = np.where((spacing[a] > 0) & (spacing[b] > 0), np.maximum(spacing[a], spacing[b]), 0)
+        self.assertTrue(np.all(distance >= limit))
+
+        # Maximal, every dropped point conflicts with a kept one
+        for i in np.flatnonzero(~keep)[:200]:
+            distance = np.hypot(*(xy[kept] - xy[i]).T)
+            limit = np.maximum(spacing[kept], spacing[i])
+            self.assertTrue(np.any((distance < limit) & (spacing[kept] > 0)))
+        self.assertTrue(np.all(keep[spacing == 0]))
+        self.assertTrue(np.array_equal(greedy_thinning(xy, spacing, order), keep))
+
+    def test_sorted_scale(self):
+        # Grids in row order chain every point to the next one, the time should still grow linearly
+        def thin(side: int, shuffle: bool = False) -> float:
+            xy = np.stack(np.meshgrid(np.arange(side) * 0.5, np.arange(side) * 0.5), axis=-1).reshape(-1, 2)
+            if shuffle:
+                xy = xy[np.random.default_rng(0).permutation(len(xy))]
+            start = time.perf_counter()
+            keep = greedy_thinning(xy, 1.0)
+            seconds = time.perf_counter() - start
+            if not shuffle:
+                self.assertEqual(keep.sum(), ((side + 1) // 2) ** 2)
+            return seconds
+
+        thin(100)
+        small, large = min(thin(200) for _ in range(3)), thin(800)
+        self.assertLess(large / small, 40)  # 16 times the points, took ~60 times as long with rounds
+        self.assertLess(large / thin(800, shuffle=True), 3)  # Was ~9 times slower than shuffled
+
+    def test_run(self):
+        path = file.parent / "testresults" / "test_thinning.txt"
+        path.parent.mkdir(exist_ok=True)
+        rows = [TbRow("t_Fagus_F", 0.0, 0.0), TbRow("t_Fagus_F", 0.05, 0.0), TbRow("t_Fagus_F", 3.0, 0.0)]
+        rows += [TbRow("b_Bush_F", 0.5, 0.5), TbRow("b_Bush_F", 10.0, 0.0), TbRow("b_Bush_F", 10.5, 0.0)]
+        write_tb(path, TbFrame.from_rows(rows))
+        try:
+            # fmt: off
+            args = [
+                sys.executable,
+                thinning.__file__,
+                "--ignore-gooey",
+                str(path),
+                "-s", "1",
+                "--model-spacing", "t_Fagus_F=2",
+                "--order", "largest",
+            ]
+            # fmt: on
+            subprocess.check_output(args)
+        except subprocess.CalledProcessError as e:
+            self.fail(e.output.decode("utf-8"))
+
+        out = load_tb(path.with_name(path.stem + "_OUT.txt"))
+        kept = list(zip(out["model"].tolist(), out["x"].tolist()))
+        self.assertEqual(kept, [("t_Fagus_F", 0.0), ("t_Fagus_F", 3.0), ("b_Bush_F", 10.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import shutil
+from pathlib import Path
+
+import xmltodict
+
+from utils.library import ModelEntry, get_v4_hash
+from utils.process.library.tml import TmlWriter
+
+file = Path(__file__)
+TEMPLATE = file.parents[1] / "utils" / "process" / "library" / "data" / "empty_template.tml"
+
+
+def unparse(library: dict, category: str, entries: list) -> str:
+    """How libraries were written before, building the whole document with xmltodict"""
+    library = dict(library, Library=dict(library["Library"], **{"@name": category}))
+    templates = []
+    for entry in entries:
+        template = library["Library"]["Template"][0].copy()
+        template.update(Name=entry.name, File=entry.file, Fill=entry.fill, Outline=entry.outline)
+        template["Hash"] = get_v4_hash(entry.name)
+        templates.append(template)
+    library["Library"]["Template"] = templates
+    return xmltodict.unparse(library, pretty=True)
+
+
+class TestTmlWriter(unittest.TestCase):
+    def setUp(self):
+        self.folder = file.parent / "testresults" / "tml"
+        if self.folder.exists():
+            shutil.rmtree(self.folder)
+        self.folder.mkdir(parents=True)
+        self.library = xmltodict.parse(TEMPLATE.read_text())
+
+    def test_identical(self):
+        entries = [
+            ModelEntry("t_ficus_big_f", "a3\\plants_f\\tree\\t_ficus_big_f.p3d", -16744448, -16777216),
+            ModelEntry("b_small_f_1", "a3\\plants_f\\bush\\b_small_f.p3d", "-16744448", "-16777216"),
+            ModelEntry("odd & <name> \"%s\"", "a3\\odd & <name>\\%s {0}.p3d", -1, -1),
+        ]
+        writer = TmlWriter(self.library)
+        for category in ("a3_plants", "odd & \"quoted\" %s"):
+            output = self.folder / "library.tml"
+            writer.write(output, category, entries)
+            self.assertEqual(output.read_text(), unparse(self.library, category, entries))
+
+    def test_template_values(self):
+        self.library["Library"]["Template"][0]["Date"] = "2020-01-01 12:00:00"
+        writer = TmlWriter(self.library)
+        text = writer.render(ModelEntry("name", "file.p3d", 1, 2))
+        self.assertIn("<Date>2020-01-01 12:00:00</Date>", text)
+        self.assertIn(f"<Hash>{get_v4_hash('name')}</Hash>", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+"""
+    Stand-in for Mikero's dep3d, used by the tests.
+    The "models" are json files with the properties and bounding box to print.
+    Every call is logged to the file in DEP3D_STUB_LOG, if set
+"""
+import os
+import sys
+import json
+from pathlib import Path
+
+flag, path = sys.argv[-2], Path(sys.argv[-1])
+if os.environ.get("DEP3D_STUB_LOG"):
+    with open(os.environ["DEP3D_STUB_LOG"], mode="a") as fp:
+        fp.write(f"{flag} {path.name}\n")
+
+try:
+    model = json.loads(path.read_text())
+except ValueError:
+    print(f"Error: {path} is not a p3d")
+    sys.exit(1)
+
+print(f"dep3d stub, {path}")
+if flag == "-LPP":
+    print("LOD 1.000")
+    for key, value in model["properties"].items():
+        print(f'    {key} = "{value}"')
+elif flag == "-LB":
+    print("Bounding box min: {}, {}, {}".format(*model["min"]))
+    print("Bounding box max: {}, {}, {}".format(*model["max"]))
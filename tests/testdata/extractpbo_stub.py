@@ -0,0 +1,21 @@
+"""
+    Stand-in for Mikero's extractPBO, used by the tests.
+    Unpacks everything to `destination/<pbo name>/<prefix>`, config.bin is "debinarized" to config.cpp
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[2]))
+
+from utils.process.pbo import PboReader, PboError  # noqa: E402
+
+source, destination = Path(sys.argv[-2]), Path(sys.argv[-1])
+try:
+    with PboReader(source) as pbo:
+        written = pbo.extract(destination / source.stem)
+except PboError:
+    sys.exit(2)
+
+for path in written:
+    if path.name.lower() == "config.bin":
+        path.replace(path.with_name("config.cpp"))
@@ -1,21 +1,58 @@
+import os
+import json
 import shutil
 from pathlib import Path
+from typing import List, Optional
 
-def copytree(src: Path, folder: Path, include=tuple()):
+def copytree(src: Path, folder: Path, include=tuple()) -> List[Path]:
     """
         Alternative implementation of copy tree, 
         accepts existing directory (Included by default in Python 3.8+).
         also adds an Include tuple, to only include given extensions
+        Returns the paths of all copied files
     """
 
     if not folder.exists():
         folder.mkdir(mode=0o775, exist_ok=True, parents=True)
 
+    copied = []
     item: Path
     for item in src.iterdir():
         if item.is_dir():
-            copytree(item, folder / item.name, include=include)
+            copied.extend(copytree(item, folder / item.name, include=include))
         else:
             if include and item.suffix not in include:
                 continue
-            shutil.copy2(item, folder)
+            copied.append(Path(shutil.copy2(item, folder)))
+    return copied
+
+
+def cache_folder() -> Path:
+    """Folder for the caches of the current user: %LOCALAPPDATA% on Windows, $XDG_CACHE_HOME or ~/.cache elsewhere"""
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        return Path(os.environ["LOCALAPPDATA"]) / "arma_terrain_utils"
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "arma_terrain_utils"
+
+
+def load_json(path: Path, version: int) -> Optional[dict]:
+    """Data saved by `save_json`, None if the file is missing, unreadable or of another version"""
+    try:
+        with path.open(mode="r") as fp:
+            data = json.load(fp)
+        if data["version"] == version:
+            return data
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def save_json(path: Path, version: int, data: dict, indent: int = None):
+    """
+        Writes `data` with its `version` to `path`. Goes through a temporary file,
+        so an interrupted save never leaves a half written file behind
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(path.name + ".tmp")
+    with temp.open(mode="w") as fp:
+        json.dump({"version": version, **data}, fp, indent=indent)
+    os.replace(str(temp), str(path))
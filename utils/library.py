@@ -1,11 +1,18 @@
+import os
+import sys
+import hashlib
 from pathlib import Path
-from dataclasses import dataclass
 from typing import List, Union, Tuple, Dict, Optional
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from xml.parsers import expat
 
 import ctypes
+import numpy as np
 import xmltodict
 
+from utils.funcs import cache_folder, load_json, save_json
+
 
 def dict_keys_lower(iterable: Union[OrderedDict, dict, list]):
     """Renames all key in orderdeddict recursively to lowercase"""
@@ -24,12 +31,36 @@ def dict_keys_lower(iterable: Union[OrderedDict, dict, list]):
     return newdict
 
 
+HASH_CHUNK = 1 << 16  # Names hashed at once by `get_v4_hashes`
+
+
 def get_v4_hash(name: str) -> int:
     """Creates the hash required for TB, given `name` (template name)"""
     _hash = 0
     for letter in name:
         _hash = (ord(letter) + (_hash << 6) + (_hash << 16) - _hash) & 0xFFFFFFFF
-    return ctypes.c_long(_hash).value
+    return ctypes.c_int32(_hash).value  # c_long is 64 bit outside of Windows
+
+
+def get_v4_hashes(names: List[str]) -> np.ndarray:
+    """
+        `get_v4_hash` for many names at once, as int32 array. The names are laid out as rows of code points,
+        longest first, and the hash (`hash * 65599 + letter`, wrapping at 32 bits) is done a column at a time
+        for the rows that are still long enough
+    """
+    hashes = np.zeros(len(names), dtype=np.uint32)
+    for start in range(0, len(names), HASH_CHUNK):
+        chunk = np.array(names[start : start + HASH_CHUNK], dtype=str)
+        lengths = np.char.str_len(chunk)
+        order = np.argsort(-lengths, kind="stable")
+        letters = chunk[order].view(np.uint32).reshape(len(chunk), -1)
+        rows = np.searchsorted(-lengths[order], -np.arange(letters.shape[1]), side="left")
+
+        _hash = np.zeros(len(chunk), dtype=np.uint32)
+        for column, count in enumerate(rows):
+            _hash[:count] = _hash[:count] * np.uint32(65599) + letters[:count, column]
+        hashes[start + order] = _hash
+    return hashes.view(np.int32)
 
 
 def tbcolor_to_hex(number: int) -> "str":
@@ -48,18 +79,64 @@ def tbcolor_to_rgba(number: int, alpha=255) -> Tuple[int]:
     return (*rgb, alpha)
 
 
-@dataclass
 class ModelEntry:
-    name: str
-    file: str
-    fill: int
-    outline: int
-    landslope: bool = False
-    size: Tuple[float] = (1.0, 1.0, 1.0)
+    """
+        The template data used by the tools. Libraries hold a lot of these,
+        so this uses slots and interns the strings instead of being a dataclass
+    """
+
+    __slots__ = ("name", "file", "fill", "outline", "landslope", "size", "hash")
+
+    def __init__(
+        self,
+        name: str,
+        file: str,
+        fill: int,
+        outline: int,
+        landslope: bool = False,
+        size: Tuple[float] = (1.0, 1.0, 1.0),
+        hash: Optional[int] = None,
+    ):
+        self.name = sys.intern(name) if type(name) is str else name
+        self.file = sys.intern(file) if type(file) is str else file
+        self.fill = fill
+        self.outline = outline
+        self.landslope = landslope
+        self.size = size
+        self.hash = hash
+
+    def _astuple(self) -> tuple:
+        return (self.name, self.file, self.fill, self.outline, self.landslope, self.size, self.hash)
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={value!r}" for field, value in zip(self.__slots__, self._astuple()))
+        return f"{self.__class__.__name__}({values})"
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._astuple() == other._astuple()
+
+    __hash__ = None  # Mutable, same as the dataclass this used to be
+
+    def replace(self, **changes) -> "ModelEntry":
+        """Copy of this entry with `changes` applied"""
+        values = dict(zip(self.__slots__, self._astuple()), **changes)
+        return self.__class__(**values)
+
+    def update(self, other: "ModelEntry"):
+        """Takes over all values of `other`, keeping this object"""
+        for field in self.__slots__:
+            setattr(self, field, getattr(other, field))
+
+    @property
+    def tb_hash(self) -> int:
+        """The hash TB knows this template by, from the name if the library doesn't have one"""
+        return self.hash if self.hash is not None else get_v4_hash(self.name)
 
     @classmethod
     def from_library(cls, values: dict) -> "ModelEntry":
-        values = dict_keys_lower(values)
+        values = {key.lower(): value for key, value in values.items()}
         return cls(
             values["name"],
             values["file"],
@@ -67,6 +144,7 @@ class ModelEntry:
             int(values["outline"]),
             values["placement"] == "slopelandcontact",
             size=cls.handle_size(values),
+            hash=int(values["hash"]) if values.get("hash") else None,
         )
 
     @staticmethod
@@ -80,25 +158,163 @@ class ModelEntry:
         return (self.name, tbcolor_to_rgba(self.fill), tbcolor_to_rgba(self.outline), self.size)
 
 
+class TemplateIndex:
+    """Finds a `ModelEntry` by its lower case name, its file path or its TB hash"""
+
+    def __init__(self):
+        self.names: Dict[str, ModelEntry] = {}
+        self.files: Dict[str, ModelEntry] = {}
+        self.hashes: Dict[int, ModelEntry] = {}
+        self.libraries: Dict[str, str] = {}  # Library name for each lower case template name
+
+    @staticmethod
+    def file_key(file: str) -> str:
+        return file.lower().replace("/", "\\")
+
+    def add(self, entry: ModelEntry, library: str):
+        """Adds or replaces an entry, the last one added wins when names, files or hashes are the same"""
+        name = entry.name.lower()
+        self.names[name] = entry
+        self.libraries[name] = library
+        self.files[self.file_key(entry.file)] = entry
+        self.hashes[entry.tb_hash] = entry
+
+    def remove(self, entry: ModelEntry):
+        name = entry.name.lower()
+        if self.names.get(name) is entry:
+            del self.names[name]
+            del self.libraries[name]
+
+        file = self.file_key(entry.file)
+        if self.files.get(file) is entry:
+            del self.files[file]
+        if self.hashes.get(entry.tb_hash) is entry:
+            del self.hashes[entry.tb_hash]
+
+
+class Template(dict):
+    """Template dict from a `TbLibrary`, setting items in it updates the `ModelEntry` and the indexes"""
+
+    library: "TbLibrary" = None
+    entry: ModelEntry = None
+
+    def __setitem__(self, key, value):
+        if key in self and self[key] == value:
+            return  # Keep the library clean
+        super().__setitem__(key, value)
+        if self.library is not None:
+            self.library._edited(self)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        if self.library is not None:
+            self.library._edited(self)
+
+
 class TbLibraryCollection:
-    def __init__(self, folder: Path):
-        self.libraries: List[TbLibrary] = self.load_libraries(folder)
-        self._lib, self._entries = self.cache(self.libraries)
+    """
+        All libraries in a folder. The templates of the parsed libraries are stored in a json snapshot
+        in the cache folder of the user, so later runs only parse the .tml files that changed (size or mtime) since.
+        Nothing is written to the library folder itself, which is often shared with others
+    """
+
+    VERSION = 4
+
+    def __init__(self, folder: Path, snapshot: bool = True, jobs: int = 1):
+        """With `jobs` above 1, the files that need parsing are parsed by a process pool"""
+        self.folder = folder
+        self.jobs = jobs
+        self.parsed: List[Path] = []  # Files that weren't in the snapshot, or changed
+
+        files = self.stat_files(folder)
+        unchanged = self.load_snapshot(files) if snapshot else {}
+        self.libraries: List[TbLibrary] = self.load_libraries(folder, unchanged)
+        self.index: TemplateIndex = self.cache(self.libraries)
+        if snapshot and (self.parsed or len(unchanged) != self._snapshot_size):
+            self.save_snapshot(files)
+
+    @staticmethod
+    def snapshot_path(folder: Path) -> Path:
+        """Where the snapshot of `folder` is kept, named after its full path"""
+        key = os.path.normcase(str(folder.resolve()))
+        return cache_folder() / "libraries" / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
 
-    def load_libraries(self, folder: Path):
-        libraries = []
+    @staticmethod
+    def stat_files(folder: Path) -> Dict[str, Tuple[int, int]]:
+        """Size and mtime of each .tml file, stat before parsing so changes made while parsing are caught later"""
+        files = {}
         for tml_file in folder.glob("*.tml"):
-            libraries.append(TbLibrary.from_file(tml_file))
-        return libraries
+            stat = tml_file.stat()
+            files[tml_file.name] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def load_libraries(self, folder: Path, unchanged: Dict[str, "TbLibrary"] = None):
+        unchanged = unchanged or {}
+        files = list(folder.glob("*.tml"))
+        self.parsed = [tml_file for tml_file in files if tml_file.name not in unchanged]
+
+        if self.jobs > 1 and len(self.parsed) > 1:
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                parsed = dict(zip(self.parsed, pool.map(TbLibrary.from_file, self.parsed)))
+        else:
+            parsed = {tml_file: TbLibrary.from_file(tml_file) for tml_file in self.parsed}
+        return [parsed[tml_file] if tml_file in parsed else unchanged[tml_file.name] for tml_file in files]
+
+    def load_snapshot(self, files: Dict[str, Tuple[int, int]]) -> Dict[str, "TbLibrary"]:
+        """Libraries of the snapshot of a previous run that didn't change since, by file name"""
+        self._snapshot_size = 0
+        data = load_json(self.snapshot_path(self.folder), self.VERSION)
+        if data is None:
+            return {}
+
+        unchanged = {}
+        try:
+            self._snapshot_size = len(data["libraries"])
+            for name, library in data["libraries"].items():
+                if name not in files or tuple(library["stat"]) != files[name]:
+                    continue
+                entries = [
+                    ModelEntry(name, file, fill, outline, landslope, tuple(size), tb_hash)
+                    for name, file, fill, outline, landslope, size, tb_hash in library["entries"]
+                ]
+                unchanged[name] = TbLibrary(
+                    None, path=self.folder / name, attributes=library["attributes"], entries=entries
+                )
+        except (AttributeError, KeyError, TypeError, ValueError):
+            self._snapshot_size = 0
+            return {}
+        return unchanged
+
+    def save_snapshot(self, files: Dict[str, Tuple[int, int]]):
+        libraries = {}
+        for library in self.libraries:
+            entries = [
+                [e.name, e.file, e.fill, e.outline, e.landslope, list(e.size), e.hash] for e in library.entries.values()
+            ]
+            stat = files.get(library.path.name)
+            if stat is not None:
+                libraries[library.path.name] = {"stat": stat, "attributes": library.attributes, "entries": entries}
+        try:
+            save_json(self.snapshot_path(self.folder), self.VERSION, {"libraries": libraries})
+        except OSError:
+            pass  # No writable cache folder, just parse again next time
 
-    def cache(self, libraries):
-        _lib_cache = {}
-        _entry_cache = {}
+    def cache(self, libraries) -> TemplateIndex:
+        """Index of all libraries, kept up to date when their templates are edited"""
+        index = TemplateIndex()
         for lib in libraries:
+            lib.indexes.append(index)
             for entry in lib:
-                _lib_cache[entry.name.lower()] = lib.name
-                _entry_cache[entry.name.lower()] = entry
-        return _lib_cache, _entry_cache
+                index.add(entry, lib.name)
+        return index
+
+    @property
+    def _lib(self) -> Dict[str, str]:
+        return self.index.libraries
+
+    @property
+    def _entries(self) -> Dict[str, ModelEntry]:
+        return self.index.names
 
     def __iter__(self) -> "TbLibrary":
         for i in self.libraries:
@@ -115,35 +331,129 @@ class TbLibraryCollection:
         except KeyError:
             return None
 
+    def get_by_file(self, file: str) -> Optional[ModelEntry]:
+        """Gets the ModelEntry using the model path (case insensitive, either slash)"""
+        return self.index.files.get(TemplateIndex.file_key(file))
+
+    def get_by_hash(self, tb_hash: int) -> Optional[ModelEntry]:
+        """Gets the ModelEntry using the hash TB knows it by"""
+        return self.index.hashes.get(tb_hash)
+
     def __getitem__(self, key: str):
         return self.get_entry(key)
 
 
 class TbLibrary:
-    """This represents a single .tml file"""
+    """
+        This represents a single .tml file. When loaded from a file, only the fields `ModelEntry` needs are read.
+        The full xmldict is parsed the first time it's needed (To edit a template, or `save`)
+    """
 
-    def __init__(self, library: dict, *args, path=None, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        self.__fix(library)
-        self._dict = library  # Unedited xmldict
-        self._dictlower: Dict[str, OrderedDict] = {}
+    READ_SIZE = 1 << 20
+    FIELDS = ("name", "file", "fill", "outline", "placement", "hash")  # Template elements read by `read_entries`
 
-        self.entries: Dict[str, ModelEntry] = {}
-        for entry in library["Library"]["Template"]:
-            model = ModelEntry.from_library(entry)
-            self.entries[model.name] = model
-            self._dictlower[model.name.lower()] = entry
+    def __init__(
+        self,
+        library: Optional[dict],
+        *args,
+        path=None,
+        attributes: Dict[str, str] = None,
+        entries: List[ModelEntry] = None,
+        **kwargs,
+    ):
+        """
+            Reads the entries from `library` (xmldict), or else from the file at `path`.
+            Given `attributes` and `entries` (of an earlier read of `path`) the file is only parsed when needed
+        """
+        super().__init__(*args, **kwargs)
 
         self.path = path
+        self.dirty = False  # Edited since loading or saving
+        self.attributes: Dict[str, str] = {}
+        self.entries: Dict[str, ModelEntry] = {}
+        self.__dict: Optional[dict] = None  # Unedited xmldict
+        self.__dictlower: Dict[str, Template] = {}
+
+        if entries is not None:
+            self.attributes = dict(attributes)
+            self.entries = {entry.name: entry for entry in entries}
+        elif library is None:
+            self.read_entries(path)
+        else:
+            for entry in self.__fix(library):
+                model = ModelEntry.from_library(entry)
+                self.entries[model.name] = model
+            self.attributes = {k[1:]: v for k, v in library["Library"].items() if k.startswith("@")}
+            self.__set_dict(library)
+
+        self.index = TemplateIndex()
+        self.indexes: List[TemplateIndex] = [self.index]  # Collections add theirs, to be updated on edits
+        for entry in self.entries.values():
+            self.index.add(entry, self.name)
 
     @property
     def name(self):
-        return self._dict["Library"]["@name"]
+        return self.attributes["name"]
 
     @property
     def shape(self):
-        return self._dict["Library"]["@shape"]
+        return self.attributes["shape"]
+
+    @property
+    def _dict(self) -> dict:
+        if self.__dict is None:
+            with self.path.open(mode="r") as fp:
+                self.__set_dict(xmltodict.parse(fp.read()))
+        return self.__dict
+
+    @property
+    def _dictlower(self) -> Dict[str, Template]:
+        self._dict  # Parses the file if that didn't happen yet
+        return self.__dictlower
+
+    def __set_dict(self, library: dict):
+        """Links each template in the xmldict to its `ModelEntry`, so edits to it can be tracked"""
+        templates = self.__fix(library)
+        self.__dictlower = {}
+        for i, values in enumerate(templates):
+            template = templates[i] = Template(values)
+            name = self.template_name(template)
+            template.entry = self.entries.get(name)
+            template.library = self if template.entry is not None else None
+            self.__dictlower[name.lower()] = template
+        self.__dict = library
+
+    @staticmethod
+    def template_name(template: dict) -> str:
+        return next(value for key, value in template.items() if key.lower() == "name")
+
+    def _edited(self, template: Template):
+        """Called by templates that were edited, updates their entry and the indexes"""
+        self.dirty = True
+        entry = template.entry
+        old_name = entry.name
+        for index in self.indexes:
+            index.remove(entry)
+        try:
+            entry.update(ModelEntry.from_library(template))
+        finally:
+            for index in self.indexes:
+                index.add(entry, self.name)
+
+        if entry.name != old_name:
+            del self.entries[old_name]
+            self.entries[entry.name] = entry
+            del self.__dictlower[old_name.lower()]
+            self.__dictlower[entry.name.lower()] = template
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["indexes"] = [self.index]  # Collections add theirs again after loading
+        if self.path is not None:
+            # Parsed again from the file when needed
+            state["_TbLibrary__dict"] = None
+            state["_TbLibrary__dictlower"] = {}
+        return state
 
     @classmethod
     def from_file(cls, path: Path) -> "TbLibrary":
@@ -151,9 +461,41 @@ class TbLibrary:
         if not path.exists():
             raise FileNotFoundError
 
+        return cls(None, path=path)
+
+    def read_entries(self, path: Path):
+        """
+            Reads the library attributes and a `ModelEntry` per template, one template at a time.
+            Only the text of the elements in `FIELDS` is kept, everything else is skipped by the parser
+        """
+        fields, text = {}, []
+
+        def start(tag: str, attributes: dict):
+            tag = tag.lower()
+            if tag in ("boundingmax", "boundingmin"):
+                fields[tag] = attributes
+            elif tag == "library":
+                self.attributes = attributes
+            text.clear()
+
+        def end(tag: str):
+            tag = tag.lower()
+            if tag in self.FIELDS:
+                fields[tag] = "".join(text).strip()
+            elif tag == "template":
+                model = ModelEntry.from_library(fields)
+                self.entries[model.name] = model
+                fields.clear()
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = text.append
         with path.open(mode="r") as fp:
-            library = xmltodict.parse(fp.read())
-        return cls(library, path=path)
+            for chunk in iter(lambda: fp.read(self.READ_SIZE), ""):
+                parser.Parse(chunk, False)
+        parser.Parse("", True)
 
     def save(self, path: Union[Path, None] = None):
         """Write the dict back to a file. If `path` is not given it'll use the path is was opened with (If available)"""
@@ -162,20 +504,26 @@ class TbLibrary:
             if path is None:
                 raise Exception(f"No path given to save {self}")
 
+        library = self._dict
         with path.open(mode="w") as fp:
-            xmltodict.unparse(self._dict, output=fp, pretty=True)
+            xmltodict.unparse(library, output=fp, pretty=True)
+        if path == self.path:
+            self.dirty = False
 
     def __fix(self, library) -> List[dict]:
         """Fixes usual discrepancies between different template files"""
         try:
             entries = library["Library"]["Template"]
             entries[0]["Name"]
+        except IndexError:
+            pass  # Fixed before, without any templates
         except (NameError, KeyError):
             try:
                 entries = [library["Library"]["Template"]]
             except KeyError:
                 entries = []
         library["Library"]["Template"] = entries
+        return entries
 
     def __len__(self):
         return len(self.entries)
@@ -187,9 +535,22 @@ class TbLibrary:
         for i in self.entries.values():
             yield i
 
-    def __getitem__(self, key: str) -> OrderedDict:
-        _dict_lower = {k.lower(): v for k, v in self._dictlower.items()}
-        return _dict_lower[key.lower()]
+    def __getitem__(self, key: str) -> Template:
+        return self._dictlower[key.lower()]
+
+    def __contains__(self, key: str) -> bool:
+        return key.lower() in self.index.names
+
+    def get_entry(self, name: str) -> Optional[ModelEntry]:
+        return self.index.names.get(name.lower())
+
+    def get_by_file(self, file: str) -> Optional[ModelEntry]:
+        """Gets the ModelEntry using the model path (case insensitive, either slash)"""
+        return self.index.files.get(TemplateIndex.file_key(file))
+
+    def get_by_hash(self, tb_hash: int) -> Optional[ModelEntry]:
+        """Gets the ModelEntry using the hash TB knows it by"""
+        return self.index.hashes.get(tb_hash)
 
 
 class TbObject:
@@ -1,10 +1,11 @@
 """
     Adds a bush near every tree
 """
+import os
 import sys
 from pathlib import Path
-from random import uniform
-from math import cos, sin
+
+import numpy as np
 from gooey import Gooey, GooeyParser
 
 FOLDER = Path(__file__).parents[2]
@@ -12,7 +13,44 @@ if str(FOLDER) not in sys.path:
     sys.path.insert(0, str(FOLDER))
 
 
-from utils.tb import TbRow  # noqa: E402
+from utils.tb import load_tb_parallel, write_tb_parallel, TbFrame  # noqa: E402
+from utils.spatial import SpatialIndex, greedy_thinning  # noqa: E402
+
+
+def target_rows(frame: TbFrame, target: str) -> np.ndarray:
+    """Rows of all objects of model `target` (Case insensitive)"""
+    ids = [i for i, model in enumerate(frame.models) if model.lower() == target.lower()]
+    return np.flatnonzero(np.isin(frame.model_id, ids))
+
+
+def scatter(frame: TbFrame, target: str, model: str, amount: int, radius: float, seed: int) -> TbFrame:
+    """
+        `amount` new objects of `model` around every `target` in `frame`, uniformly spread over a circle of `radius`.
+        All values are drawn at once from a single seeded stream, so the same seed gives the same objects
+    """
+    parents = np.repeat(target_rows(frame, target), amount)
+    rng = np.random.default_rng(seed)
+    angle = rng.uniform(0, 2 * np.pi, len(parents))
+    distance = radius * np.sqrt(rng.uniform(0, 1, len(parents)))  # Uniform over the area, not the distance
+    columns = {
+        "x": frame["x"][parents] + distance * np.cos(angle),
+        "y": frame["y"][parents] + distance * np.sin(angle),
+        "dir": np.round(rng.uniform(0, 360, len(parents)), 3),
+        "scale": np.round(rng.uniform(0.5, 2, len(parents)), 3),
+    }
+    return TbFrame([model], np.zeros(len(parents), dtype=np.int32), columns)
+
+
+def space_out(new: TbFrame, spacing: float, existing: SpatialIndex = None) -> TbFrame:
+    """
+        Drops new objects closer than `spacing` to an existing object, or to an earlier new object.
+        The new objects are checked in order, so the result only depends on the seed
+    """
+    keep = np.ones(len(new), dtype=bool)
+    if existing is not None:
+        keep &= ~existing.any_within(new[["x", "y"]], np.nextafter(spacing, 0))
+    rows = np.flatnonzero(keep)
+    return new[rows[greedy_thinning(new[["x", "y"]][rows], spacing)]]
 
 
 class AddExtraObject:
@@ -35,6 +73,18 @@ class AddExtraObject:
         parser.add_argument("--model", help="Which model to place", required=True, default="b_Leucaena_F")
         parser.add_argument("--amount", help="How many objects to place near each entry", default=2, type=int)
         parser.add_argument("--radius", help="Maximum distance to place object at", default=2.0, type=float)
+        parser.add_argument(
+            "--spacing",
+            help="Minimum distance between a new object and any other object, 0 to allow any",
+            default=0.0,
+            type=float,
+        )
+        parser.add_argument(
+            "--seed", help="Seed for the random values, same seed gives the same output", type=int, default=None
+        )
+        parser.add_argument(
+            "-j", "--jobs", help="Processes used to read and write large files", type=int, default=os.cpu_count() or 1
+        )
         return parser
 
     @classmethod
@@ -42,33 +92,21 @@ class AddExtraObject:
         if hasattr(args, "command") and args.command != cls.__name__:
             return
 
-        file_in = args.input
-        file_out = args.input.parent / args.input.stem + "_out.txt"
-        target_model = args.target.lower()
-
-        with file_out.open(mode="w") as new_fp:
-            with file_in.open(mode="r") as fp:
-                for line in fp:
-                    entry = TbRow(line)
-                    if entry.model.lower() == target_model:
-                        for i in range(0, args.amount):
-                            bush = create_new_object(entry, args.model, args.radius)
-                            new_fp.write(bush)
-
-
-def create_new_object(entry: TbRow, model: str, radius: float):
-    angle = round(uniform(0, 360), 3)
-    new_object = TbRow(
-        model=model,
-        x=entry.x + radius * cos(angle),
-        y=entry.y + radius * sin(angle),
-        dir=round(uniform(0, 360), 3),
-        pitch=0.0,
-        bank=0.0,
-        scale=round(uniform(2, 0.5), 3),
-        z=0.0,
-    )
-    return new_object.as_line() + "\n"
+        if args.seed is None:
+            args.seed = np.random.SeedSequence().entropy
+            print(f"Using random seed {args.seed}")
+
+        frame = load_tb_parallel(args.input, workers=args.jobs)
+        new = scatter(frame, args.target, args.model, args.amount, args.radius, args.seed)
+        if args.spacing > 0:
+            existing = SpatialIndex.for_file(args.input, workers=args.jobs, frame=frame)
+            placed = len(new)
+            new = space_out(new, args.spacing, existing)
+            print(f"Dropped {placed - len(new)} objects closer than {args.spacing} to another object")
+
+        file_out = args.input.with_name(args.input.stem + "_out.txt")
+        write_tb_parallel(file_out, new, workers=args.jobs)
+        print(f"Added {len(new)} objects to {file_out}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,206 @@
+"""
+    Finds objects whose footprints overlap, within a file or between files. The footprint of an object is the
+    rectangle of its template size (x by z, centered on the object) scaled and rotated like the object
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+from scipy import spatial
+from gooey import Gooey, GooeyParser
+
+FOLDER = Path(__file__).parents[2]
+if str(FOLDER) not in sys.path:
+    sys.path.insert(0, str(FOLDER))
+
+from utils import print  # noqa: E402
+from utils.library import TbLibraryCollection  # noqa: E402
+from utils.spatial import greedy_selection  # noqa: E402
+from utils.tb import load_tb_parallel, write_tb_parallel, TbFrame  # noqa: E402
+
+SIZE_CLASSES = 6  # Broad phase groups, each for objects up to half the radius of the one before
+
+
+def footprints(frame: TbFrame, libraries: TbLibraryCollection) -> Tuple[np.ndarray, List[str]]:
+    """(n, 2) half width and half depth of every row, 0 for models without a template. Also the missing models"""
+    half = np.zeros((len(frame.models), 2))
+    missing = []
+    for i, model in enumerate(frame.models):
+        entry = libraries.get_entry(model)
+        if entry is None:
+            missing.append(model)
+        else:
+            half[i] = entry.size[0] / 2, entry.size[2] / 2
+    return half[frame.model_id] * frame["scale"][:, None], missing
+
+
+def candidate_pairs(xy: np.ndarray, radius: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        Broad phase, pairs of rows whose bounding circles overlap. Rows are split into size classes, so small
+        objects are only searched with the radius of their own class instead of the radius of the largest object
+    """
+    rows = np.flatnonzero(radius > 0)
+    if not len(rows):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    size_class = np.floor(np.log2(radius[rows].max() / radius[rows])).astype(np.int64)
+    size_class = np.minimum(size_class, SIZE_CLASSES - 1)
+    groups = [rows[size_class == i] for i in range(SIZE_CLASSES)]
+    groups = [group for group in groups if len(group)]
+    trees = [spatial.cKDTree(xy[group]) for group in groups]
+    bounds = [radius[group].max() for group in groups]
+
+    first, second = [], []
+    for a, group in enumerate(groups):
+        pairs = trees[a].query_pairs(2 * bounds[a], output_type="ndarray")
+        first.append(group[pairs[:, 0]])
+        second.append(group[pairs[:, 1]])
+        for b in range(a + 1, len(groups)):
+            pairs = trees[a].sparse_distance_matrix(trees[b], bounds[a] + bounds[b], output_type="ndarray")
+            first.append(group[pairs["i"]])
+            second.append(groups[b][pairs["j"]])
+
+    first, second = np.concatenate(first), np.concatenate(second)
+    delta = xy[first] - xy[second]
+    near = np.einsum("ij,ij->i", delta, delta) < (radius[first] + radius[second]) ** 2
+    return first[near], second[near]
+
+
+def overlapping(xy: np.ndarray, yaw: np.ndarray, half: np.ndarray, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+        Narrow phase, separating axis test on the rotated rectangles of each pair. Rectangles that only touch
+        don't overlap. `yaw` is in degrees, clockwise like TB
+    """
+    angle = np.radians(yaw)
+    cos, sin = np.cos(angle), np.sin(angle)
+    width_axis = np.column_stack((cos, -sin))
+    depth_axis = np.column_stack((sin, cos))
+
+    delta = xy[second] - xy[first]
+    boxes = [(width_axis[rows], depth_axis[rows], half[rows]) for rows in (first, second)]
+    separated = np.zeros(len(first), dtype=bool)
+    for axis in (box[i] for box in boxes for i in (0, 1)):
+        extent = sum(
+            size[:, 0] * np.abs(np.einsum("ij,ij->i", width, axis))
+            + size[:, 1] * np.abs(np.einsum("ij,ij->i", depth, axis))
+            for width, depth, size in boxes
+        )
+        separated |= np.abs(np.einsum("ij,ij->i", delta, axis)) >= extent
+    return ~separated
+
+
+class ClashDetection:
+    DESCRIPTION = (
+        "Finds objects that overlap each other, using the bounding box of their template rotated like the object.\n"
+        + "Checks within and between all given files, and can remove the smaller object of every clash"
+    )
+    NAME = "Clash detection"
+
+    def __init__(self, frames: List[TbFrame], libraries: TbLibraryCollection):
+        self.frames = frames
+        self.frame = TbFrame.concat(frames)
+        self.file = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])  # File number of each row
+        self.row = np.concatenate([np.arange(len(frame)) for frame in frames] or [np.empty(0, dtype=np.int64)])
+        self.half, self.missing = footprints(self.frame, libraries)
+        self.first = self.second = np.empty(0, dtype=np.int64)  # Clashing rows, see `detect`
+
+    @classmethod
+    def parser(cls, parent=None):
+        if parent is None:
+            parser = GooeyParser(description=cls.DESCRIPTION)
+        else:
+            sub = parent.add_parser(cls.__name__)
+            parser = sub.add_argument_group(cls.NAME, description=cls.DESCRIPTION, gooey_options={"show_border": True})
+
+        parser.add_argument("library", help="Folder with the library files", widget="DirChooser", type=Path)
+        parser.add_argument("files", help="TB files to check", widget="MultiFileChooser", type=Path, nargs="+")
+        parser.add_argument(
+            "--remove",
+            help="Write a copy of every file without the smaller object of each clash (_OUT.txt)",
+            action="store_true",
+        )
+        parser.add_argument(
+            "-o", "--output", help="Text file to list every clash in (Optional)", widget="FileSaver", type=Path
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help="Processes used to read and write files and libraries",
+            type=int,
+            default=os.cpu_count() or 1,
+        )
+        return parser
+
+    @classmethod
+    def run(cls, args):
+        if hasattr(args, "command") and args.command != cls.__name__:
+            return
+
+        libraries = TbLibraryCollection(Path(args.library), jobs=args.jobs)
+        frames = [load_tb_parallel(path, workers=args.jobs) for path in args.files]
+        obj = cls(frames, libraries)
+        for model in obj.missing:
+            print(f"<error>{model} is not in the library, it is not checked</error>")
+
+        obj.detect()
+        print(f"Found {len(obj.first)} clashes between {len(obj.frame)} objects")
+        if args.output is not None:
+            with args.output.open(mode="w") as fp:
+                fp.writelines(line + "\n" for line in obj.report([path.name for path in args.files]))
+            print(f"Wrote all clashes to {args.output}")
+
+        if args.remove:
+            for path, frame, kept in zip(args.files, frames, obj.resolve()):
+                outpath = path.with_name(path.stem + "_OUT.txt")
+                write_tb_parallel(outpath, kept, workers=args.jobs)
+                print(f"Removed {len(frame) - len(kept)} objects from {path.name}, wrote {outpath}")
+
+    def detect(self):
+        """Finds every pair of overlapping objects, as rows of the combined frame (`first` < `second`)"""
+        xy, half = self.frame[["x", "y"]], self.half
+        first, second = candidate_pairs(xy, np.hypot(half[:, 0], half[:, 1]))
+        clash = overlapping(xy, self.frame["dir"], half, first, second)
+        first, second = np.minimum(first, second)[clash], np.maximum(first, second)[clash]
+        order = np.lexsort((second, first))
+        self.first, self.second = first[order], second[order]
+
+    def keep_mask(self) -> np.ndarray:
+        """
+            Rows left after removing clashes. Objects are handled from the largest footprint to the smallest,
+            file order breaks ties, so each object is removed only if it overlaps a larger object that stays
+        """
+        area = self.half[:, 0] * self.half[:, 1]
+        order = np.lexsort((np.arange(len(area)), -area))
+        rank = np.empty(len(area), dtype=np.int64)
+        rank[order] = np.arange(len(area))
+
+        first, second = rank[self.first], rank[self.second]
+        kept = greedy_selection(len(area), np.minimum(first, second), np.maximum(first, second))
+        return kept[rank]
+
+    def resolve(self) -> List[TbFrame]:
+        """Every file without its removed objects"""
+        keep = self.keep_mask()
+        return [frame[keep[self.file == i]] for i, frame in enumerate(self.frames)]
+
+    def report(self, names: List[str]) -> List[str]:
+        """A line for every clash, objects are given as file name, row number (From 1) and model"""
+        models = self.frame["model"]
+
+        def label(row: int) -> str:
+            return f"{names[self.file[row]]}:{self.row[row] + 1} {models[row]}"
+
+        return [f"{label(a)} overlaps {label(b)}" for a, b in zip(self.first.tolist(), self.second.tolist())]
+
+
+if __name__ == "__main__":
+
+    @Gooey
+    def cli():
+        parser = ClashDetection.parser()
+        ClashDetection.run(parser.parse_args())
+
+    cli()
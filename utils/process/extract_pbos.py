@@ -1,16 +1,128 @@
-import sys
 import os
+import sys
+import time
 import shutil
+import hashlib
+import tempfile
 import subprocess
-from typing import List
-from pathlib import Path
+from typing import Dict, List, Optional
+from pathlib import Path, PureWindowsPath
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from gooey import Gooey, GooeyParser
 
 FOLDER = Path(__file__).parents[2]
 if str(FOLDER) not in sys.path:
     sys.path.insert(0, str(FOLDER))
 
-from utils.funcs import copytree
+from utils.funcs import copytree, load_json, save_json  # noqa: E402
+from utils.process.pbo import PboReader, PboError  # noqa: E402
+
+
+class UnpackError(Exception):
+    pass
+
+
+@dataclass
+class UnpackResult:
+    """Outcome of unpacking a single PBO"""
+
+    file: Path
+    seconds: float
+    files: List[Path]
+    error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.file.stem
+
+
+class PboManifest:
+    """
+        Keeps track of the PBOs unpacked into a target folder, and which files each of them produced.
+        Stored as json in the target folder, so a later run can skip PBOs that didn't change
+    """
+
+    FILENAME = ".extract_pbos.json"
+    VERSION = 1
+
+    def __init__(self, folder: Path, entries: Dict[str, dict] = None):
+        self.folder = folder
+        self.entries: Dict[str, dict] = entries if entries is not None else {}
+
+    @classmethod
+    def load(cls, folder: Path) -> "PboManifest":
+        """Loads the manifest in `folder`, starts a new one if it's missing or unreadable"""
+        data = load_json(folder / cls.FILENAME, cls.VERSION)
+        if data is None or not isinstance(data.get("pbos"), dict):
+            return cls(folder)
+        return cls(folder, data["pbos"])
+
+    def save(self):
+        save_json(self.folder / self.FILENAME, self.VERSION, {"pbos": self.entries}, indent=1)
+
+    @staticmethod
+    def key(file: Path) -> str:
+        return str(file.resolve())
+
+    @staticmethod
+    def fingerprint(file: Path) -> str:
+        """PBOs end with a zero byte followed by the SHA1 of their content, other files are hashed entirely"""
+        with file.open(mode="rb") as fp:
+            if file.stat().st_size > 21:
+                fp.seek(-21, os.SEEK_END)
+                tail = fp.read(21)
+                if tail[0] == 0:
+                    return tail[1:].hex()
+                fp.seek(0)
+
+            digest = hashlib.sha1()
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def unchanged(self, file: Path, models: bool) -> bool:
+        """True if `file` was unpacked before with the same settings, and hasn't changed since"""
+        entry = self.entries.get(self.key(file))
+        if entry is None or entry["models"] != models:
+            return False
+
+        stat = file.stat()
+        if entry["size"] != stat.st_size:
+            return False
+        if entry["mtime"] == stat.st_mtime_ns:
+            return True
+
+        # Touched by an update, but the content might still be the same
+        if entry["fingerprint"] == self.fingerprint(file):
+            entry["mtime"] = stat.st_mtime_ns
+            return True
+        return False
+
+    def record(self, file: Path, models: bool, files: List[Path]):
+        stat = file.stat()
+        self.entries[self.key(file)] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "fingerprint": self.fingerprint(file),
+            "models": models,
+            "files": sorted(f.relative_to(self.folder).as_posix() for f in files),
+        }
+
+    def purge(self, file: Path) -> int:
+        """Removes the files `file` produced last time it was unpacked, returns the amount removed"""
+        entry = self.entries.pop(self.key(file), None)
+        if entry is None:
+            return 0
+
+        removed = 0
+        for relative in entry["files"]:
+            try:
+                (self.folder / relative).unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
 
 
 class ExtractPBOs:
@@ -20,6 +132,7 @@ class ExtractPBOs:
         + "Allows keeping only .p3ds, which is mainly useful if you don't plan on using Buldozer"
         + "This is NOT a replacement of Arma3P and should only be used in rare circumstances"
     )
+    EXTRACTPBO = ["extractPBO"]  # Command used to unpack a single PBO
 
     @classmethod
     def parser(cls, parent=None):
@@ -47,6 +160,12 @@ class ExtractPBOs:
             required=False,
             default=True,
         )
+        parser.add_argument(
+            "--force",
+            help="Unpack every PBO again, even if it didn't change since the last time",
+            action="store_true",
+            required=False,
+        )
         parser.add_argument(
             "-wl",
             "--whitelist",
@@ -54,6 +173,7 @@ class ExtractPBOs:
             action="store_true",
             required=False,
         )
+        parser.add_argument("-j", "--jobs", help="Amount of PBOs to unpack at the same time", type=int, default=1)
 
         return parser
 
@@ -73,8 +193,9 @@ class ExtractPBOs:
         self.args = args
         self.source: Path = args.source
         self.target: Path = args.target
-
-        self.FNULL = open(os.devnull, "w")
+        self.results: List[UnpackResult] = []
+        self.skipped = 0
+        self.manifest = PboManifest.load(self.target)
 
     def mod_unpack(self):
         if not self.target.is_dir():
@@ -88,6 +209,7 @@ class ExtractPBOs:
 
         # Unpack all the PBOs and move their unpacked contents to P drive
         print("### UNPACKING ###")
+        files = []
         for file in self.source.glob("*.pbo"):
             filename = file.stem
             if whitelist and filename not in whitelist:
@@ -96,7 +218,29 @@ class ExtractPBOs:
             if filename in ignored_files:
                 print(f"Skipping {filename}")
                 continue
-            retval = self.pbo_unpack(file, filename)
+            if not getattr(self.args, "force", False) and self.manifest.unchanged(file, self.args.models):
+                self.skipped += 1
+                continue
+            self.purge(file)
+            files.append(file)
+
+        with ThreadPoolExecutor(max_workers=max(getattr(self.args, "jobs", 1), 1)) as pool:
+            self.results.extend(pool.map(self.pbo_unpack_timed, files))
+
+        for result in self.results:
+            if not result.error:
+                self.manifest.record(result.file, self.args.models, result.files)
+        self.manifest.save()
+
+    def purge(self, file: Path):
+        """Removes what a changed PBO produced before, and with `--purge` also its folder in the target"""
+        removed = self.manifest.purge(file)
+        if removed:
+            print(f"Removed {removed} old files of {file.stem}")
+
+        if self.args.purge and (self.target / file.stem).exists():
+            print(f"Purging {file.stem}")
+            shutil.rmtree(self.target / file.stem)
 
     def create_ignore_list(self, source: Path, target: Path) -> List[str]:
         ignored_files = []
@@ -108,13 +252,7 @@ class ExtractPBOs:
             ignore_names = [ignore_list, ignore_list_always][int(self.args.terrain)]
             for i in ignore_names:
                 if i in filename:
-                    ignored_files.append(file)
-
-            if self.args.purge:
-                if filename not in ignored_files:
-                    if (target / filename).exists():
-                        print(f"Purging {filename}")
-                        shutil.rmtree(target / filename)
+                    ignored_files.append(filename)
 
         return ignored_files
 
@@ -128,33 +266,79 @@ class ExtractPBOs:
             filename = file.stem
             for i in to_whitelist:
                 if i in filename:
-                    whitelist.append(file)
+                    whitelist.append(filename)
                     print(f"Found {file}")
         return whitelist
 
-    def pbo_unpack(self, file: Path, filename: str):
+    def pbo_unpack_timed(self, file: Path) -> UnpackResult:
+        """Unpacks a PBO, catching any failure so one broken PBO doesn't stop the others"""
+        start = time.perf_counter()
+        try:
+            files = self.pbo_unpack(file, file.stem)
+            return UnpackResult(file, time.perf_counter() - start, files)
+        except (UnpackError, PboError, OSError, subprocess.SubprocessError) as e:
+            return UnpackResult(file, time.perf_counter() - start, [], str(e))
+
+    def pbo_unpack(self, file: Path, filename: str) -> List[Path]:
+        """Unpacks into its own temporary folder and copies the result to the target, returns the copied files"""
+        if self.args.models:
+            copied = self.pbo_unpack_native(file, filename)
+            if copied is not None:
+                return copied
+
         print(f"Unpacking {filename}")
-        # subprocess.call(["extractPBO", "-S", "-P", file])
-        subprocess.call(["extractPBO", "-S", "-P", str(file)], stdout=self.FNULL, stderr=subprocess.STDOUT)
+        with tempfile.TemporaryDirectory(prefix=f"{filename}_", dir=str(self.source)) as temp:
+            returncode = subprocess.call(
+                [*self.EXTRACTPBO, "-S", "-P", str(file), temp], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT
+            )
 
-        # When extractPBO it should move unpacked folder to P drive
-        unpacked: Path = self.source / filename
-        include = (".p3d", ".cpp") if self.args.models else ()
-        if unpacked.is_dir():
-            for f in unpacked.iterdir():
-                if not f.is_dir():
-                    continue
+            # When extractPBO it should move unpacked folder to P drive
+            unpacked: Path = Path(temp) / filename
+            if not unpacked.is_dir():
+                unpacked = Path(temp)
 
+            include = (".p3d", ".cpp") if self.args.models else ()
+            folders = [f for f in unpacked.iterdir() if f.is_dir()]
+            copied = []
+            for f in folders:
                 target: Path = self.target / f.stem
-                print(f"Copying {f} to {target}")
-                copytree(f, target, include=include)
+                print(f"Copying {f.name} to {target}")
+                copied.extend(copytree(f, target, include=include))
 
-            shutil.rmtree(unpacked)
-        else:
-            return 1
+        if returncode:
+            raise UnpackError(f"extractPBO exited with code {returncode}")
+        if not folders:
+            raise UnpackError("Nothing was unpacked")
+        return copied
+
+    def pbo_unpack_native(self, file: Path, filename: str) -> Optional[List[Path]]:
+        """
+            Reads the PBO directly and writes only the models and configs to the target, without extractPBO.
+            Returns None for PBOs with a binarized config.bin, those are left to extractPBO to turn it into config.cpp
+        """
+        include = (".p3d", ".cpp")
+        with PboReader(file) as pbo:
+            if any(PureWindowsPath(entry.name).name.lower() == "config.bin" for entry in pbo):
+                return None
+            print(f"Reading {filename}")
+            return pbo.extract(self.target, include=lambda entry: entry.suffix in include)
 
     def final(self):
-        pass
+        """Reports timing and failures of all unpacked PBOs"""
+        if self.skipped:
+            print(f"Skipped {self.skipped} unchanged PBOs")
+        if not self.results:
+            print("No PBOs unpacked")
+            return
+
+        failed = [f for f in self.results if f.error]
+        total = sum(f.seconds for f in self.results)
+        print("### SUMMARY ###")
+        for result in sorted(self.results, key=lambda f: f.seconds, reverse=True)[:5]:
+            print(f"{result.name}: {result.seconds:.1f}s")
+        print(f"Unpacked {len(self.results) - len(failed)} of {len(self.results)} PBOs ({total:.1f}s of work)")
+        for result in failed:
+            print(f"Failed {result.name}: {result.error}")
 
 
 if __name__ == "__main__":
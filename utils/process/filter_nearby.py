@@ -4,11 +4,12 @@
 
 """
 
+import os
 import sys
 from pathlib import Path
-from typing import Tuple
+from typing import List, Tuple
 
-from pandas import DataFrame
+import numpy as np
 from scipy import spatial
 from gooey import Gooey, GooeyParser
 
@@ -16,7 +17,8 @@ FOLDER = Path(__file__).parents[2]
 if str(FOLDER) not in sys.path:
     sys.path.insert(0, str(FOLDER))
 
-from utils.tb import load_tb, write_tb, TbRow  # noqa: E402
+from utils.tb import load_tb_parallel, write_tb_parallel, TbFrame  # noqa: E402
+from utils.spatial import SpatialIndex  # noqa: E402
 
 
 FOLDER = Path(__file__).parent
@@ -25,15 +27,43 @@ FOLDER = Path(__file__).parent
 class NearbyFiltering:
     RADIUS = 4
     DESCRIPTION = (
-        "Allows you to automatically delete objects in a file, when they are closer than X distance to another file"
+        "Allows you to automatically delete objects in a file, when they are closer than X distance to another file.\n"
+        + "Several files can be given, each with its own distance"
     )
     NAME = "Filter nearby"
 
-    def __init__(self, radius: float, source: DataFrame, target: DataFrame):
+    def __init__(
+        self, radius: float, source: TbFrame, target: TbFrame, workers: int = -1, index: SpatialIndex = None
+    ):
         self.r = radius
         self.source = source
         self.target = target
-        self.tree = self.create_tree(self.source)
+        self.workers = workers
+        self.index = index  # Queried instead of a tree of `source`, which isn't needed then
+        self.tree = self.create_tree(self.source) if index is None else None
+        self.radii: List[float] = [radius]  # Radius of each source, see `from_sources`
+        self.source_id = np.zeros(len(index), dtype=np.int64) if index is not None else None
+        self.removed_by = np.empty(0, dtype=np.int64)  # First source near each target object, -1 if none
+        self.near = np.zeros(1, dtype=np.int64)  # Target objects near each source
+
+    @classmethod
+    def from_sources(
+        cls, sources: List[SpatialIndex], radii: List[float], target: TbFrame, workers: int = -1
+    ) -> "NearbyFiltering":
+        """
+            Filters against several sources at once, each with its own radius. The sources are merged into
+            one index that knows the radius of every point, so the target is checked in a single pass
+        """
+        if len(sources) == 1:
+            return cls(radii[0], source=None, target=target, workers=workers, index=sources[0])
+
+        sizes = [len(source) for source in sources]
+        xy = np.concatenate([source.points() for source in sources])
+        index = SpatialIndex.build(xy, radii=np.repeat(np.asarray(radii, dtype=np.float64), sizes))
+        obj = cls(max(radii), source=None, target=target, workers=workers, index=index)
+        obj.radii = list(radii)
+        obj.source_id = np.repeat(np.arange(len(sources)), sizes)
+        return obj
 
     @classmethod
     def parser(cls, parent=None):
@@ -44,10 +74,34 @@ class NearbyFiltering:
             parser = sub.add_argument_group(cls.NAME, description=cls.DESCRIPTION, gooey_options={"show_border": True})
 
         parser.add_argument(
-            "source", help="The TB file you want to compare distances to", type=Path, widget="FileChooser"
+            "source",
+            help="The TB file(s) you want to compare distances to",
+            type=Path,
+            widget="MultiFileChooser",
+            nargs="+",
         )
         parser.add_argument("target", help="The file you want to filter", type=Path, widget="FileChooser")
-        parser.add_argument("-r", "--radius", help="Radius", type=float, default=4)
+        parser.add_argument(
+            "-r",
+            "--radius",
+            help="Radius, either one for all source files or one for each",
+            type=float,
+            nargs="+",
+            default=[cls.RADIUS],
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help="Processes/threads used to read, filter and write",
+            type=int,
+            default=os.cpu_count() or 1,
+        )
+        parser.add_argument(
+            "--no-index",
+            help="Don't use or create the spatial index (.spx) next to the source file",
+            action="store_true",
+            dest="no_index",
+        )
         return parser
 
     @classmethod
@@ -55,34 +109,91 @@ class NearbyFiltering:
         if hasattr(args, "command") and args.command != cls.__name__:
             return
 
-        source = load_tb(args.source)
-        target = load_tb(args.target)
+        paths = args.source if isinstance(args.source, list) else [args.source]
+        radii = args.radius if isinstance(args.radius, list) else [args.radius]
+        if len(radii) == 1:
+            radii = radii * len(paths)
+        if len(radii) != len(paths):
+            print(f"Got {len(radii)} radii for {len(paths)} source files, give one radius or one for each file")
+            return
 
-        obj = cls(args.radius, source=source, target=args.target)
+        target = load_tb_parallel(args.target, workers=args.jobs)
+        no_index = getattr(args, "no_index", False)
+        if no_index and len(paths) == 1:
+            source = load_tb_parallel(paths[0], workers=args.jobs)
+            obj = cls(radii[0], source=source, target=target, workers=args.jobs)
+        elif no_index:
+            frames = [load_tb_parallel(path, workers=args.jobs) for path in paths]
+            sources = [SpatialIndex.build(frame[["x", "y"]]) for frame in frames]
+            obj = cls.from_sources(sources, radii, target, workers=args.jobs)
+        else:
+            sources = [SpatialIndex.for_file(path, workers=args.jobs) for path in paths]
+            obj = cls.from_sources(sources, radii, target, workers=args.jobs)
         out = obj.filter_new()
 
+        if len(paths) > 1:
+            removed = obj.removed_counts()
+            for path, radius, count, near in zip(paths, radii, removed, obj.near):
+                print(f"{path.name} (radius {radius}): removed {count}, {near} objects within radius")
+        print(f"Removed {len(target) - len(out)} of {len(target)} objects")
+
         outpath = args.target.with_name(args.target.stem + "_OUT.txt")
-        write_tb(outpath, out)
+        write_tb_parallel(outpath, out, workers=args.jobs)
 
-    def create_tree(self, df: DataFrame):
-        tree = spatial.cKDTree(df[["x", "y"]].values)
+    def create_tree(self, df: TbFrame):
+        tree = spatial.cKDTree(df[["x", "y"]])
         return tree
 
-    def filter_new(self):
+    def filter_new(self) -> TbFrame:
         df = self.target
-        remove_idx = []
-        row: TbRow
-        for idx, row in df.iterrows():
-            nearby = self.filter_nearby_points([row.x, row.y], self.RADIUS)
-            if nearby:
-                remove_idx.append(idx)
-
-        out = df.drop(remove_idx)
+        if self.index is None:
+            keep = self.keep_mask(df[["x", "y"]], self.r)
+            self.removed_by = np.where(keep, -1, 0)
+            self.near = np.array([np.count_nonzero(~keep)])
+        else:
+            self.removed_by = self.nearest_source(df[["x", "y"]])
+            keep = self.removed_by < 0
+        out = df[keep]
         return out
 
+    def nearest_source(self, points: np.ndarray) -> np.ndarray:
+        """
+            First source (In given order) with an object within its radius of each point, -1 if there is none.
+            Also counts the points near each source in `near`, a point can be near more than one
+        """
+        radius = self.r if self.index.radii is None else None
+        query, rows = self.index.pairs_within(points, radius)
+        source = self.source_id[rows]
+
+        first = np.full(len(points), len(self.radii), dtype=np.int64)
+        np.minimum.at(first, query, source)
+        first[first == len(self.radii)] = -1
+
+        unique = np.unique(query * len(self.radii) + source)
+        self.near = np.bincount(unique % len(self.radii), minlength=len(self.radii))
+        return first
+
+    def removed_counts(self) -> np.ndarray:
+        """Target objects removed by each source, by the first source they are near"""
+        return np.bincount(self.removed_by[self.removed_by >= 0], minlength=len(self.radii))
+
+    def keep_mask(self, points: np.ndarray, radius: float) -> np.ndarray:
+        """
+            Single batched nearest neighbour query for all `points`, True for every point without a source object
+            within `radius`. The bound is nudged up so objects at exactly `radius` count, like `query_ball_point`
+        """
+        if self.index is not None:
+            return ~self.index.any_within(points, radius)
+        distance, _ = self.tree.query(
+            points, k=1, distance_upper_bound=np.nextafter(radius, np.inf), workers=self.workers
+        )
+        return np.isinf(distance)
+
     def filter_nearby_points(self, point: Tuple[float], radius: float):
         """Cleans up all the points within X radius of current point"""
 
+        if self.index is not None:
+            return self.index.query_radius(point, radius).tolist()
         nearby = self.tree.query_ball_point(point, radius)
         return nearby
 
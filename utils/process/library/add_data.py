@@ -1,5 +1,9 @@
+import os
 import sys
 from pathlib import Path
+from typing import Dict, List, Tuple
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 from gooey import Gooey, GooeyParser
 
@@ -7,10 +11,30 @@ FOLDER = Path(__file__).parents[3]
 if str(FOLDER) not in sys.path:
     sys.path.insert(0, str(FOLDER))
 
-from utils.tb import TbRow  # noqa: E402
+from utils import print  # noqa: E402
 from utils.library import TbLibraryCollection, TbLibrary, ModelEntry  # noqa: E402
 
 
+def copy_hashes(library: TbLibrary, hashes: Dict[str, int]) -> int:
+    """Sets the hashes (by lower case template name) in `library`, returns how many templates changed"""
+    changed = 0
+    for model in library:
+        tb_hash = hashes.get(model.name.lower())
+        if tb_hash is not None and model.hash != tb_hash:
+            library[model.name]["Hash"] = str(tb_hash)
+            changed += 1
+    return changed
+
+
+def sync_file(path: Path, hashes: Dict[str, int]) -> int:
+    """`copy_hashes` for a library file, only saved when something changed"""
+    library = TbLibrary.from_file(path)
+    changed = copy_hashes(library, hashes)
+    if library.dirty:
+        library.save()
+    return changed
+
+
 class AddData:
     DESCRIPTION = (
         "Copies over some data from one library file containing all entries, to split library\n"
@@ -19,8 +43,10 @@ class AddData:
 
     def __init__(self, args):
         self.args = args
-        self.missing = 0
-        self.libaries = TbLibraryCollection(Path(args.library))
+        self.jobs = getattr(args, "jobs", 1)
+        self.missing: Dict[str, List[str]] = defaultdict(list)  # Template names per library
+        self.saved: Dict[str, int] = {}  # Changed templates per library
+        self.libaries = TbLibraryCollection(Path(args.library), jobs=self.jobs)
         self.source = self.load_source(args)
 
     @classmethod
@@ -33,6 +59,9 @@ class AddData:
 
         parser.add_argument("library", help="Path to walk through", widget="DirChooser")
         parser.add_argument("source", help="Source library file", widget="FileChooser")
+        parser.add_argument(
+            "-j", "--jobs", help="Processes used to read and write libraries", type=int, default=os.cpu_count() or 1
+        )
         return parser
 
     @classmethod
@@ -48,23 +77,48 @@ class AddData:
         return TbLibrary.from_file(Path(args.source))
 
     def action(self):
+        """Copies the hashes from the source, only libraries with different hashes are written"""
+        hashes = {entry.name.lower(): entry.hash for entry in self.source if entry.hash is not None}
+
+        changes: List[Tuple[TbLibrary, Dict[str, int]]] = []
         library: TbLibrary
         model: ModelEntry
         for library in self.libaries:
-            print(library.name)
+            updates = {}
             for model in library:
-                try:
-                    _hash = self.source[model.name]["Hash"]
-                    library[model.name]["Hash"] = _hash
-                except KeyError:
-                    self.missing += 1
-                    print(f"Missing template: '{model.name}'")
+                tb_hash = hashes.get(model.name.lower())
+                if tb_hash is None:
+                    self.missing[library.name].append(model.name)
+                elif model.hash != tb_hash:
+                    updates[model.name.lower()] = tb_hash
+            if updates:
+                changes.append((library, updates))
+
+        self.sync(changes)
+
+    def sync(self, changes: List[Tuple[TbLibrary, Dict[str, int]]]):
+        if self.jobs > 1 and len(changes) > 1:
+            paths, hashes = zip(*((library.path, updates) for library, updates in changes))
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                counts = list(pool.map(sync_file, paths, hashes))
+        else:
+            counts = []
+            for library, updates in changes:
+                counts.append(copy_hashes(library, updates))
+                library.save()
 
-            library.save()
-                
+        for (library, _), count in zip(changes, counts):
+            print(f"<g>Updated {count} hashes in {library.name}</g>")
+            self.saved[library.name] = count
 
     def final(self):
-        print(f"Missing templates: {self.missing}")
+        for library, names in self.missing.items():
+            print(f"<error>{library}: {len(names)} templates missing from the source</error>")
+            for name in names:
+                print(f"    {name}")
+
+        print(f"Saved {len(self.saved)} libraries, {sum(self.saved.values())} hashes changed")
+        print(f"Missing templates: {sum(len(names) for names in self.missing.values())}")
 
 
 if __name__ == "__main__":
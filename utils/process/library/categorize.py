@@ -1,7 +1,14 @@
-from typing import List
+import os
+import re
+import json
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 from collections import namedtuple
 
+RULES_FILE = Path(__file__).parent / "data" / "categories.json"
+
+Category = namedtuple("Category", ["category", "fill", "outline"])
+
 
 def clean_name(name: str) -> str:
     """Simplifies folder names, for better more logical grouping"""
@@ -57,55 +64,95 @@ def clean_name(name: str) -> str:
     return name
 
 
-def get_category_custom(relative_path: Path) -> namedtuple:
-    """Returns named category, to autogroup objects and assign colors when creating a new library"""
-
-    model_path = str(relative_path).lower()
-
-    def func(path):
-        return model_path.find(path) >= 0
-
-    def is_category(types: List[str]):
-        return bool(list(filter(func, types)))
-
-    Category = namedtuple("Category", ["category", "fill", "outline"])
-    if is_category(["tree", "treeparts"]):
-        return Category(category="tree", fill=-16760832, outline=-1)
-
-    if is_category(["vegetation", "bush", "plant", "clutter", "misc"]):
-        return Category(category="bush", fill=-16727808, outline=-1)
-
-    if is_category(["decal"]):
-        return Category(category="roads", fill=-79905, outline=-16777216)
-
-    if is_category(["signs"]):
-        return Category(category="roads", fill=-15653149, outline=-16777216)
-
-    if is_category(["road", "bridges"]):
-        return Category(category="roads", fill=-12566464, outline=-1)
+class PathRules:
+    """
+        Blacklist and category rules compiled into a single regex, so a path is scanned only once.
+        Each rule is a list of keywords, when keywords of several rules appear in a path, the blacklist wins,
+        then the category listed first. Results for folders are cached, as all models in a folder share them
+    """
 
-    if is_category(["rock"]):
-        return Category(category="rocks", fill=-8553091, outline=-1)
-
-    if is_category(["rail"]):
-        return Category(category="rail", fill=-16711694, outline=-1)
-
-    if is_category(["castle"]):
-        return Category(category="castle", fill=-10912896, outline=-1)
-
-    if is_category(["wall", "fence"]):
-        return Category(category="walls", fill=-35827, outline=-16777216)
-
-    if is_category(["wreck"]):
-        return Category(category="wreck", fill=-8039340, outline=-1)
-
-    if is_category(["\\ind"]):
-        return Category(category="industry", fill=-8892372, outline=-1)
-
-    if is_category(["\\mil"]):
-        return Category(category="industry", fill=-7960491, outline=-1)
-
-    if is_category(["structures", "buildings"]):
-        return Category(category="structures", fill=-9673539, outline=-16777216)
-
-    return Category(category="", fill=-16777216, outline=-1)
+    def __init__(
+        self, categories: List[Tuple[Category, List[str]]], blacklist: List[str] = (), default: Category = None
+    ):
+        if default is None:
+            default = Category(category="", fill=-16777216, outline=-1)
+
+        self.categories = [category for category, _ in categories]
+        self.default = default
+
+        rules = [list(blacklist)] + [list(keywords) for _, keywords in categories]
+        groups = [f"({'|'.join(re.escape(f.lower()) for f in keywords)})" for keywords in rules if keywords]
+        self._group_rule = [i for i, keywords in enumerate(rules) if keywords]
+        self._pattern = re.compile(f"(?=(?:{'|'.join(groups)}))") if groups else None
+        self._longest = max((len(f) for keywords in rules for f in keywords), default=0)
+        self._nomatch = len(rules)
+
+        self._blacklist = re.compile("|".join(re.escape(f.lower()) for f in blacklist)) if blacklist else None
+        self._folders: Dict[str, int] = {}
+
+    @classmethod
+    def from_file(cls, path: Path = RULES_FILE, blacklist: List[str] = ()) -> "PathRules":
+        """Loads category rules from json, a `blacklist` list in the file is added to the given one"""
+        with path.open(mode="r") as fp:
+            data = json.load(fp)
+
+        categories = []
+        for rule in data["categories"]:
+            categories.append((Category(rule["category"], int(rule["fill"]), int(rule["outline"])), rule["keywords"]))
+
+        default = data.get("default")
+        if default is not None:
+            default = Category(default["category"], int(default["fill"]), int(default["outline"]))
+        return cls(categories, list(blacklist) + data.get("blacklist", []), default)
+
+    def _rule(self, path: str, start: int = 0) -> int:
+        """Index of the first rule with a keyword in `path`, only counting matches starting at `start`"""
+        best = self._nomatch
+        if self._pattern is None:
+            return best
+
+        for match in self._pattern.finditer(path, start):
+            rule = self._group_rule[match.lastindex - 1]
+            if rule < best:
+                best = rule
+                if rule == 0:
+                    break
+        return best
+
+    def _folder_rule(self, folder: str) -> int:
+        try:
+            return self._folders[folder]
+        except KeyError:
+            rule = self._folders[folder] = self._rule(folder)
+            return rule
+
+    def match(self, path: str, sep: str = os.sep) -> Optional[Category]:
+        """
+            Returns the `Category` for a relative model path, or None when it's blacklisted.
+            Keywords matching within the folder come from the cache, only the part of the path
+            where a keyword could reach into the file name is scanned again
+        """
+        path = path.lower()
+        folder = path.rpartition(sep)[0]
+        rule = min(self._folder_rule(folder), self._rule(path, max(len(folder) - self._longest + 1, 0)))
+
+        if rule == 0:
+            return None
+        if rule == self._nomatch:
+            return self.default
+        return self.categories[rule - 1]
+
+    def blacklisted(self, path: str) -> bool:
+        """True if any blacklist entry appears in `path`"""
+        return self._blacklist is not None and self._blacklist.search(path.lower()) is not None
+
+
+_default_rules: Optional[PathRules] = None
+
+
+def get_category_custom(relative_path: Path) -> Category:
+    """Returns named category, to autogroup objects and assign colors when creating a new library"""
+    global _default_rules
+    if _default_rules is None:
+        _default_rules = PathRules.from_file()
+    return _default_rules.match(str(relative_path))
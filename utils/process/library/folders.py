@@ -1,10 +1,12 @@
+import os
 from pathlib import Path
-from typing import List, Generator, Tuple
+from typing import Dict, List, Generator, Optional, Tuple
 from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from utils import print
 from utils.library import ModelEntry
-from utils.process.library.categorize import clean_name, get_category_custom
+from utils.process.library.categorize import clean_name, PathRules, RULES_FILE
 
 BLACKLIST = [
     "air",
@@ -42,21 +44,53 @@ class keydefaultdict(defaultdict):
             return ret
 
 
+class Listings(dict):
+    """Folder listings by path, with the amount of folders that had to be listed again"""
+
+    rescanned = 0
+
+    def merge(self, other: "Listings"):
+        self.update(other)
+        self.rescanned += other.rescanned
+
+
 class folderWalk:
-    def __init__(self, target: Path, blacklist: List[str] = None, root: Path = None):
+    def __init__(
+        self,
+        target: Path,
+        blacklist: List[str] = None,
+        root: Path = None,
+        threads: int = 1,
+        rules: Path = RULES_FILE,
+        cache: Dict[str, dict] = None,
+    ):
         """
             Used to walk through P drive (default) or other given item
+            With `threads` above 1, the top level folders are walked in parallel
+            `rules` is the json file with category rules, the blacklist is added to the rules in it
+            `cache` holds the `listings` of a previous walk, folders with the same mtime aren't listed again
         """
         if root is None:
             root = Path("P:/")
 
         if blacklist is None:
             blacklist = BLACKLIST
+        elif isinstance(blacklist, str):
+            blacklist = blacklist.split()  # Default value from the parser
 
         self.root = root
         self.target = target
         self.clean_names = keydefaultdict(clean_name)
         self.blacklist = blacklist
+        self.threads = threads
+        self.rules = PathRules.from_file(rules, blacklist=blacklist)
+
+        self.cache: Dict[str, dict] = cache if cache is not None else {}
+        self.listings = Listings()  # Every folder visited during this walk
+
+    @property
+    def rescanned(self) -> int:
+        return self.listings.rescanned
 
     def walk_folders(self) -> Generator[Tuple[str, ModelEntry], None, None]:
         """Walks the folders below start path, checking for p3d"""
@@ -70,7 +104,7 @@ class folderWalk:
             return
 
         print(f"<g>Starting p3d search within path {self.target}</g>")
-        for model in self.target.glob("**/*.p3d"):
+        for model in self.find_models():
             folder: Path = model.parent
 
             relative_path: Path = model.relative_to(self.root)
@@ -80,7 +114,9 @@ class folderWalk:
             parentsnew = list(OrderedDict.fromkeys(parents))  # Get unique (Prevent roads_roads prefix)
             prefix = "_".join(parentsnew)
 
-            if not self.check_folder(relative_path, parents, prefix):
+            # Blacklist and category come from the same pass over the path
+            details = self.rules.match(str(relative_path))
+            if details is None or not self.check_underscore(parents):
                 continue
 
             name: str = model.stem
@@ -88,18 +124,104 @@ class folderWalk:
                 continue
 
             category = self.clean_names[prefix]
-            details = get_category_custom(relative_path)
             yield category, ModelEntry(name, str(relative_path), details.fill, details.outline)
 
+    def find_models(self) -> Generator[Path, None, None]:
+        """
+            Yields every .p3d below target in the same order as `target.glob("**/*.p3d")` would,
+            but never descends into folders where `check_folder` would reject every model
+        """
+        parts = self.target.relative_to(self.root).parts
+        if self.threads <= 1:
+            yield from self._scan(str(self.target), parts, self.listings)
+            return
+
+        models, folders = self._scan_folder(str(self.target), parts, self.listings)
+        yield from models
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for models, listings in pool.map(lambda folder: self._scan_thread(*folder), folders):
+                self.listings.merge(listings)  # Only merged here, so no thread touches the shared listings
+                yield from models
+
+    def _scan_thread(self, path: str, parts: Tuple[str, ...]) -> Tuple[List[Path], Listings]:
+        """Walks a folder within a worker thread, with its own listings"""
+        listings = Listings()
+        return list(self._scan(path, parts, listings)), listings
+
+    def _scan(self, path: str, parts: Tuple[str, ...], listings: Listings) -> Generator[Path, None, None]:
+        models, folders = self._scan_folder(path, parts, listings)
+        yield from models
+        for folder in folders:
+            yield from self._scan(*folder, listings)
+
+    def _scan_folder(
+        self, path: str, parts: Tuple[str, ...], listings: Listings
+    ) -> Tuple[List[Path], List[Tuple[str, tuple]]]:
+        """Models directly in this folder, and the subfolders worth descending into"""
+        listing = self._list_folder(path, listings)
+        models = [Path(path, name) for name in listing["models"]]
+        folders = []
+        for name in listing["folders"]:
+            subparts = parts + (name,)
+            if not self.prune_folder(subparts):
+                folders.append((os.path.join(path, name), subparts))
+        return models, folders
+
+    def _list_folder(self, path: str, listings: Listings) -> dict:
+        """
+            Model files (with their mtime) and subfolders in `path`, recorded in `listings`. Adding, removing or
+            renaming anything changes the mtime of the folder itself, so the cached listing is used as long as that
+            is the same
+        """
+        listing = {"mtime": None, "models": {}, "folders": []}
+        try:
+            listing["mtime"] = os.stat(path).st_mtime_ns  # Before listing, so changes made during it are caught later
+            cached = self.cache.get(path)
+            if cached is not None and cached["mtime"] == listing["mtime"]:
+                listings[path] = cached
+                return cached
+            entries = list(os.scandir(path))
+        except OSError:
+            return listing
+
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        listing["folders"].append(entry.name)
+                elif os.path.normcase(entry.name).endswith(".p3d"):
+                    listing["models"][entry.name] = entry.stat().st_mtime_ns
+            except OSError:
+                continue
+
+        listings[path] = listing
+        listings.rescanned += 1
+        return listing
+
+    def mtime(self, model: Path) -> Optional[int]:
+        """Modification time of a model found during the walk"""
+        listing = self.listings.get(str(model.parent))
+        return listing["models"].get(model.name) if listing else None
+
+    def prune_folder(self, parts: Tuple[str, ...]) -> bool:
+        """True when `check_folder` would reject every model in this folder (relative to root) and below"""
+        if self.rules.blacklisted(os.sep.join(parts)):
+            return True
+
+        # Same underscore rule as `check_folder`, which looks at the first 3 folders only
+        return len(parts) <= 3 and parts[-1].lower().replace("_f", "").startswith("_")
+
     def check_folder(self, folder: Path, parents: list, prefix: str) -> bool:
         """Checks if this folder should be added as template"""
         # Ignore anything given in blacklist (Weapons, air, etc)
+        if self.rules.blacklisted(str(folder)):
+            return False
 
-        for check in self.blacklist:
-            if str(folder).lower().find(check) >= 0:
-                return False
+        return self.check_underscore(parents)
 
-        # Skip any folder starting with underscore
+    @staticmethod
+    def check_underscore(parents: list) -> bool:
+        """Skip any folder starting with underscore"""
         if list(filter(lambda x: x.startswith("_"), parents)):
             # print(f"<grey>found underscore in {parents}</grey>")
             return False
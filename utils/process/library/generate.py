@@ -5,11 +5,15 @@ py -m utils.library.generate "P:\a3" "P:\\ca" "P:\\CUP\\Terrains" "P:\\ibr" "P:\
 py -m utils.library.generate "Q:\\dz" --workdrive "Q:\"
 """
 
+import os
 import sys
+import json
+import hashlib
 from typing import Dict, List
 from datetime import datetime
 from collections import defaultdict
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 import xmltodict
 from gooey import Gooey, GooeyParser
@@ -19,8 +23,39 @@ if str(FOLDER) not in sys.path:
     sys.path.insert(0, str(FOLDER))
 
 from utils import print  # noqa: E402
-from utils.library import ModelEntry, get_v4_hash  # noqa: E402
+from utils.funcs import load_json, save_json  # noqa: E402
+from utils.library import ModelEntry  # noqa: E402
 from utils.process.library.folders import folderWalk, BLACKLIST  # noqa: E402
+from utils.process.library.categorize import RULES_FILE  # noqa: E402
+from utils.process.library.tml import TmlWriter  # noqa: E402
+
+
+class LibraryIndex:
+    """
+        Everything a previous run found, stored as json next to the libraries:
+            `folders`: the folder listings of the walk, so unchanged folders aren't listed again
+            `models`: the mtime, category and template name of each model file
+            `categories`: a digest of the templates written to each library
+    """
+
+    FILENAME = ".library_index.json"
+    VERSION = 1
+
+    def __init__(self, folder: Path, data: dict = None):
+        self.folder = folder
+        data = data or {}
+        self.folders: Dict[str, dict] = data.get("folders", {})
+        self.models: Dict[str, list] = data.get("models", {})
+        self.categories: Dict[str, str] = data.get("categories", {})
+
+    @classmethod
+    def load(cls, folder: Path) -> "LibraryIndex":
+        """Loads the index in `folder`, starts a new one if it's missing or unreadable"""
+        return cls(folder, load_json(folder / cls.FILENAME, cls.VERSION))
+
+    def save(self):
+        data = {"folders": self.folders, "models": self.models, "categories": self.categories}
+        save_json(self.folder / self.FILENAME, self.VERSION, data, indent=1)
 
 
 class folderToLibrary:
@@ -28,10 +63,12 @@ class folderToLibrary:
         Processes libraries. Call order is:
             `walk_folder`
             `folderWalk.walk_folders`
+            `assign_names`
+            `handle_uniqueness`
             `create_libraries`
-            `create_category_library`
-            `set_template_data`
+            `TmlWriter.write`
 
+        Libraries of which the templates didn't change since the last run are left alone
     """
 
     tml_file: dict
@@ -43,62 +80,126 @@ class folderToLibrary:
         self.template_all = defaultdict(lambda: 0)
         self.categories = defaultdict(list)
         self.duplicates = []
+        self.unchanged = []
 
         self.output = args.output
         self.output.mkdir(mode=0o775, parents=True, exist_ok=True)
+        self.index = LibraryIndex(self.output)
+        if not getattr(args, "rebuild", False):
+            self.index = LibraryIndex.load(self.output)
 
         self.walk_folder()
+        self.assign_names()
         self.create_libraries(self.categories)
+        self.index.save()
 
     def load_template_library(self):
         """Load in the default library format"""
         default_template = Path(__file__).parent / "data" / "empty_template.tml"
         with default_template.open(mode="r") as library_file:
-            self.tml_file = xmltodict.parse(library_file.read())
+            content = library_file.read()
+            self.tml_file = xmltodict.parse(content)
+            self.template_digest = hashlib.sha1(content.encode()).hexdigest()
             self.tml_entry = self.tml_file["Library"]["Template"][0]
             self.tml_entry["Date"] = str(datetime.now())
+        self.writer = TmlWriter(self.tml_file)
 
     def walk_folder(self):
-        walk = folderWalk(self.args.path, self.args.blacklist, root=self.args.root)
+        walk = folderWalk(
+            self.args.path,
+            self.args.blacklist,
+            root=self.args.root,
+            threads=getattr(self.args, "jobs", 1),
+            rules=getattr(self.args, "rules", RULES_FILE),
+            cache=self.index.folders,
+        )
+        models = {}
         for category, entry in walk.walk_folders():
             self.categories[category].append(entry)
+            models[entry.file] = [walk.mtime(self.args.root / entry.file), category]
+
+        print(f"Listed {walk.rescanned} changed folders, {len(walk.listings) - walk.rescanned} were unchanged")
+        # Listings of other paths generated into the same output stay for their next run
+        folders = {path: listing for path, listing in self.index.folders.items() if not self.in_path(Path(path))}
+        folders.update(walk.listings)
+        self.index.folders = folders
+        self.rescanned = walk.rescanned
+        self.walked = models
+
+    def in_path(self, path: Path) -> bool:
+        """True if `path` (absolute, or relative to the root) is within the walked `--path`"""
+        parts = [os.path.normcase(part) for part in self.args.path.parts]
+        path = self.args.root / path
+        return [os.path.normcase(part) for part in path.parts[: len(parts)]] == parts
+
+    def assign_names(self):
+        """
+            Gives every model its unique template name. Models that were there last run keep their name,
+            so new duplicates never shift the names (and hashes) of templates already placed in TB.
+            Models of other paths generated into the same output are kept, and their names stay taken
+        """
+        previous = self.index.models
+        others = {file: model for file, model in previous.items() if not self.in_path(Path(file))}
+        for file in list(self.walked) + list(others):
+            if file in previous:
+                self.template_all[previous[file][2].lower()] = 1
+
+        for entries in self.categories.values():
+            for i, entry in enumerate(entries):
+                if entry.file in previous:
+                    name = previous[entry.file][2]
+                    if name != entry.name:
+                        self.duplicates.append(name)
+                else:
+                    name = self.handle_uniqueness(entry.name)
+                entries[i] = entry.replace(name=name)
+                self.walked[entry.file].append(name)
+
+        self.index.models = {**others, **self.walked}
 
     def create_libraries(self, categories: Dict[str, List[ModelEntry]]):
-        """Creates the library files for each category"""
-
-        for category, entries in self.categories.items():
-            print(f"<g>Creating new library {category}")
-
-            output = self.output / f"{category}.tml"
-            parsed = self.create_category_library(category, entries)
-            with output.open(mode="w") as fp:
-                fp.write(xmltodict.unparse(parsed, pretty=True))
-
-    def create_category_library(self, category: str, entries: List[ModelEntry]) -> dict:
         """
-            Creates a new library dict for a category, and copies over all the info 
-            that matches these models fromt the source dictionary
+            Creates the library files for each category, skipping the ones that would come out the same.
+            With more than one job, the libraries are written by separate processes
         """
 
-        library = self.tml_file.copy()
-        library["Library"]["@name"] = category
-
-        entries_dict = [self.set_template_data(f) for f in entries]
-        library["Library"]["Template"] = entries_dict
-        return library
-
-    def set_template_data(self, entry: ModelEntry) -> dict:
-        """Sets the data to a template entry in the dictionary"""
-
-        tml_base = self.tml_entry.copy()
-        uniquename = self.handle_uniqueness(entry.name)
+        digests, changed = {}, []
+        for category, entries in self.categories.items():
+            output = self.output / f"{category}.tml"
+            digests[category] = self.digest(category, entries)
+            if self.index.categories.get(category) == digests[category] and output.exists():
+                self.unchanged.append(category)
+            else:
+                changed.append((output, category, entries))
+
+        jobs = getattr(self.args, "jobs", 1)
+        if jobs > 1 and len(changed) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = [pool.submit(self.writer.write, *library) for library in changed]
+                for (_, category, _), future in zip(changed, futures):
+                    future.result()
+                    print(f"<g>Created new library {category}")
+        else:
+            for output, category, entries in changed:
+                print(f"<g>Creating new library {category}")
+                self.writer.write(output, category, entries)
+
+        # Libraries of other paths generated into the same output are left alone
+        remaining = {category for _, category, _ in self.index.models.values()}
+        for category in self.index.categories.keys() - digests.keys():
+            if category in remaining:
+                digests[category] = self.index.categories[category]
+                continue
+            print(f"<g>Removing library {category}, it has no models left")
+            output = self.output / f"{category}.tml"
+            if output.exists():
+                output.unlink()
+        self.index.categories = digests
 
-        tml_base["Name"] = uniquename
-        tml_base["File"] = entry.file
-        tml_base["Fill"] = entry.fill
-        tml_base["Outline"] = entry.outline
-        tml_base["Hash"] = get_v4_hash(uniquename)
-        return tml_base
+    def digest(self, category: str, entries: List[ModelEntry]) -> str:
+        """Fingerprint of everything written to a library, except for the date"""
+        content = [category, self.template_digest] + [[e.name, e.file, e.fill, e.outline] for e in entries]
+        return hashlib.sha1(json.dumps(content).encode()).hexdigest()
 
     def handle_uniqueness(self, name: str) -> str:
         """Prevents duplicate templates appearing"""
@@ -121,7 +222,9 @@ class folderToLibrary:
         if self.duplicates:
             self._write_duplicates()
 
-        print(f"<e>Completed the script with {len(self.template_all)} models processed</e>")
+        if self.unchanged:
+            print(f"Left {len(self.unchanged)} unchanged libraries alone")
+        print(f"<e>Completed the script with {len(self.walked)} models processed</e>")
 
     def _write_duplicates(self):
         print(f"<error>Found {len(self.duplicates)} duplicate model names, they are autorenamed</error>")
@@ -185,6 +288,25 @@ class Generate:
             type=Path,
             widget="DirChooser",
         )
+        parser.add_argument(
+            "--rules",
+            help="Json file with the keywords used to pick colors\nCopy the default one to add your own categories",
+            default=str(RULES_FILE),
+            type=Path,
+            widget="FileChooser",
+        )
+        parser.add_argument(
+            "--rebuild",
+            help="Walk all folders again and rewrite every library\nTemplate names of duplicates can change",
+            action="store_true",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help="Threads used to walk through folders, and processes writing libraries",
+            type=int,
+            default=os.cpu_count() or 1,
+        )
 
         return parser
 
@@ -0,0 +1,131 @@
+"""
+    Checks the template hashes of a library folder. Templates with the same hash get swapped around by TB,
+    and a stored hash that isn't the hash of the name points to another template
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+from collections import defaultdict
+
+import numpy as np
+from gooey import Gooey, GooeyParser
+
+FOLDER = Path(__file__).parents[3]
+if str(FOLDER) not in sys.path:
+    sys.path.insert(0, str(FOLDER))
+
+from utils import print  # noqa: E402
+from utils.library import TbLibraryCollection, ModelEntry, get_v4_hashes  # noqa: E402
+
+
+class HashAudit:
+    DESCRIPTION = (
+        "Checks all templates in a library folder for names with the same hash (TB swaps those models)\n"
+        + "and for Hash fields that don't match the template name"
+    )
+    NAME = "Audit library hashes"
+
+    def __init__(self, args):
+        self.args = args
+        self.libraries = TbLibraryCollection(Path(args.library), jobs=getattr(args, "jobs", 1))
+        self.templates: List[Tuple[str, ModelEntry]] = [(lib.name, entry) for lib in self.libraries for entry in lib]
+        self.collisions: Dict[int, List[Tuple[str, str]]] = {}  # Hash to (library, name) of every template with it
+        self.mismatches: List[Tuple[str, ModelEntry, int]] = []  # Library, template and the hash of its name
+        self.missing: List[Tuple[str, ModelEntry]] = []  # Templates without a Hash field
+
+    @classmethod
+    def parser(cls, parent=None):
+        if parent is None:
+            parser = GooeyParser(description=cls.DESCRIPTION)
+        else:
+            sub = parent.add_parser(cls.__name__)
+            parser = sub.add_argument_group(cls.NAME, description=cls.DESCRIPTION, gooey_options={"show_border": True})
+
+        parser.add_argument("library", help="Folder with the library files", widget="DirChooser", type=Path)
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="Text file to write every problem to (Optional)",
+            widget="FileSaver",
+            type=Path,
+            required=False,
+        )
+        parser.add_argument(
+            "-j", "--jobs", help="Processes used to read the libraries", type=int, default=os.cpu_count() or 1
+        )
+        return parser
+
+    @classmethod
+    def run(cls, args):
+        if hasattr(args, "command") and args.command != cls.__name__:
+            return
+
+        obj = cls(args)
+        obj.audit()
+        obj.final()
+
+    def audit(self):
+        names = [entry.name for _, entry in self.templates]
+        hashes = get_v4_hashes(names)
+        self.find_collisions(hashes, names)
+
+        stored = np.array([-1 if entry.hash is None else entry.hash for _, entry in self.templates], dtype=np.int64)
+        has_hash = np.array([entry.hash is not None for _, entry in self.templates], dtype=bool)
+        for i in np.flatnonzero(has_hash & (stored != hashes)):
+            self.mismatches.append((*self.templates[i], int(hashes[i])))
+        for i in np.flatnonzero(~has_hash):
+            self.missing.append(self.templates[i])
+
+    def find_collisions(self, hashes: np.ndarray, names: List[str]):
+        """Groups the templates sharing a hash, the same name in more than one library is no collision"""
+        order = np.argsort(hashes, kind="stable")
+        ordered = hashes[order]
+        shared = np.flatnonzero(ordered[1:] == ordered[:-1])
+        groups = defaultdict(set)
+        for i in shared:
+            groups[int(ordered[i])].update((order[i], order[i + 1]))
+
+        for tb_hash, indices in groups.items():
+            if len({names[i] for i in indices}) > 1:
+                self.collisions[tb_hash] = [(self.templates[i][0], names[i]) for i in sorted(indices)]
+
+    def report(self) -> List[str]:
+        lines = []
+        for tb_hash, templates in self.collisions.items():
+            lines.append(f"Collision {tb_hash}: " + ", ".join(f"{name} ({lib})" for lib, name in templates))
+        for lib, entry, tb_hash in self.mismatches:
+            lines.append(f"Mismatch {lib}: {entry.name} has Hash {entry.hash}, expected {tb_hash}")
+        for lib, entry in self.missing:
+            lines.append(f"Missing {lib}: {entry.name} has no Hash")
+        return lines
+
+    def final(self):
+        print(f"Checked {len(self.templates)} templates in {len(self.libraries.libraries)} libraries")
+        for tb_hash, templates in self.collisions.items():
+            names = ", ".join(f"{name} ({lib})" for lib, name in templates)
+            print(f"<error>Hash {tb_hash} is shared by {names}</error>")
+
+        per_library = defaultdict(int)
+        for lib, _, _ in self.mismatches:
+            per_library[lib] += 1
+        for lib, count in per_library.items():
+            print(f"<error>{lib}: {count} templates with a Hash that doesn't match their name</error>")
+
+        print(f"Collisions: {len(self.collisions)}, mismatches: {len(self.mismatches)}, no hash: {len(self.missing)}")
+        output = getattr(self.args, "output", None)
+        if output is not None:
+            with output.open(mode="w") as fp:
+                fp.writelines(line + "\n" for line in self.report())
+            print(f"Wrote all problems to {output}")
+
+
+if __name__ == "__main__":
+
+    @Gooey
+    def cli():
+        parser = HashAudit.parser()
+        HashAudit.run(parser.parse_args())
+
+    cli()
@@ -1,41 +1,199 @@
 """
     Gets various info from a .p3d file, like slopeLandContact or bounding boxes
+
+    Models are read by `P3dReader`, or by Mikero's dep3d when its command is passed.
+    `read_models` reads many models at once, and can skip models that were read before using a `P3dCache`
 """
 
+import os
+import re
+import hashlib
 import subprocess
 from pathlib import Path
+from dataclasses import dataclass
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from utils.funcs import load_json, save_json
+from utils.process.library.p3d_reader import P3dReader, P3dError
+
+DEP3D = ["dep3d"]  # Command to read a single p3d with, pass as `command` to use it instead of `P3dReader`
+
+_FLOAT = r"(-?\d+(?:\.\d*)?(?:e[-+]?\d+)?)"
+_BOX = re.compile(r"(min|max)\w*[^\w\-]*" + r"[\s,;]+".join([_FLOAT] * 3), re.IGNORECASE)
+
+Vector = Tuple[float, float, float]
+
+
+@dataclass
+class P3dInfo:
+    landslope: bool
+    bbox_min: Vector
+    bbox_max: Vector
+
+    @property
+    def size(self) -> Vector:
+        """Same layout as `ModelEntry.size`"""
+        return tuple(high - low for low, high in zip(self.bbox_min, self.bbox_max))
+
+
+def dep3d(path: Path, flags: List[str], command: List[str] = DEP3D) -> str:
+    output = subprocess.check_output([*command, *flags, str(path)], stderr=subprocess.STDOUT)
+    return output.decode("utf-8", "replace")
+
 
+def parse_slopelandcontact(output: str) -> bool:
+    """True if the named properties printed by `dep3d -LPP` contain placement=slopelandcontact"""
+    return "placement=slopelandcontact" in re.sub(r"[\s\"']", "", output.lower())
 
-def slopelandcontact(path: Path) -> bool:
+
+def parse_boundingbox(output: str) -> Tuple[Vector, Vector]:
+    """The min and max corner printed by `dep3d -LB`, raises ValueError if either is missing"""
+    corners = {}
+    for line in output.splitlines():
+        if "box" not in line.lower():
+            continue
+        match = _BOX.search(line)
+        if match:
+            corners.setdefault(match.group(1).lower(), tuple(float(f) for f in match.groups()[1:]))
+
+    if len(corners) != 2:
+        raise ValueError(f"No bounding box in dep3d output: {output!r}")
+    return corners["min"], corners["max"]
+
+
+def slopelandcontact(path: Path, command: List[str] = None) -> bool:
     """
         Checks if given p3d has slopeLandContact property, objects with this property should never
         have their pitch/bank adjusted when exporting for TB
-    
+
     Args:
-        path (Path): path to p3d 
-    
+        path (Path): path to p3d
+        command (List[str]): dep3d command to use, instead of reading the p3d directly
+
     Returns:
-        bool: True if slopeLandContact property is fo und
+        bool: True if slopeLandContact property is found
     """
+    if command is None:
+        with P3dReader(path) as model:
+            return model.landslope
+    return parse_slopelandcontact(dep3d(path, ["-LPP"], command))
 
-    result = subprocess.check_output(["dep3d", "-LPP", str(path)])
-    if result.lower().find("placement=slopelandcontact") != -1:
-        return True
-    return False
 
-
-def boundingbox(path: Path) -> bool:
+def boundingbox(path: Path, command: List[str] = None) -> Tuple[Vector, Vector]:
     """
-        Checks if given p3d has slopeLandContact property, objects with this property should never
-        have their pitch/bank adjusted when exporting for TB
-    
+        Gets the bounding box of the given p3d
+
     Args:
-        path (Path): path to p3d 
-    
+        path (Path): path to p3d
+        command (List[str]): dep3d command to use, instead of reading the p3d directly
+
     Returns:
-        bool: True if slopeLandContact property is fo und
+        Tuple[Vector, Vector]: min and max corner of the bounding box
     """
+    if command is None:
+        with P3dReader(path) as model:
+            return model.bbox_min, model.bbox_max
+    return parse_boundingbox(dep3d(path, ["-LB"], command))
+
+
+def read_model(path: Path, command: List[str] = None) -> P3dInfo:
+    if command is None:
+        with P3dReader(path) as model:
+            return P3dInfo(model.landslope, model.bbox_min, model.bbox_max)
+    return P3dInfo(slopelandcontact(path, command), *boundingbox(path, command))
+
+
+def try_read_model(path: Path, command: List[str] = None) -> Optional[P3dInfo]:
+    """`read_model`, but None for models that can't be read"""
+    try:
+        return read_model(path, command)
+    except (OSError, ValueError, P3dError, subprocess.SubprocessError):
+        return None
+
+
+class P3dCache:
+    """
+        Results of earlier reads, stored as json. Models are stored by the sha1 of their content,
+        so copies of a model share an entry. The sha1 of each path is kept with its size and mtime,
+        so unchanged files don't have to be hashed again
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path, files: Dict[str, list] = None, models: Dict[str, dict] = None):
+        self.path = path
+        self.files: Dict[str, list] = files if files is not None else {}  # Path to [size, mtime, sha1]
+        self.models: Dict[str, dict] = models if models is not None else {}  # sha1 to P3dInfo values
+
+    @classmethod
+    def load(cls, path: Path) -> "P3dCache":
+        """Loads the cache at `path`, starts a new one if it's missing or unreadable"""
+        data = load_json(path, cls.VERSION)
+        if data is None or not isinstance(data.get("files"), dict) or not isinstance(data.get("models"), dict):
+            return cls(path)
+        return cls(path, data["files"], data["models"])
+
+    def save(self):
+        save_json(self.path, self.VERSION, {"files": self.files, "models": self.models})
+
+    @staticmethod
+    def sha1(path: Path) -> str:
+        digest = hashlib.sha1()
+        with path.open(mode="rb") as fp:
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def key(self, path: Path, stat: os.stat_result) -> str:
+        """The sha1 of `path`, only hashed when it's new or changed (`stat` is taken before)"""
+        known = self.files.get(str(path))
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        return self.sha1(path)
+
+    def get(self, key: str) -> Optional[P3dInfo]:
+        values = self.models.get(key)
+        if values is None:
+            return None
+        return P3dInfo(values["landslope"], tuple(values["min"]), tuple(values["max"]))
+
+    def record(self, path: Path, stat: os.stat_result, key: str, info: P3dInfo):
+        self.files[str(path)] = [stat.st_size, stat.st_mtime_ns, key]
+        self.models[key] = {"landslope": info.landslope, "min": list(info.bbox_min), "max": list(info.bbox_max)}
+
+
+def read_models(
+    paths: List[Path], jobs: int = os.cpu_count() or 1, cache: P3dCache = None, command: List[str] = None
+) -> Dict[Path, Optional[P3dInfo]]:
+    """
+        Reads placement and bounding box of every model. Models are read by a pool of `jobs` processes,
+        or with `command` by running that many dep3d processes at once.
+        Models found in `cache` are skipped, new results are added to it (Call `cache.save` afterwards).
+        Models that can't be read are None
+    """
+    results: Dict[Path, Optional[P3dInfo]] = {}
+    keys: Dict[Path, Tuple[os.stat_result, str]] = {}
+    if cache is not None:
+        for path in paths:
+            try:
+                stat = path.stat()
+                keys[path] = (stat, cache.key(path, stat))
+            except OSError:
+                continue
+            results[path] = cache.get(keys[path][1])
+
+    todo = [path for path in paths if results.get(path) is None]
+    if command is None and jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            infos = pool.map(try_read_model, todo, chunksize=max(1, len(todo) // (jobs * 8)))
+            results.update(zip(todo, infos))
+    else:
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+            results.update(zip(todo, pool.map(partial(try_read_model, command=command), todo)))
 
-    result = subprocess.check_output(["dep3d", "-LB", str(path)])
-    bb_min = result.lower().find("box min")
-    bb_max = result.lower().find("box max")
+    for path, (stat, key) in keys.items():
+        if results[path] is not None:
+            cache.record(path, stat, key, results[path])
+    return {path: results[path] for path in paths}
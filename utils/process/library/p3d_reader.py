@@ -0,0 +1,150 @@
+"""
+    Reads the bounding box and named properties of a .p3d directly, without dep3d.
+    Supports unbinarized (MLOD) models, and binarized (ODOL) models from Arma 2 onwards
+"""
+
+import re
+import mmap
+import struct
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+GEOMETRY = 1e13  # Resolution of the geometry LOD, which holds the named properties
+MIN_ODOL_VERSION = 54  # Older ODOL models (OFP/Arma 1) use a different model info layout
+
+_UINT = struct.Struct("<I")
+_LOD = struct.Struct("<4s6I")  # Signature, version (2x), points, normals, faces, flags
+_FACE = 4 + 4 * 16 + 4  # Vertex count, 4 vertices (point, normal, u, v), flags. Followed by 2 strings
+_VECTOR = struct.Struct("<3f")
+_ODOL_BBOX = 48  # Offset of the bounding box within the model info
+_SLOPELANDCONTACT = re.compile(rb"placement\x00slopelandcontact\x00", re.IGNORECASE)
+
+Vector = Tuple[float, float, float]
+
+
+class P3dError(Exception):
+    pass
+
+
+class P3dReader:
+    """
+        Reads a p3d from a memory mapped file. Use as context manager, or call `close` when done
+
+        with P3dReader(path) as model:
+            model.landslope, model.bbox_min, model.bbox_max
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.properties: Dict[str, str] = {}  # Lower case names, only placement for ODOL
+        self.bbox_min: Vector = (0.0, 0.0, 0.0)
+        self.bbox_max: Vector = (0.0, 0.0, 0.0)
+
+        self._fp = path.open(mode="rb")
+        try:
+            self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fp.close()
+            raise P3dError(f"{path} is empty")
+
+        try:
+            self.signature = self._mm[:4]
+            self.version = _UINT.unpack_from(self._mm, 4)[0]
+            if self.signature == b"MLOD":
+                self._read_mlod()
+            elif self.signature == b"ODOL":
+                self._read_odol()
+            else:
+                raise ValueError(f"unknown signature {self.signature!r}")
+        except (struct.error, ValueError, IndexError) as e:
+            self.close()
+            raise P3dError(f"{path} is not a valid p3d: {e}")
+
+    @property
+    def landslope(self) -> bool:
+        return self.properties.get("placement", "").lower() == "slopelandcontact"
+
+    def _read_string(self, position: int) -> Tuple[str, int]:
+        end = self._mm.find(b"\0", position)
+        if end == -1:
+            raise ValueError(f"unterminated string at {position}")
+        return self._mm[position:end].decode("utf-8", "surrogateescape"), end + 1
+
+    def _read_mlod(self):
+        """Walks all LODs for named properties, the box is taken from the geometry LOD (Or the first)"""
+        lods = _UINT.unpack_from(self._mm, 8)[0]
+        position = 12
+        boxes = []
+        for _ in range(lods):
+            signature, _, _, points, normals, faces, _ = _LOD.unpack_from(self._mm, position)
+            if signature != b"P3DM":
+                raise ValueError(f"unknown LOD signature {signature!r}")
+            position += _LOD.size
+
+            data = self._mm[position : position + points * 16]  # Copied, a view would keep the map open
+            xyz = np.frombuffer(data, dtype="<f4", count=points * 4).reshape(-1, 4)[:, :3]
+            position += points * 16 + normals * 12
+            for _ in range(faces):
+                position += _FACE
+                for _ in range(2):  # Texture and material
+                    position = self._mm.find(b"\0", position) + 1
+                    if position == 0:
+                        raise ValueError("face data is truncated")
+
+            position = self._read_taggs(position)
+            resolution = struct.unpack_from("<f", self._mm, position)[0]
+            position += 4
+            if len(xyz):
+                boxes.append((resolution, xyz.min(axis=0), xyz.max(axis=0)))
+
+        if not boxes:
+            raise ValueError("no LOD with points")
+        geometry = [box for box in boxes if np.isclose(box[0], GEOMETRY, rtol=1e-3)]
+        _, low, high = (geometry or boxes)[0]
+        self.bbox_min, self.bbox_max = tuple(low.tolist()), tuple(high.tolist())
+
+    def _read_taggs(self, position: int) -> int:
+        """Reads the named properties in the tags of a LOD, returns the position after them"""
+        if self._mm[position : position + 4] != b"TAGG":
+            raise ValueError(f"missing TAGG at {position}")
+        position += 4
+        while True:
+            name, position = self._read_string(position + 1)  # Skip the active flag
+            length = _UINT.unpack_from(self._mm, position)[0]
+            position += 4
+            if name == "#Property#":
+                key, value = (self._mm[i : i + 64].split(b"\0")[0].decode() for i in (position, position + 64))
+                self.properties[key.lower()] = value
+            position += length
+            if name == "#EndOfFile#":
+                return position
+
+    def _read_odol(self):
+        """The box is in the model info after the LOD resolutions, properties are searched for by name"""
+        if self.version < MIN_ODOL_VERSION:
+            raise ValueError(f"ODOL version {self.version} is not supported")
+
+        position = 8
+        if self.version >= 59:
+            position += 4  # Application id
+        if self.version >= 58:
+            _, position = self._read_string(position)  # Prefix
+        lods = _UINT.unpack_from(self._mm, position)[0]
+        position += 4 + lods * 4 + _ODOL_BBOX
+        self.bbox_min = _VECTOR.unpack_from(self._mm, position)
+        self.bbox_max = _VECTOR.unpack_from(self._mm, position + _VECTOR.size)
+
+        if _SLOPELANDCONTACT.search(self._mm):
+            self.properties["placement"] = "slopelandcontact"
+
+    def close(self):
+        self._mm.close()
+        self._fp.close()
+
+    def __enter__(self) -> "P3dReader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,74 @@
+"""
+    Writes Terrain Builder libraries (.tml) one template at a time, without building the whole document first.
+    The layout comes from rendering a template library once with xmltodict, so the output is exactly what
+    `xmltodict.unparse(library, pretty=True)` gives for the same library
+"""
+
+import copy
+from pathlib import Path
+from typing import List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+import xmltodict
+
+from utils.library import ModelEntry, get_v4_hash, get_v4_hashes
+
+FIELDS = ("Name", "File", "Fill", "Outline", "Hash")  # Filled in per template, the rest comes from the template
+
+
+def _sentinel(field: str) -> str:
+    return f"TMLWRITER{field.upper()}SENTINEL"
+
+
+class TmlWriter:
+    """
+        Precompiled library skeleton. Create once from a parsed library, then `write` any number of categories
+
+        writer = TmlWriter(xmltodict.parse(template))
+        writer.write(Path("a3_plants.tml"), "a3_plants", entries)
+    """
+
+    def __init__(self, library: dict):
+        """`library` is a parsed .tml, its first template provides every value not in `FIELDS`"""
+        skeleton = copy.deepcopy(library)
+        templates = skeleton["Library"]["Template"]
+        template = dict(templates[0] if isinstance(templates, list) else templates)
+        for field in FIELDS:
+            template[field] = _sentinel(field)
+        skeleton["Library"]["@name"] = _sentinel("category")
+        skeleton["Library"]["Template"] = [template]
+        document = xmltodict.unparse(skeleton, pretty=True)
+
+        start = document.rindex("\n", 0, document.index("<Template>")) + 1
+        end = document.index("\n", document.index("</Template>")) + 1
+        self.header = document[:start].replace("%", "%%").replace(quoteattr(_sentinel("category")), "%s")
+        self.footer = document[end:]
+        self.template, self.fields = self._compile(document[start:end])
+
+    @staticmethod
+    def _compile(template: str) -> Tuple[str, Tuple[str, ...]]:
+        """Turns the rendered template into a format string, with the fields in the order they appear in"""
+        fields = tuple(sorted(FIELDS, key=lambda field: template.index(_sentinel(field))))
+        template = template.replace("%", "%%")
+        for field in fields:
+            template = template.replace(_sentinel(field), "%s")
+        return template, fields
+
+    def render(self, entry: ModelEntry, tb_hash: Optional[int] = None) -> str:
+        """Single <Template> element, `entry.name` should already be unique. Pass `tb_hash` if it's known"""
+        values = {
+            "Name": entry.name,
+            "File": entry.file,
+            "Fill": entry.fill,
+            "Outline": entry.outline,
+            "Hash": get_v4_hash(entry.name) if tb_hash is None else tb_hash,
+        }
+        return self.template % tuple(escape(str(values[field])) for field in self.fields)
+
+    def write(self, path: Path, category: str, entries: List[ModelEntry]):
+        """Streams a library with a template for each entry to `path`. There should be at least one entry"""
+        hashes = get_v4_hashes([entry.name for entry in entries]).tolist()
+        with path.open(mode="w") as fp:
+            fp.write(self.header % quoteattr(category))
+            fp.writelines(map(self.render, entries, hashes))
+            fp.write(self.footer)
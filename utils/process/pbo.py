@@ -0,0 +1,213 @@
+"""
+    Reads PBO files directly, without Mikero's tools.
+    Only the header is parsed up front, file data is streamed from the memory mapped PBO when it's extracted
+"""
+
+import mmap
+import struct
+from pathlib import Path, PureWindowsPath
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+VERSION = 0x56657273  # "Vers", first entry holding the header extension (prefix etc)
+COMPRESSED = 0x43707273  # "Cprs", LZSS compressed entry
+BLOCK_SIZE = 1 << 20  # Bytes written at once when streaming an entry to disk
+
+_ENTRY = struct.Struct("<5I")
+
+
+class PboError(Exception):
+    pass
+
+
+@dataclass
+class PboEntry:
+    """Single file within a PBO"""
+
+    name: str  # Path within the PBO, using backslashes
+    method: int
+    original_size: int
+    timestamp: int
+    data_size: int
+    offset: int = 0  # Position of the data within the PBO
+
+    @property
+    def compressed(self) -> bool:
+        return self.method == COMPRESSED and self.original_size != self.data_size
+
+    @property
+    def suffix(self) -> str:
+        return PureWindowsPath(self.name).suffix.lower()
+
+
+class PboReader:
+    """
+        Reads a PBO from a memory mapped file. Use as context manager, or call `close` when done
+
+        with PboReader(path) as pbo:
+            pbo.extract(target, include=lambda entry: entry.suffix == ".p3d")
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fp = path.open(mode="rb")
+        try:
+            self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fp.close()
+            raise PboError(f"{path} is empty")
+
+        self.properties: Dict[str, str] = {}
+        self.entries: List[PboEntry] = []
+        try:
+            self._read_header()
+        except (struct.error, UnicodeDecodeError, ValueError) as e:
+            self.close()
+            raise PboError(f"{path} is not a valid PBO: {e}")
+
+    @property
+    def prefix(self) -> str:
+        """The path this PBO is mounted at, falls back to the file name like the game does"""
+        return self.properties.get("prefix", "").strip("\\") or self.path.stem
+
+    def _read_string(self, position: int) -> Tuple[str, int]:
+        end = self._mm.find(b"\0", position)
+        if end == -1:
+            raise ValueError(f"unterminated string at {position}")
+        return self._mm[position:end].decode("utf-8", "surrogateescape"), end + 1
+
+    def _read_header(self):
+        position = 0
+        while True:
+            name, position = self._read_string(position)
+            method, original_size, _, timestamp, data_size = _ENTRY.unpack_from(self._mm, position)
+            position += _ENTRY.size
+
+            if not name and method == VERSION:
+                while True:
+                    key, position = self._read_string(position)
+                    if not key:
+                        break
+                    self.properties[key.lower()], position = self._read_string(position)
+                continue
+
+            if not name:
+                break
+            self.entries.append(PboEntry(name, method, original_size, timestamp, data_size))
+
+        for entry in self.entries:
+            entry.offset = position
+            position += entry.data_size
+        if position > len(self._mm):
+            raise ValueError("data is shorter than the header describes")
+
+    def read(self, entry: PboEntry) -> bytes:
+        """Returns the (uncompressed) content of an entry"""
+        data = self._mm[entry.offset : entry.offset + entry.data_size]
+        if entry.compressed:
+            return lzss_decompress(data, entry.original_size)
+        return data
+
+    def target_path(self, entry: PboEntry, target: Path) -> Optional[Path]:
+        """
+            Where `entry` ends up when extracting to `target`, None for paths pointing outside of it.
+            Both the prefix and the name come from the PBO, so neither may be absolute, and the resolved path
+            has to end up within `target` (Also catches links within the target pointing elsewhere)
+        """
+        prefix, name = PureWindowsPath(self.prefix), PureWindowsPath(entry.name)
+        parts = PureWindowsPath(prefix, name).parts
+        if prefix.anchor or name.anchor or any(part in ("..", "") for part in parts):
+            return None
+
+        path = target.joinpath(*parts)
+        try:
+            path.resolve().relative_to(target.resolve())
+        except ValueError:
+            return None
+        return path
+
+    def extract(self, target: Path, include: Callable[[PboEntry], bool] = None) -> List[Path]:
+        """
+            Writes every entry for which `include` returns True to `target / prefix / name`.
+            Data is streamed from the PBO in blocks, nothing else is written to disk. Returns the written paths
+        """
+        written = []
+        for entry in self.entries:
+            if include is not None and not include(entry):
+                continue
+
+            path = self.target_path(entry, target)
+            if path is None:
+                continue
+
+            path.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+            with path.open(mode="wb") as fp:
+                if entry.compressed:
+                    fp.write(self.read(entry))
+                else:
+                    end = entry.offset + entry.data_size
+                    for start in range(entry.offset, end, BLOCK_SIZE):
+                        fp.write(self._mm[start : min(start + BLOCK_SIZE, end)])
+            written.append(path)
+        return written
+
+    def close(self):
+        self._mm.close()
+        self._fp.close()
+
+    def __enter__(self) -> "PboReader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def lzss_decompress(data: bytes, size: int) -> bytes:
+    """
+        Decompresses the LZSS variant used in PBOs. Each flag byte describes the next 8 blocks, a set bit
+        is a literal byte, a cleared bit a 2 byte back reference. The trailing 4 byte checksum is verified
+    """
+    try:
+        return _lzss_decompress(data, size)
+    except IndexError:
+        raise PboError("Compressed entry is truncated")
+
+
+def _lzss_decompress(data: bytes, size: int) -> bytes:
+    out = bytearray()
+    position = 0
+    while len(out) < size:
+        flags = data[position]
+        position += 1
+        for bit in range(8):
+            if len(out) >= size:
+                break
+            if flags & (1 << bit):
+                out.append(data[position])
+                position += 1
+                continue
+
+            low, high = data[position], data[position + 1]
+            position += 2
+            distance = low + ((high & 0xF0) << 4)
+            length = (high & 0x0F) + 3
+            start = len(out) - distance
+            if start < 0:
+                # Reference before the start of the data means spaces
+                spaces = min(-start, length)
+                out.extend(b" " * spaces)
+                start, length = 0, length - spaces
+            for i in range(length):
+                out.append(out[start + i])
+
+    del out[size:]
+    checksum = struct.unpack_from("<I", data, position)[0] if len(data) >= position + 4 else None
+    if checksum is not None and checksum != sum(out) & 0xFFFFFFFF:
+        raise PboError("Checksum mismatch in compressed entry")
+    return bytes(out)
@@ -2,12 +2,11 @@
     Uses a random offset on each item, not filtered!
 """
 
+import os
 import sys
 from pathlib import Path
-from random import uniform
-from functools import partial
 
-from pandas import DataFrame
+import numpy as np
 from gooey import Gooey, GooeyParser
 
 
@@ -15,17 +14,28 @@ FOLDER = Path(__file__).parents[2]
 if str(FOLDER) not in sys.path:
     sys.path.insert(0, str(FOLDER))
 
-from utils.tb import load_tb, write_tb, TbRow  # noqa: E402
+from utils.tb import load_tb_parallel, write_tb_parallel, TbFrame, TB_COLUMNS  # noqa: E402
 
 
-def action(df: DataFrame, args) -> DataFrame:
-    def randomize(column: str, size: float, idx, row):
-        df.at[idx, column] = row[column] + uniform(-size, size)
+def column_stream(seed: int, column: str, start: int = 0) -> np.random.Generator:
+    """
+        Random stream for one column, positioned at row `start`.
+        Every column has its own stream and each row consumes exactly one draw of it, so a row always
+        gets the same value for a given seed, no matter how the file is split up
+    """
+    bit_generator = np.random.PCG64(np.random.SeedSequence([seed, TB_COLUMNS.index(column)]))
+    bit_generator.advance(start)
+    return np.random.Generator(bit_generator)
 
-    def offset(column: str, _offset: float, idx, row):
-        df.at[idx, column] = row[column] + _offset
 
-    callbacks = []
+def action(df: TbFrame, args, start: int = 0) -> TbFrame:
+    """
+        Applies randomness and offsets to entire columns at once.
+        `start` is the row number of the first row of `df`, used when processing a file in chunks
+    """
+    seed = getattr(args, "seed", None)
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
 
     # Randomness
     for column, arg in (
@@ -34,8 +44,9 @@ def action(df: DataFrame, args) -> DataFrame:
         ("scale", "scale_random"),
         ("pitch", "pitch_random"),
     ):
-        if getattr(args, arg, 0.0) != 0.0:
-            callbacks.append(partial(randomize, column, getattr(args, arg, 0.0)))
+        size = getattr(args, arg, 0.0)
+        if size != 0.0:
+            df[column] += column_stream(seed, column, start).uniform(-size, size, len(df))
 
     # Offset
     for column, arg in (
@@ -43,12 +54,9 @@ def action(df: DataFrame, args) -> DataFrame:
         ("y", "y_offset"),
         ("z", "z_offset"),
     ):
-        if getattr(args, arg, 0.0) != 0.0:
-            callbacks.append(partial(offset, column, getattr(args, arg, 0.0)))
-
-    row: TbRow
-    for idx, row in df.iterrows():
-        [cb(idx, row) for cb in callbacks]
+        _offset = getattr(args, arg, 0.0)
+        if _offset != 0.0:
+            df[column] += _offset
 
     return df
 
@@ -66,6 +74,9 @@ class RandomOffset:
             parser = sub.add_argument_group(cls.NAME, description=cls.DESCRIPTION, gooey_options={"show_border": True})
 
         parser.add_argument("source", help="Input TB file", widget="FileChooser", type=Path)
+        parser.add_argument(
+            "-j", "--jobs", help="Processes used to read and write large files", type=int, default=os.cpu_count() or 1
+        )
 
         # Randomness
         random_group = parser.add_argument_group("Random", "Modify value with random value")
@@ -73,6 +84,9 @@ class RandomOffset:
         random_group.add_argument("-p", "--pitch_random", help="Pitch, bank randomness", type=float, default=0.0)
         random_group.add_argument("-zr", "--height_random", help="Height randomness", type=float, default=0.0)
         random_group.add_argument("-s", "--scale_random", help="Scale randomness", type=float, default=0.0)
+        random_group.add_argument(
+            "--seed", help="Seed for the random values, same seed gives the same output", type=int, default=None
+        )
 
         # Offset
         offset_group = parser.add_argument_group("Offset", "Change position of object")
@@ -87,10 +101,14 @@ class RandomOffset:
         if hasattr(args, "command") and args.command != cls.__name__:
             return
 
-        df = load_tb(args.source)
+        if args.seed is None:
+            args.seed = np.random.SeedSequence().entropy
+            print(f"Using random seed {args.seed}")
+
+        df = load_tb_parallel(args.source, workers=args.jobs)
         df_out = action(df=df, args=args)
         outpath = args.source.with_name(args.source.stem + "_OUT.txt")
-        write_tb(outpath, df_out)
+        write_tb_parallel(outpath, df_out, workers=args.jobs)
 
 
 if __name__ == "__main__":
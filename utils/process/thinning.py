@@ -0,0 +1,151 @@
+"""
+    Thins out a single TB file, keeping objects at least a minimum distance apart. Objects are handled in a fixed
+    order and each is kept unless it's too close to an object that was kept before it
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from gooey import Gooey, GooeyParser
+
+FOLDER = Path(__file__).parents[2]
+if str(FOLDER) not in sys.path:
+    sys.path.insert(0, str(FOLDER))
+
+from utils import print  # noqa: E402
+from utils.library import TbLibraryCollection  # noqa: E402
+from utils.spatial import greedy_thinning  # noqa: E402
+from utils.tb import load_tb_parallel, write_tb_parallel, TbFrame  # noqa: E402
+
+ORDERS = ("file", "largest")
+
+
+def spacing_value(text: str) -> Tuple[str, float]:
+    """Argument type for `name=spacing`"""
+    name, _, value = text.rpartition("=")
+    try:
+        return name.strip().lower(), float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is not name=spacing")
+
+
+def row_spacing(
+    frame: TbFrame,
+    default: float,
+    models: Dict[str, float] = None,
+    categories: Dict[str, float] = None,
+    libraries: Optional[TbLibraryCollection] = None,
+) -> np.ndarray:
+    """
+        Spacing of every row: the value for its model, else for its library category, else `default`.
+        Model and category names are lower case
+    """
+    models, categories = models or {}, categories or {}
+    table = np.full(len(frame.models), default, dtype=np.float64)
+    for i, model in enumerate(frame.models):
+        if model.lower() in models:
+            table[i] = models[model.lower()]
+        elif categories and libraries is not None:
+            try:
+                table[i] = categories.get(libraries.get_category(model).lower(), default)
+            except KeyError:
+                pass  # Not in the library
+    return table[frame.model_id]
+
+
+def thinning_order(frame: TbFrame, spacing: np.ndarray, order: str = "file") -> np.ndarray:
+    """Rows in the order they're handled, `largest` goes from largest spacing to smallest. Ties keep file order"""
+    if order == "largest":
+        return np.lexsort((np.arange(len(frame)), -spacing))
+    return np.arange(len(frame))
+
+
+class SelfThinning:
+    DESCRIPTION = (
+        "Removes objects that are closer than a minimum spacing to another object in the same file.\n"
+        + "Spacing can be set per model or per library category, the larger spacing of two objects counts"
+    )
+    NAME = "Self thinning"
+
+    @classmethod
+    def parser(cls, parent=None):
+        if parent is None:
+            parser = GooeyParser(description=cls.DESCRIPTION)
+        else:
+            sub = parent.add_parser(cls.__name__)
+            parser = sub.add_argument_group(cls.NAME, description=cls.DESCRIPTION, gooey_options={"show_border": True})
+
+        parser.add_argument("source", help="Input TB file", widget="FileChooser", type=Path)
+        parser.add_argument(
+            "-s", "--spacing", help="Spacing for all other objects, 0 leaves them alone", type=float, default=1.0
+        )
+        parser.add_argument(
+            "--model-spacing",
+            help="Spacing per model, like t_FagusS2s_F=4",
+            type=spacing_value,
+            nargs="*",
+            default=[],
+            dest="model_spacing",
+        )
+        parser.add_argument(
+            "--category-spacing",
+            help="Spacing per library category, like a3_vegetation_tree=3 (Needs library)",
+            type=spacing_value,
+            nargs="*",
+            default=[],
+            dest="category_spacing",
+        )
+        parser.add_argument(
+            "--library", help="Folder with the library files, for category spacing", widget="DirChooser", type=Path
+        )
+        parser.add_argument(
+            "--order",
+            help="Which objects get to stay first: file order, or largest spacing first",
+            choices=ORDERS,
+            default="file",
+        )
+        parser.add_argument(
+            "-j", "--jobs", help="Processes used to read and write large files", type=int, default=os.cpu_count() or 1
+        )
+        return parser
+
+    @classmethod
+    def run(cls, args):
+        if hasattr(args, "command") and args.command != cls.__name__:
+            return
+
+        libraries = None
+        if args.category_spacing:
+            if args.library is None:
+                print("<error>Category spacing needs the library folder</error>")
+                return
+            libraries = TbLibraryCollection(Path(args.library), jobs=args.jobs)
+
+        frame = load_tb_parallel(args.source, workers=args.jobs)
+        spacing = row_spacing(
+            frame, args.spacing, dict(args.model_spacing), dict(args.category_spacing), libraries=libraries
+        )
+        keep = greedy_thinning(frame[["x", "y"]], spacing, thinning_order(frame, spacing, args.order))
+        out = frame[keep]
+
+        removed = np.bincount(frame.model_id[~keep], minlength=len(frame.models))
+        for model in np.flatnonzero(removed):
+            print(f"{frame.models[model]}: removed {removed[model]}")
+        print(f"Removed {len(frame) - len(out)} of {len(frame)} objects")
+
+        outpath = args.source.with_name(args.source.stem + "_OUT.txt")
+        write_tb_parallel(outpath, out, workers=args.jobs)
+
+
+if __name__ == "__main__":
+
+    @Gooey
+    def cli():
+        parser = SelfThinning.parser()
+        SelfThinning.run(parser.parse_args())
+
+    cli()
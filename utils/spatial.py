@@ -0,0 +1,324 @@
+"""
+    Grid index over the x/y positions of a TB file, stored as a sidecar file next to it (`<file>.spx`).
+    The sidecar is keyed on the size, mtime and sha1 of the TB file, and its arrays are memory mapped,
+    so tools can query a reference file without parsing the text again
+"""
+
+import os
+import struct
+import hashlib
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from scipy import spatial
+
+from utils.tb import load_tb_parallel, TbFrame
+
+SUFFIX = ".spx"
+POINTS_PER_CELL = 8  # Average points per cell the grid is sized for
+QUERY_CHUNK = 65536  # Query points handled at once, keeps the candidate arrays bounded
+SELECTION_CHUNK = 1 << 20  # Conflicts converted to Python objects at once in `greedy_selection`
+
+# Magic, version, size and mtime of the TB file, sha1, points, cell size, origin, columns, rows
+_HEADER = struct.Struct("<4sIQq20sQ3d2Q")
+_DATA = 128  # Arrays start here, after the padded header
+_MAGIC = b"TBSX"
+
+
+def file_sha1(path: Path) -> bytes:
+    digest = hashlib.sha1()
+    with path.open(mode="rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def sidecar(path: Path) -> Path:
+    return path.with_name(path.name + SUFFIX)
+
+
+class SpatialIndex:
+    """
+        Points bucketed in a regular grid. `xy` holds the points sorted by cell (row by row),
+        `order` the original row of each sorted point and the points of cell `i` are `cell_start[i]:cell_start[i + 1]`.
+        All queries return original row numbers. An index built with `radii` can be queried without a radius,
+        each indexed point then only reaches as far as its own radius (These aren't saved in the sidecar)
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        xy: np.ndarray,
+        order: np.ndarray,
+        cell_start: np.ndarray,
+        origin: Tuple[float, float],
+        cell: float,
+        shape: Tuple[int, int],
+    ):
+        self.xy = xy
+        self.order = order
+        self.cell_start = cell_start
+        self.origin = np.array(origin, dtype=np.float64)
+        self.cell = float(cell)
+        self.shape = shape  # Columns, rows
+        self.radii: Optional[np.ndarray] = None  # Radius of each point, sorted like `xy`
+
+    @classmethod
+    def build(cls, xy: np.ndarray, cell: float = None, radii: np.ndarray = None) -> "SpatialIndex":
+        """
+            Index of the (n, 2) `xy` points, without `cell` size it's picked for ~`POINTS_PER_CELL` points per cell.
+            `radii` optionally gives each point its own query radius
+        """
+        xy = np.ascontiguousarray(xy, dtype=np.float64).reshape(-1, 2)
+        if not len(xy):
+            index = cls(xy, np.empty(0, dtype=np.int64), np.zeros(2, dtype=np.int64), (0.0, 0.0), 1.0, (1, 1))
+            index.radii = None if radii is None else np.empty(0)
+            return index
+
+        origin = xy.min(axis=0)
+        extent = xy.max(axis=0) - origin
+        if cell is None:
+            area = max(float(extent[0]) * float(extent[1]), float(extent.max()) ** 2 / len(xy), 1.0)
+            cell = np.sqrt(area * POINTS_PER_CELL / len(xy))
+        columns, rows = (np.floor(extent / cell).astype(np.int64) + 1).tolist()
+
+        ids = cls._cell_ids(xy, origin, cell, columns, rows)
+        order = np.argsort(ids, kind="stable")
+        cell_start = np.zeros(columns * rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ids, minlength=columns * rows), out=cell_start[1:])
+        index = cls(xy[order], order.astype(np.int64), cell_start, tuple(origin.tolist()), cell, (columns, rows))
+        if radii is not None:
+            index.radii = np.broadcast_to(np.asarray(radii, dtype=np.float64), (len(xy),))[order]
+        return index
+
+    @staticmethod
+    def _cell_ids(xy: np.ndarray, origin: np.ndarray, cell: float, columns: int, rows: int) -> np.ndarray:
+        cells = np.floor((xy - origin) / cell).astype(np.int64)
+        np.clip(cells, 0, [columns - 1, rows - 1], out=cells)
+        return cells[:, 1] * columns + cells[:, 0]
+
+    @classmethod
+    def for_file(cls, path: Path, workers: int = None, save: bool = True, frame: TbFrame = None) -> "SpatialIndex":
+        """
+            The index of a TB file, from its sidecar if that is still valid, otherwise built and saved (`save`).
+            Pass the already loaded `frame` of the file to build from that instead of reading it again
+        """
+        stat = path.stat()
+        index = cls.load(path, stat)
+        if index is not None:
+            return index
+
+        if frame is None:
+            frame = load_tb_parallel(path, workers=workers)
+        index = cls.build(frame[["x", "y"]])
+        if save:
+            try:
+                index.save(path, stat)
+            except OSError:
+                pass  # Read only folder, the index is just rebuilt next time
+        return index
+
+    @classmethod
+    def load(cls, path: Path, stat: os.stat_result = None) -> Optional["SpatialIndex"]:
+        """Loads the sidecar of TB file `path`, None if it's missing, unreadable or for other content"""
+        if stat is None:
+            stat = path.stat()
+        try:
+            with sidecar(path).open(mode="rb") as fp:
+                header = _HEADER.unpack(fp.read(_HEADER.size))
+        except (OSError, struct.error):
+            return None
+
+        magic, version, size, mtime, digest, count, cell, x, y, columns, rows = header
+        if magic != _MAGIC or version != cls.VERSION:
+            return None
+        if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+            # Touched or copied, only a changed content invalidates the index
+            if size != stat.st_size or file_sha1(path) != digest:
+                return None
+            try:
+                with sidecar(path).open(mode="r+b") as fp:
+                    fp.write(_HEADER.pack(magic, version, size, stat.st_mtime_ns, digest, *header[5:]))
+            except OSError:
+                pass
+
+        try:
+            offset = _DATA
+            xy = np.memmap(sidecar(path), dtype="<f8", mode="r", offset=offset, shape=(count, 2)) if count else None
+            offset += count * 16
+            order = np.memmap(sidecar(path), dtype="<i8", mode="r", offset=offset, shape=(count,)) if count else None
+            offset += count * 8
+            cell_start = np.memmap(sidecar(path), dtype="<i8", mode="r", offset=offset, shape=(columns * rows + 1,))
+        except (OSError, ValueError):
+            return None
+
+        if not count:
+            xy, order = np.empty((0, 2)), np.empty(0, dtype=np.int64)
+        return cls(xy, order, cell_start, (x, y), cell, (columns, rows))
+
+    def save(self, path: Path, stat: os.stat_result = None):
+        """Writes the sidecar for TB file `path`, `stat` should be taken before the file was read"""
+        if stat is None:
+            stat = path.stat()
+        header = _HEADER.pack(
+            _MAGIC,
+            self.VERSION,
+            stat.st_size,
+            stat.st_mtime_ns,
+            file_sha1(path),
+            len(self.xy),
+            self.cell,
+            *self.origin.tolist(),
+            *self.shape,
+        )
+        target = sidecar(path)
+        temp = target.with_name(target.name + ".tmp")
+        with temp.open(mode="wb") as fp:
+            fp.write(header.ljust(_DATA, b"\0"))
+            for array, dtype in ((self.xy, "<f8"), (self.order, "<i8"), (self.cell_start, "<i8")):
+                fp.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+        os.replace(str(temp), str(target))
+
+    def __len__(self):
+        return len(self.xy)
+
+    def points(self) -> np.ndarray:
+        """The (n, 2) indexed points in their original row order"""
+        xy = np.empty((len(self), 2), dtype=np.float64)
+        xy[self.order] = self.xy
+        return xy
+
+    def _candidates(self, low: np.ndarray, high: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Query number and sorted position of every point in the cells overlapping each (low, high) box.
+            The cells of one grid row are consecutive, so each box and row is a single range of positions
+        """
+        columns, rows = self.shape
+        cell_low = np.floor((low - self.origin) / self.cell).astype(np.int64)
+        cell_high = np.floor((high - self.origin) / self.cell).astype(np.int64)
+        np.clip(cell_low, 0, [columns, rows], out=cell_low)
+        np.clip(cell_high, -1, [columns - 1, rows - 1], out=cell_high)
+
+        spans = np.maximum(cell_high[:, 1] - cell_low[:, 1] + 1, 0)
+        spans[cell_low[:, 0] > cell_high[:, 0]] = 0
+        query = np.repeat(np.arange(len(low)), spans)
+        row = cell_low[query, 1] + np.arange(len(query)) - np.repeat(np.cumsum(spans) - spans, spans)
+        start = self.cell_start[row * columns + cell_low[query, 0]]
+        stop = self.cell_start[row * columns + cell_high[query, 0] + 1]
+
+        counts = stop - start
+        position = np.arange(counts.sum()) + np.repeat(start - (np.cumsum(counts) - counts), counts)
+        return np.repeat(query, counts), position
+
+    def pairs_within(self, points: np.ndarray, radius: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Every (row in `points`, indexed row) pair at most `radius` apart, grouped by query point.
+            Without `radius`, pairs within the radius of the indexed point (See `build`)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        queries, rows = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        if not len(self):
+            return queries[0], rows[0]
+        if radius is None and self.radii is None:
+            raise ValueError("Index has no radii, pass a radius")
+
+        search = radius if radius is not None else float(self.radii.max())
+        for start in range(0, len(points), QUERY_CHUNK):
+            chunk = points[start : start + QUERY_CHUNK]
+            query, position = self._candidates(chunk - search, chunk + search)
+            delta = self.xy[position] - chunk[query]
+            reach = search if radius is not None else self.radii[position]
+            near = np.einsum("ij,ij->i", delta, delta) <= reach * reach
+            queries.append(query[near] + start)
+            rows.append(np.asarray(self.order[position[near]]))
+        return np.concatenate(queries), np.concatenate(rows)
+
+    def any_within(self, points: np.ndarray, radius: float = None) -> np.ndarray:
+        """True for every point with an indexed point at most `radius` away (Or its own radius, see `build`)"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        found = np.zeros(len(points), dtype=bool)
+        query, _ = self.pairs_within(points, radius)
+        found[query] = True
+        return found
+
+    def query_radius(self, point: Tuple[float, float], radius: float) -> np.ndarray:
+        """Sorted rows of the indexed points at most `radius` from `point`"""
+        _, rows = self.pairs_within(np.array([point]), radius)
+        return np.sort(rows)
+
+    def query_bbox(self, low: Tuple[float, float], high: Tuple[float, float]) -> np.ndarray:
+        """Sorted rows of the indexed points inside the box from `low` to `high`, edges included"""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        low, high = np.array([low], dtype=np.float64), np.array([high], dtype=np.float64)
+        _, position = self._candidates(low, high)
+        xy = self.xy[position]
+        inside = np.all((xy >= low) & (xy <= high), axis=1)
+        return np.sort(np.asarray(self.order[position[inside]]))
+
+
+def greedy_selection(count: int, earlier: np.ndarray, later: np.ndarray) -> np.ndarray:
+    """
+        Mask of the kept items when going over `count` items in order, dropping every item that conflicts with
+        an earlier kept item. Conflicts are given as pairs with `earlier` < `later`. With the pairs sorted by their
+        earlier item, an item is decided before any of its own pairs come up, so a single pass over the pairs is
+        enough. The pairs are converted to lists a chunk at a time, which keeps the memory bounded
+    """
+    order = np.argsort(earlier, kind="stable")
+    earlier, later = earlier[order], later[order]
+    dropped = bytearray(count)
+    for start in range(0, len(earlier), SELECTION_CHUNK):
+        chunk = zip(earlier[start : start + SELECTION_CHUNK].tolist(), later[start : start + SELECTION_CHUNK].tolist())
+        for item, other in chunk:
+            if not dropped[item]:
+                dropped[other] = 1
+    return np.frombuffer(dropped, dtype=np.uint8) == 0
+
+
+def spacing_conflicts(xy: np.ndarray, spacing: Union[float, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        Pairs of points closer than the larger `spacing` of the two (a single value, or one per point), points with
+        spacing 0 are left out. Every distinct spacing is searched with its own distance, so memory stays
+        proportional to the number of conflicts instead of the pairs within the largest spacing
+    """
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    spacing = np.broadcast_to(np.asarray(spacing, dtype=np.float64), (len(xy),))
+    first, second = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+
+    for value in np.unique(spacing[spacing > 0]).tolist():
+        rows = np.flatnonzero(spacing == value)
+        tree = spatial.cKDTree(xy[rows], balanced_tree=False, compact_nodes=False)  # Faster to build, queried once
+        pairs = tree.query_pairs(value, output_type="ndarray")
+        delta = xy[rows[pairs[:, 0]]] - xy[rows[pairs[:, 1]]]
+        pairs = pairs[np.einsum("ij,ij->i", delta, delta) < value * value]
+        first.append(rows[pairs[:, 0]])
+        second.append(rows[pairs[:, 1]])
+
+        # Points with a smaller spacing, pairs with a larger one are found from the other side
+        smaller = np.flatnonzero((spacing > 0) & (spacing < value))
+        if len(smaller):
+            other = spatial.cKDTree(xy[smaller], balanced_tree=False, compact_nodes=False)
+            pairs = tree.sparse_distance_matrix(other, value, output_type="ndarray")
+            pairs = pairs[pairs["v"] < value]
+            first.append(rows[pairs["i"]])
+            second.append(smaller[pairs["j"]])
+    return np.concatenate(first), np.concatenate(second)
+
+
+def greedy_thinning(xy: np.ndarray, spacing: Union[float, np.ndarray], order: np.ndarray = None) -> np.ndarray:
+    """
+        Mask of the points kept when going over them in `order` (Row order by default) and dropping every point
+        closer than `spacing` to an earlier kept point. With a spacing per point, the larger spacing of two points
+        counts and points with spacing 0 are always kept
+    """
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    first, second = spacing_conflicts(xy, spacing)
+    rank = np.arange(len(xy))
+    if order is not None:
+        rank[order] = np.arange(len(xy))
+
+    first, second = rank[first], rank[second]
+    kept = greedy_selection(len(xy), np.minimum(first, second), np.maximum(first, second))
+    return kept[rank]
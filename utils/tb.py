@@ -1,6 +1,13 @@
+import os
+import mmap
+import locale
 from pathlib import Path
+from collections import deque
 from dataclasses import dataclass, astuple
-from typing import Generator
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Generator, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 
 @dataclass
@@ -50,27 +57,438 @@ def tb_iterator(path: Path) -> Generator[TbRow, None, None]:
 
 
 ###
-# Pandas section, don't copy this for other tools
+# Columnar section, use this for tools that process entire files
 ###
-from csv import QUOTE_NONE, QUOTE_NONNUMERIC  # noqa: F401, E402
-import pandas as pd  # noqa: E402
-from pandas import DataFrame  # noqa: E402
+TB_COLUMNS = ("x", "y", "dir", "pitch", "bank", "scale", "z")
+CHUNK_SIZE = 64 * 1024 * 1024  # Bytes parsed at once, keeps temporary arrays bounded on huge files
+PARALLEL_MIN_SIZE = 16 * 1024 * 1024  # Smallest byte range worth sending to a worker process
+WRITE_CHUNK = 100000  # Rows formatted at once when writing
+PARALLEL_MIN_ROWS = 1000000  # Fewest rows worth formatting in worker processes
+
+_NEWLINE, _SEMICOLON, _SPACE, _MINUS, _DOT = ord("\n"), ord(";"), ord(" "), ord("-"), ord(".")
+_BOM = b"\xef\xbb\xbf"
+
+# Fixed point formatting of "%.6f"
+_MILLION = 1e6
+_FIXED_LIMIT = 2.0 ** 53 / _MILLION  # Larger values don't fit in 16 digits, Python formats them
+_SPLITTER = 2.0 ** 27 + 1  # Splits a float in two halves that multiply exactly
+_TIE_MARGIN = 1e-6  # Closer than this to half a millionth, Python decides the rounding
+_POWERS = 10 ** np.arange(1, 10, dtype=np.int64)
+_DIGIT_GROUPS = np.array([list(b"%04d" % i) for i in range(10000)], dtype=np.uint8).view(np.uint32).ravel()
+
+
+class TbFrame:
+    """
+        Columnar container for the objects in a TB file.
+        Every numeric column is a float64 array, the model of each row is stored as an index (`model_id`)
+        into the interned `models` table, so each model name is only kept in memory once
+    """
+
+    def __init__(self, models: Sequence[str], model_id: np.ndarray, columns: Dict[str, np.ndarray] = None):
+        if columns is None:
+            columns = {}
+
+        self.models: List[str] = list(models)
+        self.model_id: np.ndarray = np.asarray(model_id, dtype=np.int32)
+        self.columns: Dict[str, np.ndarray] = {}
+        for name in TB_COLUMNS:
+            if name in columns:
+                self.columns[name] = np.asarray(columns[name], dtype=np.float64)
+            else:
+                self.columns[name] = np.full(len(self.model_id), getattr(TbRow, name), dtype=np.float64)
+
+    @classmethod
+    def empty(cls) -> "TbFrame":
+        return cls([], np.empty(0, dtype=np.int32))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[TbRow]) -> "TbFrame":
+        """Creates a frame out of `TbRow` objects"""
+        table: Dict[str, int] = {}
+        model_id = []
+        values = {name: [] for name in TB_COLUMNS}
+        for row in rows:
+            model_id.append(table.setdefault(row.model, len(table)))
+            for name in TB_COLUMNS:
+                values[name].append(getattr(row, name))
+        return cls(list(table), np.array(model_id, dtype=np.int32), values)
+
+    @classmethod
+    def from_dataframe(cls, df) -> "TbFrame":
+        """Creates a frame from a pandas DataFrame as returned by the old `load_tb`"""
+        names = [str(f).strip('"') for f in df["model"]]
+        table: Dict[str, int] = {}
+        model_id = np.array([table.setdefault(name, len(table)) for name in names], dtype=np.int32)
+        return cls(list(table), model_id, {name: df[name].to_numpy(dtype=np.float64) for name in TB_COLUMNS})
+
+    @classmethod
+    def concat(cls, frames: Sequence["TbFrame"]) -> "TbFrame":
+        """Joins frames in given order, merging their model tables"""
+        if not frames:
+            return cls.empty()
+
+        table: Dict[str, int] = {}
+        model_ids = []
+        for frame in frames:
+            remap = np.array([table.setdefault(name, len(table)) for name in frame.models], dtype=np.int32)
+            model_ids.append(remap[frame.model_id])
+
+        columns = {name: np.concatenate([frame.columns[name] for frame in frames]) for name in TB_COLUMNS}
+        return cls(list(table), np.concatenate(model_ids), columns)
+
+    def to_dataframe(self):
+        """Pandas DataFrame with the same columns as the old `load_tb`"""
+        import pandas as pd
+
+        data = {"model": self["model"]}
+        data.update(self.columns)
+        return pd.DataFrame(data)
+
+    def copy(self) -> "TbFrame":
+        return TbFrame(self.models, self.model_id.copy(), {k: v.copy() for k, v in self.columns.items()})
+
+    def rows(self) -> Generator[TbRow, None, None]:
+        """Yields every row as a `TbRow`"""
+        columns = [self.columns[name].tolist() for name in TB_COLUMNS]
+        for model, *values in zip(self.model_id.tolist(), *columns):
+            yield TbRow(self.models[model], *values)
+
+    def __len__(self):
+        return len(self.model_id)
+
+    def __getitem__(self, key: Union[str, List[str], np.ndarray, slice]):
+        """
+            `frame["x"]` returns a column, `frame[["x", "y"]]` a stacked (n, 2) array and
+            `frame[mask]`, `frame[indices]` or `frame[start:stop]` a new frame with the selected rows
+        """
+        if isinstance(key, str):
+            if key == "model":
+                return np.array(self.models, dtype=object)[self.model_id]
+            return self.columns[key]
+
+        if isinstance(key, (list, tuple)) and key and all(isinstance(f, str) for f in key):
+            return np.column_stack([self[f] for f in key])
+
+        columns = {name: values[key] for name, values in self.columns.items()}
+        return TbFrame(self.models, self.model_id[key], columns)
+
+    def __setitem__(self, key: str, values):
+        if key == "model":
+            names = np.broadcast_to(np.asarray(values, dtype=object), self.model_id.shape)
+            table: Dict[str, int] = {}
+            self.model_id = np.array([table.setdefault(name, len(table)) for name in names], dtype=np.int32)
+            self.models = list(table)
+        elif key in self.columns:
+            if values is self.columns[key]:
+                return  # Already updated in place, like `frame["x"] += 1`
+            self.columns[key] = np.broadcast_to(np.asarray(values, dtype=np.float64), self.model_id.shape).copy()
+        else:
+            raise KeyError(key)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self)} rows, {len(self.models)} models)"
+
+
+def _line_ranges(buffer, start: int, end: int, chunk_size: int) -> Generator[Tuple[int, int], None, None]:
+    """Splits `buffer[start:end]` into ranges of roughly `chunk_size` bytes, each ending after a newline"""
+    while start < end:
+        stop = buffer.find(b"\n", min(start + chunk_size, end) - 1, end)
+        stop = end if stop == -1 else stop + 1
+        yield start, stop
+        start = stop
+
+
+def _parse_fields(
+    buffer, start: int, line_start: np.ndarray, model_end: np.ndarray, line_end: np.ndarray
+) -> np.ndarray:
+    """
+        Slow path of `_parse_range` for lines with empty, missing or extra fields, reads the values line by line.
+        Empty and missing fields are NaN like they were with pandas, a field that isn't a number raises
+    """
+    values = np.full((len(line_start), len(TB_COLUMNS)), np.nan)
+    for row, (a, b) in enumerate(zip((start + model_end + 1).tolist(), (start + line_end).tolist())):
+        for column, field in enumerate(buffer[a:b].split(b";")):
+            field = field.strip()
+            if not field:
+                continue
+            if column < len(TB_COLUMNS):
+                try:
+                    values[row, column] = float(field)
+                    continue
+                except ValueError:
+                    pass
+            line = buffer[: start + int(line_start[row])].count(b"\n") + 1
+            raise ValueError(f"line {line} has an unreadable field {field.decode('utf-8', 'replace')!r}")
+    return values
+
+
+def _parse_range(buffer, start: int, end: int) -> TbFrame:
+    """
+        Parses the TB lines in `buffer[start:end]` without going through Python objects for the numbers.
+        The model column is blanked out, after which all remaining values are read with a single `np.fromstring`
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8, count=end - start, offset=start)
+
+    newlines = np.flatnonzero(data == _NEWLINE)
+    line_start = np.concatenate(([0], newlines + 1))
+    line_end = np.concatenate((newlines, [len(data)]))
+
+    # Model runs until the first semicolon, lines without one are blank
+    semicolons = np.flatnonzero(data == _SEMICOLON)
+    first = np.searchsorted(semicolons, line_start)
+    model_end = np.append(semicolons, len(data))[first]
+    valid = model_end < line_end
+    fields = (np.searchsorted(semicolons, line_end) - first)[valid]  # With or without the trailing semicolon
+    line_start, model_end, line_end = line_start[valid], model_end[valid], line_end[valid]
+    if not len(line_start):
+        return TbFrame.empty()
+
+    edges = np.zeros(len(data) + 1, dtype=np.int8)
+    edges[line_start] = 1
+    edges[model_end] = -1
+    numeric = data.copy()
+    numeric[np.cumsum(edges[:-1], dtype=np.int8) > 0] = _SPACE
+    numeric[numeric == _SEMICOLON] = _SPACE
+    del data, edges
+
+    try:
+        values = np.fromstring(numeric.tobytes(), dtype=np.float64, sep=" ")
+    except ValueError:
+        values = np.empty(0)
+    regular = np.all((fields == len(TB_COLUMNS)) | (fields == len(TB_COLUMNS) + 1))
+    if regular and values.size == len(line_start) * len(TB_COLUMNS):
+        values = values.reshape(-1, len(TB_COLUMNS))
+    else:
+        values = _parse_fields(buffer, start, line_start, model_end, line_end)
+
+    # Intern the raw model bytes, the quotes are only stripped once for every unique model
+    line_start += start
+    model_end += start
+    raw_names = list(map(buffer.__getitem__, map(slice, line_start.tolist(), model_end.tolist())))
+    raw = dict.fromkeys(raw_names)
+    for i, name in enumerate(raw):
+        raw[name] = i
+    raw_id = np.fromiter(map(raw.__getitem__, raw_names), dtype=np.int32, count=len(raw_names))
+    del raw_names
+
+    table: Dict[str, int] = {}
+    remap = np.array(
+        [table.setdefault(name.strip(b' \t"').decode("utf-8", "surrogateescape"), len(table)) for name in raw],
+        dtype=np.int32,
+    )
+
+    columns = {name: np.ascontiguousarray(values[:, i]) for i, name in enumerate(TB_COLUMNS)}
+    return TbFrame(list(table), remap[raw_id], columns)
+
 
+def _parse_file_range(path: Path, start: int, end: int) -> TbFrame:
+    """Parses one byte range of a file, runs inside a worker process for `load_tb_parallel`"""
+    with path.open(mode="rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        if start == 0 and buffer[: len(_BOM)] == _BOM:
+            start = len(_BOM)  # Saved as UTF-8 with BOM, that isn't part of the first model
+        try:
+            frames = [_parse_range(buffer, a, b) for a, b in _line_ranges(buffer, start, end, CHUNK_SIZE)]
+        except ValueError as e:
+            raise ValueError(f"Malformed Terrain Builder file {path}: {e}") from None
+    return frames[0] if len(frames) == 1 else TbFrame.concat(frames)
 
-def load_tb(path: Path) -> DataFrame:
-    """Makes pandas DataFrame out of Terrain builder format"""
-    names = ("model", "x", "y", "dir", "pitch", "bank", "scale", "z", "end")
 
+def load_tb(path: Path) -> TbFrame:
+    """Reads a Terrain Builder file into a `TbFrame`, parsing the memory mapped file in chunks"""
     if not path.is_file():
         raise FileNotFoundError(f"File {path} does not exist")
-    df = pd.read_csv(path, delimiter=";", header=None, names=names)  # type: DataFrame
-    return df
 
+    size = path.stat().st_size
+    if size == 0:
+        return TbFrame.empty()
+    return _parse_file_range(path, 0, size)
+
+
+def load_tb_parallel(path: Path, workers: int = None, min_size: int = PARALLEL_MIN_SIZE) -> TbFrame:
+    """
+        Same as `load_tb`, but splits the file in byte ranges on line boundaries and parses each range
+        in a separate process. The ranges are joined in file order, so the result is identical to `load_tb`
+    """
+    if not path.is_file():
+        raise FileNotFoundError(f"File {path} does not exist")
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    size = path.stat().st_size
+    parts = min(workers, size // max(min_size, 1))
+    if parts <= 1:
+        return load_tb(path)
+
+    with path.open(mode="rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        ranges = list(_line_ranges(buffer, 0, size, -(-size // parts)))
+
+    with ProcessPoolExecutor(max_workers=parts) as pool:
+        frames = list(pool.map(_parse_file_range, [path] * len(ranges), *zip(*ranges)))
+    return TbFrame.concat(frames)
+
+
+def _encode(text: str) -> bytes:
+    """Bytes of `text` the way a text mode file writes them, with the platform newline"""
+    return text.replace("\n", os.linesep).encode(locale.getpreferredencoding(False), "surrogateescape")
+
+
+def _model_table(models: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Quoted model names with their semicolon as rows of a byte matrix, and the length of each"""
+    names = [_encode('"%s";' % model) for model in models]
+    lengths = np.array([len(name) for name in names], dtype=np.int64)
+    table = np.zeros((len(names), int(lengths.max(initial=0))), dtype=np.uint8)
+    for i, name in enumerate(names):
+        table[i, : len(name)] = np.frombuffer(name, dtype=np.uint8)
+    return table, lengths
+
+
+def _millionths(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        Absolute `values` in whole millionths, rounded like "%.6f" does: half to even on the exact binary value.
+        The product with a million is kept exact as high and low part (Dekker), and the few values too close to
+        a tie to decide are rounded by Python. The mask marks values that can't be done this way (Not finite or huge)
+    """
+    with np.errstate(all="ignore"):
+        special = ~(np.abs(values) < _FIXED_LIMIT)
+        values = np.where(special, 0.0, values)
+        product = values * _MILLION
+        split = values * _SPLITTER
+        high = split - (split - values)
+        error = (high * _MILLION - product) + (values - high) * _MILLION
+
+        rounded = np.rint(product)
+        residual = (product - rounded) + error
+        step = np.rint(residual)
+        rounded += step
+    unsure = np.flatnonzero(np.abs(residual - step) > 0.5 - _TIE_MARGIN)
+    rounded[unsure] = [int(("%.6f" % value).replace(".", "")) for value in values[unsure].tolist()]
+    return np.abs(rounded).astype(np.int64), special
+
+
+def _number_fields(values: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray]:
+    """
+        "%.6f;" of every value as rows of a byte matrix, with a mask of the used bytes (None when all are used)
+        and a mask of values that have to be left to Python. The matrix only has room for a sign when there's
+        a negative value, and for as many integer digits as the largest value needs
+    """
+    number, special = _millionths(values)
+    high = number // 10 ** 8
+    low = number - high * 10 ** 8
+    groups = np.column_stack([high // 10000, high % 10000, low // 10000, low % 10000])
+    digits = _DIGIT_GROUPS[groups].view(np.uint8)  # Sixteen digits, ten before the decimal point and six after
+
+    integer = number // 10 ** 6
+    width = int(_integer_digits(integer.max(initial=0)))
+    negative = np.signbit(values)
+    sign = int(negative.any())
+
+    field = np.empty((len(values), sign + width + 8), dtype=np.uint8)
+    field[:, sign : sign + width] = digits[:, 10 - width : 10]
+    field[:, sign + width] = _DOT
+    field[:, sign + width + 1 : -1] = digits[:, 10:]
+    field[:, -1] = _SEMICOLON
+    if not sign and width == 1:
+        return field, None, special
+
+    used = np.ones(field.shape, dtype=bool)
+    if sign:
+        field[:, 0] = _MINUS
+        used[:, 0] = negative
+    if width > 1:
+        used[:, sign : sign + width] = np.arange(width - 1, -1, -1) < _integer_digits(integer)[:, None]
+    return field, used, special
+
+
+def _integer_digits(integer: np.ndarray) -> np.ndarray:
+    return np.searchsorted(_POWERS, integer, side="right") + 1
+
+
+def _format_chunk(
+    table: np.ndarray, lengths: np.ndarray, models: Sequence[str], model_id: np.ndarray, columns: Sequence[np.ndarray]
+) -> bytes:
+    """
+        TB lines for one chunk, identical to formatting every row with `'"%s";' + "%.6f;" * 7 + "\\n"`,
+        except for nan, which is an empty field like pandas writes it.
+        Every line is laid out in a byte matrix with a mask of the used bytes, so all lines are put together
+        with a single selection instead of a string per value
+    """
+    rows = len(model_id)
+    names = table[model_id]
+    name_used = None
+    if len(lengths) and lengths.min() != lengths.max():
+        name_used = np.arange(table.shape[1]) < lengths[model_id][:, None]
+    parts = [(names, name_used)]
+
+    special = np.zeros(rows, dtype=bool)
+    for values in columns:
+        field, used, invalid = _number_fields(values)
+        parts.append((field, used))
+        special |= invalid
+    newline = np.frombuffer(_encode("\n"), dtype=np.uint8)
+    parts.append((np.broadcast_to(newline, (rows, len(newline))), None))
+
+    cells = np.concatenate([part for part, _ in parts], axis=1)
+    if all(used is None for _, used in parts) and not special.any():
+        return cells.tobytes()
+
+    used = np.concatenate([np.ones(part.shape, dtype=bool) if used is None else used for part, used in parts], axis=1)
+    # Infinite, nan or huge values are rare enough to leave these lines to Python
+    used[special] = False
+    data = cells[used]
+    if not special.any():
+        return data.tobytes()
+
+    ends = np.cumsum(used.sum(axis=1)).tolist()
+    pieces, start = [], 0
+    for row in np.flatnonzero(special).tolist():
+        pieces.append(data[start : ends[row]].tobytes())
+        fields = ("" if values[row] != values[row] else "%.6f" % values[row] for values in columns)  # Empty for nan
+        pieces.append(_encode('"%s";' % models[model_id[row]] + "".join(field + ";" for field in fields) + "\n"))
+        start = ends[row]
+    pieces.append(data[start:].tobytes())
+    return b"".join(pieces)
+
+
+def _chunks(frame: TbFrame) -> Generator[Tuple[np.ndarray, List[np.ndarray]], None, None]:
+    for start in range(0, len(frame), WRITE_CHUNK):
+        stop = start + WRITE_CHUNK
+        yield frame.model_id[start:stop], [frame.columns[name][start:stop] for name in TB_COLUMNS]
+
+
+def write_tb(path: Path, frame: TbFrame):
+    """
+        Makes terrain builder file out of a `TbFrame` (or pandas DataFrame). The given frame is not modified.
+        Lines are formatted in bulk per chunk of rows and written as bytes
+    """
+    if not isinstance(frame, TbFrame):
+        frame = TbFrame.from_dataframe(frame)
+
+    table, lengths = _model_table(frame.models)
+    with path.open(mode="wb") as fp:
+        for model_id, columns in _chunks(frame):
+            fp.write(_format_chunk(table, lengths, frame.models, model_id, columns))
+
+
+def write_tb_parallel(path: Path, frame: TbFrame, workers: int = None, min_rows: int = PARALLEL_MIN_ROWS):
+    """
+        Same as `write_tb`, but chunks are formatted in separate processes. Chunks are written in order as they
+        finish, with at most two per worker waiting, so the output is identical to `write_tb`
+    """
+    if not isinstance(frame, TbFrame):
+        frame = TbFrame.from_dataframe(frame)
 
-def write_tb(path: Path, df: DataFrame):
-    """Makes terrain builder file out of DataFrame"""
-    float_format = "%.6f"
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(frame) < max(min_rows, 1):
+        return write_tb(path, frame)
 
-    # Require quotes around model. In theory quoting=QUOTE_NONNUMERIC should work, but its broken for formatted floats
-    df.update(df[["model"]].applymap('"{}"'.format))
-    df.to_csv(path, header=False, index=False, sep=";", quoting=QUOTE_NONE, float_format=float_format)
+    table, lengths = _model_table(frame.models)
+    pending = deque()
+    with path.open(mode="wb") as fp, ProcessPoolExecutor(max_workers=workers) as pool:
+        for model_id, columns in _chunks(frame):
+            if len(pending) >= 2 * workers:
+                fp.write(pending.popleft().result())
+            pending.append(pool.submit(_format_chunk, table, lengths, frame.models, model_id, columns))
+        while pending:
+            fp.write(pending.popleft().result())
@@ -15,6 +15,9 @@ from utils.process.add_objects import AddExtraObject  # noqa: E402
 from utils.process.filter_nearby import NearbyFiltering  # noqa: E402
 from utils.process.random_offset import RandomOffset  # noqa: E402
 from utils.process.extract_pbos import ExtractPBOs  # noqa: E402
+from utils.process.library.hash_audit import HashAudit  # noqa: E402
+from utils.process.clash_detection import ClashDetection  # noqa: E402
+from utils.process.thinning import SelfThinning  # noqa: E402
 
 
 @Gooey(advanced=True)
@@ -29,6 +32,9 @@ def cli():
     NearbyFiltering.parser(parent=parent)
     RandomOffset.parser(parent=parent)
     ExtractPBOs.parser(parent=parent)
+    HashAudit.parser(parent=parent)
+    ClashDetection.parser(parent=parent)
+    SelfThinning.parser(parent=parent)
 
     args = parser.parse_args()
 
@@ -39,6 +45,9 @@ def cli():
     NearbyFiltering.run(args=args)
     RandomOffset.run(args=args)
     ExtractPBOs.run(args=args)
+    HashAudit.run(args=args)
+    ClashDetection.run(args=args)
+    SelfThinning.run(args=args)
 
     return parser
 